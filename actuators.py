@@ -0,0 +1,136 @@
+import numbers
+import time
+
+# How close (as a fraction of full output) a new motor output has to be to
+# the last one written for the write to be skipped.
+MOTOR_EPSILON = 0.005
+# Unchanged motor outputs are still written at least this often (seconds),
+# so a device that missed a write, or has a safety timeout, hears from us.
+REFRESH_PERIOD = 0.1
+
+# Used to estimate CAN bus load: a CAN frame with 8 bytes of data is about
+# 128 bits on the wire once bit stuffing is counted, and the bus runs at
+# 1 Mbit/s.
+CAN_FRAME_BITS = 128
+CAN_BITRATE = 1000000
+
+
+class CachedActuator:
+    """
+    Wraps a motor controller or solenoid and skips set() calls that wouldn't
+    change its output, either because the value is the same as the last one
+    written or (for motors) within epsilon of it. Everything else is passed
+    straight through to the wrapped device, so the subsystems don't need to
+    know they are talking to a wrapper.
+
+    Counts how many writes were made and skipped, see ActuatorBank.
+    refresh_period=None means an unchanged value is never written again,
+    which is what solenoids want.
+    """
+    def __init__(self, device, epsilon=0.0, refresh_period=REFRESH_PERIOD, clock=time.monotonic):
+        self.device = device
+        self.epsilon = epsilon
+        self.refresh_period = refresh_period
+        self.clock = clock
+        self.last_args = None
+        self.last_write = 0.0
+        self.writes = 0
+        self.skipped = 0
+
+    def set(self, *args):
+        now = self.clock()
+        if self.last_args is not None and self._unchanged(args) and (
+                self.refresh_period is None or now - self.last_write < self.refresh_period):
+            self.skipped += 1
+            return
+        self.device.set(*args)
+        self.last_args = args
+        self.last_write = now
+        self.writes += 1
+
+    def _unchanged(self, args):
+        last_args = self.last_args
+        if len(args) != len(last_args):
+            return False
+        for last, value in zip(last_args, args):
+            if last == value:
+                continue
+            # Always let a stop through, even if it's within epsilon
+            if value == 0 or not isinstance(value, numbers.Real) or not isinstance(last, numbers.Real):
+                return False
+            if abs(value - last) > self.epsilon:
+                return False
+        return True
+
+    @property
+    def output(self):
+        """
+        The last value written, or 0 if nothing has been written since the
+        device was created or invalidated.
+        """
+        if self.last_args is None:
+            return 0.0
+        return float(self.last_args[-1])
+
+    def invalidate(self):
+        """
+        Forget the last value, so the next set() is always written. Called
+        whenever the output is changed without going through set().
+        """
+        self.last_args = None
+
+    def stopMotor(self):
+        self.invalidate()
+        self.device.stopMotor()
+
+    def disable(self):
+        self.invalidate()
+        self.device.disable()
+
+    def __getattr__(self, name):
+        # Only called for attributes the wrapper doesn't have itself
+        return getattr(self.device, name)
+
+
+class ActuatorBank:
+    """
+    Keeps track of a group of named CachedActuators so their write counts and
+    the CAN bus load they cause can be reported together.
+    """
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.actuators = {}
+        self.window_start = clock()
+        self.window_writes = 0
+
+    def add(self, name, actuator):
+        self.actuators[name] = actuator
+        return actuator
+
+    def total_writes(self):
+        return sum(actuator.writes for actuator in self.actuators.values())
+
+    def saved_writes(self):
+        """
+        Returns how many writes were skipped, by actuator name.
+        """
+        return {name: actuator.skipped for name, actuator in self.actuators.items()}
+
+    def can_utilization(self):
+        """
+        Returns the estimated fraction of the CAN bus used by writes to these
+        actuators since the last call, and starts a new window.
+
+        This only counts set() calls. The Talons also send their own status
+        frames, and the CTRE libraries resend control frames on a timer, so
+        the real bus load is higher than this.
+        """
+        now = self.clock()
+        writes = self.total_writes()
+        elapsed = now - self.window_start
+        new_writes = writes - self.window_writes
+        self.window_start = now
+        self.window_writes = writes
+        if elapsed <= 0:
+            return 0.0
+        return new_writes * CAN_FRAME_BITS / elapsed / CAN_BITRATE
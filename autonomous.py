@@ -1,8 +1,49 @@
+import itertools
 import math
 import time
 from enum import Enum
 
-import wpilib
+import trajectory
+from looptiming import LOOP_PERIOD
+
+
+class WallClock:
+    """
+    Reads the real time. This is the clock used on the robot.
+    """
+    def now(self):
+        return time.time()
+
+
+class SimulatedClock:
+    """
+    A clock that only moves when step() is called, advancing a fixed
+    LOOP_PERIOD each time. This lets autonomous routines run as fast as the
+    computer can go (and deterministically) in tests and simulations.
+    """
+    def __init__(self, start=0.0, period=LOOP_PERIOD):
+        self.time = start
+        self.period = period
+
+    def now(self):
+        return self.time
+
+    def step(self):
+        self.time += self.period
+
+    def run(self, routine):
+        """
+        Run a routine generator to completion, stepping the clock once per
+        tick. Returns the number of ticks it took.
+        """
+        ticks = 0
+        for _ in routine:
+            ticks += 1
+            self.step()
+        return ticks
+
+
+WALL_CLOCK = WallClock()
 
 
 # Describes the position of the scales and switches
@@ -27,56 +68,159 @@ def get_routine(robot_position, switch_position):
         return AutonomousRoutine.SIDE_TO_OPPOSITE
 
 
-'''Returns the switch and scale configurations'''
+# Every message the FMS can send. The letters are the side of our switch,
+# the scale and the opponent's switch, in that order.
+GAME_MESSAGES = tuple(''.join(sides) for sides in itertools.product('LR', repeat=3))
+SIDES = {'L': Position.LEFT, 'R': Position.RIGHT}
+SWITCH_POSITIONS = {message: SIDES[message[0]] for message in GAME_MESSAGES}
+
+'''Returns the side of our switch, or None if the message isn't valid'''
 def get_game_specific_message(game_message):
-    if game_message == "LLL":
-        return Position.LEFT
-    elif game_message == "LRL":
-        return Position.LEFT
-    elif game_message == "RLR":
-        return Position.RIGHT
-    elif game_message == "RRR":
-        return Position.RIGHT
-    else:
-        # Is this a good idea?
-        return None
+    return SWITCH_POSITIONS.get(game_message)
+
+
+# @TODO: Tune these on the practice field
+# Longest the elevator gets to reach switch height before the routine moves
+# on without it
+SWITCH_RAISE_TIMEOUT = 2.0
+# How hard and for how long to spit the cube out onto the switch
+SPIT_SPEED = 1.0
+SPIT_TIME = 0.5
 
 
+def raise_to_switch(elevator, clock):
+    return ElevatorToHeight(elevator, elevator.SWITCH, timeout=SWITCH_RAISE_TIMEOUT, clock=clock)
+
+
+def spit_cube(grabber, clock):
+    return Timed(GrabberAutonomous(grabber, SPIT_SPEED), duration=SPIT_TIME, clock=clock)
+
+
+def tuned_profile(name, distance=None):
+    """
+    Returns the named profile from trajectory, or if distance is given, a
+    new profile of the same kind for that distance. The routines take
+    distances so tuner.py can try different ones; on the robot they are
+    left as None so the precomputed profiles are used.
+    """
+    if distance is None:
+        return trajectory.get(name)
+    kind, _ = trajectory.PROFILE_SPECS[name]
+    return trajectory.GENERATORS[kind](distance)
+
+
+# The keyword arguments after clock in each routine are the numbers that
+# were tuned by hand on the practice field, see tuner.py. Each routine
+# returns its whole command tree, so every command is constructed (and every
+# profile looked up) when the routine is built, not while it runs.
+
 # Used when the robot starts in the center
-def center_to_switch(drivetrain, gyro, vision_socket, switch_position):
-    # angle = 45
+def center_to_switch(drivetrain, gyro, vision_socket, switch_position, elevator, grabber, odometry=None, clock=WALL_CLOCK,
+                     first_angle=45, second_angle=-50, turn_speed=0.6,
+                     first_distance=None, second_distance=None, last_distance=None):
     sign = 1 if switch_position == Position.LEFT else -1
-    yield from Timed(ArcadeAutonomous(drivetrain, forward=0.7, rotate=0), duration=1.5).run()
-    yield from Timed(RotateAutonomous(drivetrain, gyro, angle=45 * sign, turn_speed=0.6), duration=1).run()
-    yield from Timed(ArcadeAutonomous(drivetrain, forward=0.7, rotate=0), duration=3).run()
-    yield from Timed(RotateAutonomous(drivetrain, gyro, angle=-50 * sign, turn_speed=0.6), duration=1).run()
-    yield from Timed(ArcadeAutonomous(drivetrain, forward=0.7, rotate=0), duration=2).run() # TODO: Lower how far forward this goes
-    # yield from VisionAuto(drivetrain, gyro, vision_socket, 0.5).run()
+    return Sequence(
+        ProfiledDrive(drivetrain, tuned_profile("center_first", first_distance), odometry),
+        RotateAutonomous(drivetrain, gyro, angle=first_angle * sign, turn_speed=turn_speed, clock=clock),
+        # Raise the elevator on the way instead of after we get there
+        Parallel(
+            ProfiledDrive(drivetrain, tuned_profile("center_second", second_distance), odometry),
+            raise_to_switch(elevator, clock),
+        ),
+        RotateAutonomous(drivetrain, gyro, angle=second_angle * sign, turn_speed=turn_speed, clock=clock),
+        ProfiledDrive(drivetrain, tuned_profile("center_last", last_distance), odometry), # TODO: Lower how far forward this goes
+        spit_cube(grabber, clock),
+        # VisionAuto(drivetrain, gyro, vision_socket, 0.5),
+    )
 
 # Used when the switch is on the same side of the starting position. For
 # example, when the robot starts on the left side and the switch is on the left side
-def switch_same_side(drivetrain, gyro, vision_socket, switch_position):
-    angle = 15
+def switch_same_side(drivetrain, gyro, vision_socket, switch_position, elevator, grabber, odometry=None, clock=WALL_CLOCK,
+                     angle=15, turn_speed=0.5, forward=0.6, forward_time=1.0):
     sign = 1 if switch_position == Position.LEFT else -1
-    yield from Timed(RotateAutonomous(drivetrain, gyro, angle=angle * sign, turn_speed=0.5), duration=1).run()
-    yield from Timed(VisionAuto(drivetrain, gyro, vision_socket, 0.6), duration=1).run()
+    return Sequence(
+        Parallel(
+            Sequence(
+                RotateAutonomous(drivetrain, gyro, angle=angle * sign, turn_speed=turn_speed, clock=clock),
+                Timed(VisionAuto(drivetrain, gyro, vision_socket, forward, odometry), duration=forward_time, clock=clock),
+            ),
+            raise_to_switch(elevator, clock),
+        ),
+        spit_cube(grabber, clock),
+    )
 
 # Used when the switch is on the opposite side of the starting position. For
 # example, when the robot starts on the left side but the switch is on the right side
-def switch_opposite_side(drivetrain, gyro, vision_socket, switch_position):
-    angle = 90
+def switch_opposite_side(drivetrain, gyro, vision_socket, switch_position, elevator, grabber, odometry=None, clock=WALL_CLOCK,
+                         angle=90, turn_speed=0.5,
+                         first_distance=None, second_distance=None, last_distance=None):
     sign = 1 if switch_position == Position.LEFT else -1
-    yield from Timed(ArcadeAutonomous(drivetrain, forward=0.7, rotate=0), duration=1.0).run()
-    yield from Timed(RotateAutonomous(drivetrain, gyro, angle=angle * sign, turn_speed=0.5), duration=1.0).run()
-    yield from Timed(ArcadeAutonomous(drivetrain, forward=0.7, rotate=0), duration=1.0).run()
-    yield from Timed(RotateAutonomous(drivetrain, gyro, angle=angle * sign, turn_speed=0.5), duration=1.0).run()
-    yield from Timed(ArcadeAutonomous(drivetrain, forward=0.3, rotate=0), duration=1.0).run()
+    return Sequence(
+        ProfiledDrive(drivetrain, tuned_profile("opposite_first", first_distance), odometry),
+        RotateAutonomous(drivetrain, gyro, angle=angle * sign, turn_speed=turn_speed, clock=clock),
+        Parallel(
+            ProfiledDrive(drivetrain, tuned_profile("opposite_second", second_distance), odometry),
+            raise_to_switch(elevator, clock),
+        ),
+        RotateAutonomous(drivetrain, gyro, angle=angle * sign, turn_speed=turn_speed, clock=clock),
+        ProfiledDrive(drivetrain, tuned_profile("opposite_last", last_distance), odometry),
+        spit_cube(grabber, clock),
+    )
+
+# Used when we don't know where our switch is (the game message was missing
+# or garbled): just cross the auto line, without turning towards either side
+def drive_forward(drivetrain, gyro, vision_socket, switch_position, elevator, grabber, odometry=None, clock=WALL_CLOCK,
+                  distance=None):
+    return ProfiledDrive(drivetrain, tuned_profile("cross_line", distance), odometry)
+
+
+def forward_with_vision(drivetrain, gyro, vision_socket, switch_position, elevator, grabber, odometry=None, clock=WALL_CLOCK):
+    return VisionAuto(drivetrain, gyro, vision_socket, 0.3, odometry)
+
+# The function that builds each routine
+ROUTINES = {
+    AutonomousRoutine.CENTER: center_to_switch,
+    AutonomousRoutine.SIDE_TO_SAME: switch_same_side,
+    AutonomousRoutine.SIDE_TO_OPPOSITE: switch_opposite_side,
+}
+
+
+def build_routine_table(robot_position, drivetrain, gyro, vision_socket, elevator, grabber,
+                        odometry=None, clock=WALL_CLOCK):
+    """
+    Build the routine for every possible game message ahead of time, so
+    starting autonomous is just a dictionary lookup and a call to run().
+    Building constructs every command and looks up every profile, so a
+    missing profile or two commands fighting over a subsystem raise here,
+    while the robot is still disabled. Nothing runs (and no timers start)
+    until run() is called. Commands keep state while they run, so build a
+    new table for each match.
+
+    Returns a (table, default) pair, where default is the routine to use if
+    the game message isn't one of GAME_MESSAGES. It only drives forward.
+    """
+    table = {}
+    for message in GAME_MESSAGES:
+        switch_position = SWITCH_POSITIONS[message]
+        build = ROUTINES[get_routine(robot_position, switch_position)]
+        table[message] = build(drivetrain, gyro, vision_socket, switch_position,
+                               elevator, grabber, odometry, clock=clock)
+    default = drive_forward(drivetrain, gyro, vision_socket, None, elevator, grabber, odometry, clock=clock)
 
+    for message, routine in itertools.chain(table.items(), [(None, default)]):
+        if not isinstance(routine, BaseAutonomous):
+            raise TypeError("Routine for {} is not a command: {}".format(message, routine))
+    return table, default
 
-def forward_with_vision(drivetrain, gyro, vision_socket, switch_position):
-    yield from VisionAuto(drivetrain, gyro, vision_socket, duration=0.3).run()
 
 class BaseAutonomous:
+    # Autonomous commands that care about time should read it from
+    # self.clock, so they can be run with a SimulatedClock.
+    clock = WALL_CLOCK
+    # The subsystems this command drives. Commands run in parallel can't
+    # share a subsystem, see Parallel.
+    requirements = ()
+
     def init(self):
         return self
 
@@ -95,17 +239,19 @@ class BaseAutonomous:
         return _execute()
 
 class Timed(BaseAutonomous):
-    def __init__(self, auto, duration=0):
+    def __init__(self, auto, duration=0, clock=WALL_CLOCK):
         self.auto = auto
         self.duration = duration
+        self.clock = clock
+        self.requirements = auto.requirements
 
     def init(self):
         self.auto.init()
-        self.end_time = time.time() + self.duration
+        self.end_time = self.clock.now() + self.duration
 
     def execute(self):
         for _ in self.auto.execute():
-            if time.time() > self.end_time:
+            if self.clock.now() > self.end_time:
                 break
             yield
 
@@ -113,81 +259,309 @@ class Timed(BaseAutonomous):
         self.auto.end()
 
 
+class Sequence(BaseAutonomous):
+    """
+    Run commands one after another. This is the same as chaining them with
+    yield from, but is itself a command, so it can be run in a Parallel.
+    """
+    def __init__(self, *commands):
+        self.commands = commands
+        self.requirements = union_requirements(commands)
+        self.current = None
+
+    def execute(self):
+        for command in self.commands:
+            self.current = command
+            command.init()
+            yield from command.execute()
+            command.end()
+            self.current = None
+
+    def end(self):
+        # Only needed when the sequence is stopped early
+        if self.current is not None:
+            self.current.end()
+            self.current = None
+
+
+class Parallel(BaseAutonomous):
+    """
+    Run commands at the same time, ticking each one once per loop. Finishes
+    once all of them have finished.
+    Raises ValueError if two of the commands require the same subsystem.
+    """
+    def __init__(self, *commands):
+        check_requirements(commands)
+        self.commands = commands
+        self.requirements = union_requirements(commands)
+        self.running = []
+
+    def init(self):
+        for command in self.commands:
+            command.init()
+        self.running = [(command, command.execute()) for command in self.commands]
+
+    def execute(self):
+        while self.running:
+            for entry in list(self.running):
+                command, ticks = entry
+                try:
+                    next(ticks)
+                except StopIteration:
+                    command.end()
+                    self.running.remove(entry)
+                    if self.finishes_group(command):
+                        # Don't tick the rest, end() stops them
+                        return
+            if not self.running:
+                return
+            yield
+
+    def finishes_group(self, command):
+        """
+        Whether the group should stop once command has finished.
+        """
+        return False
+
+    def end(self):
+        # Stop anything still running, for when the group finishes early
+        for command, ticks in self.running:
+            ticks.close()
+            command.end()
+        self.running = []
+
+
+class Race(Parallel):
+    """
+    Run commands at the same time, finishing as soon as any one of them
+    finishes. The rest are stopped.
+    """
+    def finishes_group(self, command):
+        return True
+
+
+class Deadline(Parallel):
+    """
+    Run commands at the same time until the first one (the deadline)
+    finishes. The others are stopped if they are still running by then.
+    """
+    def finishes_group(self, command):
+        return command is self.commands[0]
+
+
+def union_requirements(commands):
+    requirements = []
+    for command in commands:
+        for subsystem in command.requirements:
+            if subsystem not in requirements:
+                requirements.append(subsystem)
+    return tuple(requirements)
+
+
+def check_requirements(commands):
+    """
+    Raises ValueError if more than one of the commands requires the same
+    subsystem, since they would fight over it.
+    """
+    owners = {}
+    for command in commands:
+        for subsystem in command.requirements:
+            if id(subsystem) in owners:
+                raise ValueError("{} and {} both require {}".format(
+                    type(owners[id(subsystem)]).__name__, type(command).__name__,
+                    type(subsystem).__name__))
+            owners[id(subsystem)] = command
+
+
 class VisionAuto(BaseAutonomous):
     """
-    Rotate the robot towards the target using incoming vision packets
+    Drive towards the target at forward speed, steering with the gyro.
     vision_socket is a VisionSocket, not a Python socket
+
+    Each new vision sample is turned into an absolute gyro heading: the
+    heading the robot had when the camera took the picture, plus the angle
+    to the target in it. The gyro is read every loop, so the robot holds that
+    heading between samples instead of waiting for the next one, and each
+    new sample refines it. With odometry, the heading at capture time comes
+    from its history; otherwise the current heading is used, which is close
+    enough when the robot isn't turning quickly.
     """
-    def __init__(self, drivetrain, gyro, vision_socket, forward):
+    # Output per degree of heading error
+    KP = 0.03
+    # Output per degree/second of turning, to keep from overshooting
+    KD = 0.002
+    # Samples older than this (seconds) don't change the heading
+    MAX_STALENESS = 0.5
+
+    def __init__(self, drivetrain, gyro, vision_socket, forward, odometry=None, turn_speed=0.5):
         self.drivetrain = drivetrain
+        self.requirements = (drivetrain,)
         self.socket = vision_socket
         self.gyro = gyro
         self.forward = forward
-        self.correction = 0
-        self.PID = wpilib.PIDController(0.03, 0.0, 0.0,
-            source=self._get_angle,
-            output=self._set_correction)
-
-    def _get_angle(self):
-        angle = self.socket.get_angle(max_staleness=0.5)/30.0
-        return angle
-
-    def _set_correction(self, value):
-        self.correction = value
+        self.odometry = odometry
+        self.turn_speed = turn_speed
 
     def init(self):
-        self.PID.setInputRange(-35, 35)
-        self.PID.enable()
-
-    def init(self):
-        # TODO: Use the gyro to better rotate to the target
-        pass
+        # Drive straight until the first sample comes in
+        self.heading = self.gyro.getAngle()
+        self.capture_time = None
+
+    def _heading_at(self, t):
+        heading = self.gyro.getAngle()
+        if self.odometry is not None:
+            then = self.odometry.get_pose_at(t)
+            if then is not None:
+                # How far we've turned since then, measured in odometry's
+                # frame so its reset offset cancels out
+                heading -= self.odometry.get_pose().heading - then.heading
+        return heading
 
     def execute(self):
         while True:
-            angle = self.socket.get_angle(max_staleness=0.5)
-            if angle is not None:
-                correction = self.PID.get()
-                correction = math.copysign(self.correction, angle)
-                self.drivetrain.arcade_drive(self.forward, correction)
-            else:
-                self.drivetrain.stop()
+            sample = self.socket.latest_sample()
+            if (sample is not None and sample.capture_time != self.capture_time and
+                    self.socket.get_angle(self.MAX_STALENESS) is not None):
+                self.capture_time = sample.capture_time
+                self.heading = self._heading_at(sample.capture_time) + sample.angle
+
+            error = self.heading - self.gyro.getAngle()
+            correction = self.KP * error - self.KD * self.gyro.getRate()
+            correction = max(-self.turn_speed, min(self.turn_speed, correction))
+            self.drivetrain.arcade_drive(self.forward, correction, squared=False)
             yield
 
     def end(self):
-        self.PID.disable()
+        self.drivetrain.stop()
 
 class RotateAutonomous(BaseAutonomous):
     """
     Rotate the robot by the specified angle in degrees.
     Positive values will rotate clockwise, while negative values will rotate
     counterclockwise.
+    turn_speed is the fastest the robot is allowed to turn, between 0 and 1.
+
+    Finishes once the robot has been within tolerance degrees of the goal and
+    has stopped turning for settle_time seconds, or after timeout seconds no
+    matter what, so a turn that can't finish doesn't eat all of autonomous.
     """
-    def __init__(self, drivetrain, gyro, angle=0, turn_speed=0):
+    # Output per degree of error
+    KP = 0.03
+    # Output per degree/second of turning, this slows the turn down as it
+    # gets close instead of overshooting
+    KD = 0.002
+    # Smallest output that still turns the robot, anything less just stalls
+    MIN_OUTPUT = 0.15
+    # Turning slower than this (degrees/second) counts as stopped
+    SETTLE_RATE = 5.0
+
+    def __init__(self, drivetrain, gyro, angle=0, turn_speed=0, tolerance=2.0,
+                 settle_time=0.1, timeout=1.5, clock=WALL_CLOCK):
         self.drivetrain = drivetrain
+        self.requirements = (drivetrain,)
         self.gyro = gyro
         self.speed = turn_speed
         assert self.speed >= 0, "Speed ({}) must be positive!".format(self.speed)
         self.angle_goal = angle
+        self.tolerance = tolerance
+        self.settle_time = settle_time
+        self.timeout = timeout
+        self.clock = clock
 
     def init(self):
         self.start_angle = self.gyro.getAngle()
+        self.target = self.start_angle + self.angle_goal
+        self.start_time = self.clock.now()
+        self.settled_since = None
 
     def execute(self):
         while True:
-            # We need the different between the goal angle delta and the current angle delta
-            angle_error = abs(self.angle_goal) - abs(self.start_angle - self.gyro.getAngle())
-            correction_factor = angle_error / 10.0
-            if correction_factor > 1.0:
-                correction_factor = 1.0
-
-            if self.angle_goal > 0:
-                self.drivetrain.arcade_drive(0, self.speed * correction_factor)
+            now = self.clock.now()
+            angle_error = self.target - self.gyro.getAngle()
+            rate = self.gyro.getRate()
+
+            on_target = abs(angle_error) <= self.tolerance
+            if on_target and abs(rate) <= self.SETTLE_RATE:
+                if self.settled_since is None:
+                    self.settled_since = now
+                if now - self.settled_since >= self.settle_time:
+                    return
             else:
-                self.drivetrain.arcade_drive(0, -self.speed * correction_factor)
+                self.settled_since = None
+            if now - self.start_time >= self.timeout:
+                return
+
+            if on_target:
+                correction = 0.0
+            else:
+                correction = self.KP * angle_error - self.KD * rate
+                correction = max(-self.speed, min(self.speed, correction))
+                if abs(correction) < self.MIN_OUTPUT:
+                    correction = math.copysign(min(self.MIN_OUTPUT, self.speed), angle_error)
+            self.drivetrain.arcade_drive(0, correction, squared=False)
             yield
 
-    def stop(self):
+    def end(self):
+        self.drivetrain.stop()
+
+
+class ProfiledDrive(BaseAutonomous):
+    """
+    Drive straight by following a motion profile from trajectory.py. The
+    profile is sampled one index per loop, so nothing is solved while
+    driving.
+
+    Without odometry this is open loop and finishes as soon as the profile
+    does. With odometry, the distance driven is also corrected towards the
+    profile, and once the profile is over the robot keeps correcting until
+    it is within tolerance feet of the end (for at most settle_time seconds).
+    """
+    # Output per foot of distance error
+    KP = 0.4
+    # Smallest output that still moves the robot
+    MIN_OUTPUT = 0.1
+
+    def __init__(self, drivetrain, profile, odometry=None, tolerance=0.1, settle_time=0.5):
+        self.drivetrain = drivetrain
+        self.requirements = (drivetrain,)
+        self.profile = profile
+        self.odometry = odometry
+        self.tolerance = tolerance
+        self.settle_ticks = int(settle_time / self.profile.dt)
+
+    def init(self):
+        if self.odometry is not None:
+            self.start_distance = self.odometry.get_distance()
+
+    def _traveled(self):
+        return self.odometry.get_distance() - self.start_distance
+
+    def execute(self):
+        position = self.profile.position
+        velocity = self.profile.velocity
+        acceleration = self.profile.acceleration
+        odometry = self.odometry
+        for i in range(len(self.profile)):
+            output = trajectory.KV * velocity[i] + trajectory.KA * acceleration[i]
+            if odometry is not None:
+                output += self.KP * (position[i] - self._traveled())
+            output = max(-1.0, min(1.0, output))
+            self.drivetrain.arcade_drive(output, 0, squared=False)
+            yield
+
+        if odometry is None:
+            return
+        for _ in range(self.settle_ticks):
+            error = self.profile.distance - self._traveled()
+            if abs(error) <= self.tolerance:
+                return
+            output = self.KP * error
+            if abs(output) < self.MIN_OUTPUT:
+                output = math.copysign(self.MIN_OUTPUT, error)
+            self.drivetrain.arcade_drive(max(-1.0, min(1.0, output)), 0, squared=False)
+            yield
+
+    def end(self):
         self.drivetrain.stop()
 
 
@@ -200,6 +574,7 @@ class ArcadeAutonomous(BaseAutonomous):
 
     def __init__(self, drivetrain, forward=0, rotate=0):
         self.drivetrain = drivetrain
+        self.requirements = (drivetrain,)
         self.forward = forward
         self.rotate = rotate
 
@@ -208,5 +583,97 @@ class ArcadeAutonomous(BaseAutonomous):
             self.drivetrain.arcade_drive(self.forward, self.rotate)
             yield
 
-    def stop(self):
+    def end(self):
         self.drivetrain.stop()
+
+
+class ElevatorAutonomous(BaseAutonomous):
+    """
+    Run the elevator at the given speed until stopped. Positive speeds go up.
+    """
+    def __init__(self, elevator, speed):
+        self.elevator = elevator
+        self.requirements = (elevator,)
+        self.speed = speed
+
+    def execute(self):
+        while True:
+            self.elevator.go_up(self.speed)
+            yield
+
+    def end(self):
+        self.elevator.stop()
+
+
+class ElevatorToHeight(BaseAutonomous):
+    """
+    Move the elevator to height (feet, see Elevator) and finish once it gets
+    there, or after timeout seconds. The Talon keeps holding the height
+    afterwards.
+    """
+    def __init__(self, elevator, height, timeout=3.0, clock=WALL_CLOCK):
+        self.elevator = elevator
+        self.requirements = (elevator,)
+        self.height = height
+        self.timeout = timeout
+        self.clock = clock
+
+    def init(self):
+        self.start_time = self.clock.now()
+
+    def execute(self):
+        self.elevator.go_to(self.height)
+        while not self.elevator.at_setpoint():
+            if self.clock.now() - self.start_time >= self.timeout:
+                return
+            yield
+
+
+class GrabberAutonomous(BaseAutonomous):
+    """
+    Spit the cube out at the given speed until stopped.
+    """
+    def __init__(self, grabber, speed):
+        self.grabber = grabber
+        self.requirements = (grabber,)
+        self.speed = speed
+
+    def execute(self):
+        while True:
+            self.grabber.eject(self.speed)
+            yield
+
+    def end(self):
+        self.grabber.release()
+
+
+class IntakeCube(BaseAutonomous):
+    """
+    Run the intake until a cube is seated, or for at most timeout seconds,
+    and leave the grabber holding it. Finishes straight away if there's
+    already a cube in the grabber. Run it as the deadline of a Deadline to
+    drive until the cube is in.
+    """
+    def __init__(self, grabber, speed=1.0, timeout=3.0, clock=WALL_CLOCK):
+        self.grabber = grabber
+        self.requirements = (grabber,)
+        self.speed = speed
+        self.timeout = timeout
+        self.clock = clock
+
+    def init(self):
+        self.start_time = self.clock.now()
+        self.start_count = self.grabber.acquired
+
+    def execute(self):
+        grabber = self.grabber
+        if grabber.has_cube():
+            return
+        while grabber.acquired == self.start_count:
+            if self.clock.now() - self.start_time >= self.timeout:
+                return
+            grabber.intake(self.speed)
+            yield
+
+    def end(self):
+        self.grabber.release()
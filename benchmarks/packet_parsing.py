@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+'''
+    Compares how long it takes to parse a vision packet in the old JSON format
+    and in the binary format. Run from the root of the repository:
+
+        python3 benchmarks/packet_parsing.py
+'''
+
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import network
+
+ITERATIONS = 200000
+
+JSON_PACKET = b'{"sender": "vision", "angle": 12.5, "id": 1234}'
+BINARY_PACKET = network.encode_packet(packet_id=1234, angle=12.5)
+
+
+def old_json_parse(data):
+    # This is how VisionSocket._read_packet parsed packets before the binary format
+    parsed = json.loads(data.decode())
+    if parsed["sender"] == "vision":
+        return parsed["angle"], parsed["id"]
+
+
+def report(name, seconds):
+    per_packet = seconds / ITERATIONS
+    print("{:<24} {:8.3f} us/packet {:12.0f} packets/s".format(
+        name, per_packet * 1e6, 1 / per_packet))
+    return per_packet
+
+
+def main():
+    buffer = bytearray(network.BUFFER_SIZE)
+    buffer[:len(BINARY_PACKET)] = BINARY_PACKET
+    view = memoryview(buffer)[:len(BINARY_PACKET)]
+
+    old = report("json (old path)",
+                 timeit.timeit(lambda: old_json_parse(JSON_PACKET), number=ITERATIONS))
+    report("json (fallback path)",
+           timeit.timeit(lambda: network.decode_packet(JSON_PACKET), number=ITERATIONS))
+    new = report("binary (memoryview)",
+                 timeit.timeit(lambda: network.decode_packet(view), number=ITERATIONS))
+    print("binary speedup over old json: {:.1f}x".format(old / new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+'''
+    Measures how long the robot's periodic methods, each autonomous routine,
+    vision packet handling and the subsystem calls take under the pyfrc
+    simulator, and checks them against a budget for each, as a fraction of
+    the 20 ms loop. The simulator stands in for the HAL, so this measures
+    our code and not the hardware.
+
+    tests/loop_budget_test.py runs this, and saves the results so they can
+    be compared between commits, but only when told where to save them:
+
+        BENCHMARK_RESULTS=benchmarks/results/$(git rev-parse --short HEAD).json python3 robot.py test -- -k budget
+
+    To show a set of results:
+
+        python3 benchmarks/robot_loop.py results.json
+
+    and to compare two sets of results:
+
+        python3 benchmarks/robot_loop.py old.json new.json
+
+    The budgets are checked against the 99th percentile call, and are
+    loose enough for a desktop or CI machine. The roboRIO is a lot slower,
+    so a call that is anywhere near its budget here needs looking at.
+'''
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import autonomous
+import network
+from looptiming import LOOP_PERIOD
+
+CALLS = 500
+
+# Most each call is allowed to take, as a fraction of LOOP_PERIOD
+BUDGETS = OrderedDict([
+    ('robotPeriodic', 0.05),
+    ('teleopPeriodic', 0.10),
+    ('autonomousPeriodic/center_to_switch', 0.10),
+    ('autonomousPeriodic/switch_same_side', 0.10),
+    ('autonomousPeriodic/switch_opposite_side', 0.10),
+    ('VisionSocket._read_packet', 0.002),
+    ('Drivetrain.arcade_drive', 0.02),
+    ('Elevator.go_up', 0.005),
+    ('Grabber.absorb', 0.005),
+    ('Wings.raise_left', 0.005),
+])
+
+# A starting position and game message that picks each routine
+ROUTINE_CASES = (
+    ('center_to_switch', autonomous.Position.CENTER, 'LRL'),
+    ('switch_same_side', autonomous.Position.LEFT, 'LRL'),
+    ('switch_opposite_side', autonomous.Position.LEFT, 'RLR'),
+)
+
+# A mean this much slower than the old results counts as a regression
+REGRESSION = 0.25
+
+
+def time_calls(function, calls=CALLS):
+    '''
+        Returns how long each of calls calls to function took, in seconds.
+    '''
+    times = []
+    clock = time.perf_counter
+    for _ in range(calls):
+        start = clock()
+        function()
+        times.append(clock() - start)
+    return times
+
+
+def summarize(times, budget):
+    ordered = sorted(times)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    return OrderedDict([
+        ('calls', len(times)),
+        ('mean', sum(times) / len(times)),
+        ('p99', p99),
+        ('max', ordered[-1]),
+        ('budget', budget * LOOP_PERIOD),
+        ('ok', p99 <= budget * LOOP_PERIOD),
+    ])
+
+
+def _autonomous(robot, position, message):
+    # Routines run on a simulated clock so they get all the way through
+    # instead of waiting on timers
+    clock = autonomous.SimulatedClock()
+    robot.clock = clock
+    robot._build_routines(position)
+    robot.auton = robot.routine_table[message].run()
+    robot.routine_table = None
+
+    def tick():
+        robot.autonomousPeriodic()
+        clock.step()
+    return tick
+
+
+def measure(robot, calls=CALLS):
+    '''
+        Measures everything in BUDGETS on a robot that robotInit has been
+        called on, and returns the summary for each, by name.
+    '''
+    times = OrderedDict()
+
+    robot.teleopInit()
+    times['teleopPeriodic'] = time_calls(robot.teleopPeriodic, calls)
+    times['robotPeriodic'] = time_calls(robot.robotPeriodic, calls)
+
+    for name, position, message in ROUTINE_CASES:
+        times['autonomousPeriodic/' + name] = time_calls(_autonomous(robot, position, message), calls)
+    robot.clock = autonomous.WALL_CLOCK
+
+    vision_socket = network.VisionSocket(ip='127.0.0.1', port=0)
+    packet = memoryview(network.encode_packet(packet_id=1, angle=12.5))
+    times['VisionSocket._read_packet'] = time_calls(lambda: vision_socket._read_packet(packet), calls)
+    vision_socket.close()
+
+    times['Drivetrain.arcade_drive'] = time_calls(lambda: robot.drivetrain.arcade_drive(0.5, 0.25), calls)
+    times['Elevator.go_up'] = time_calls(lambda: robot.elevator.go_up(0.5), calls)
+    times['Grabber.absorb'] = time_calls(lambda: robot.grabber.absorb(0.5), calls)
+    times['Wings.raise_left'] = time_calls(robot.wings.raise_left, calls)
+
+    return OrderedDict((name, summarize(times[name], budget)) for name, budget in BUDGETS.items())
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save(results, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(OrderedDict([
+            ('commit', _commit()),
+            ('time', time.strftime('%Y-%m-%dT%H:%M:%S')),
+            ('python', platform.python_version()),
+            ('machine', platform.machine()),
+            ('results', results),
+        ]), f, indent=2)
+
+
+def compare(old, new, threshold=REGRESSION):
+    '''
+        Returns (name, old mean, new mean) for everything in both sets of
+        results that got more than threshold slower.
+    '''
+    regressions = []
+    for name, result in new.items():
+        if name in old and result['mean'] > old[name]['mean'] * (1 + threshold):
+            regressions.append((name, old[name]['mean'], result['mean']))
+    return regressions
+
+
+def report(results):
+    for name, result in results.items():
+        print("{:<42} {:9.1f} us mean {:9.1f} us p99 {:6.1f}% of budget{}".format(
+            name, result['mean'] * 1e6, result['p99'] * 1e6,
+            100 * result['p99'] / result['budget'], '' if result['ok'] else '  OVER BUDGET'))
+
+
+def main(argv):
+    if len(argv) == 1:
+        with open(argv[0]) as f:
+            results = json.load(f)
+        print(results['commit'])
+        report(results['results'])
+        return 0
+    if len(argv) != 2:
+        print(__doc__)
+        return 2
+    with open(argv[0]) as f:
+        old = json.load(f)
+    with open(argv[1]) as f:
+        new = json.load(f)
+    print("{} -> {}".format(old['commit'], new['commit']))
+    report(new['results'])
+    regressions = compare(old['results'], new['results'])
+    for name, before, after in regressions:
+        print("REGRESSION {}: {:.1f} us -> {:.1f} us".format(name, before * 1e6, after * 1e6))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,225 @@
+import time
+from array import array
+
+from telemetry import Deferred
+
+# IterativeRobot runs the periodic methods every 20 ms
+LOOP_PERIOD = 0.02
+
+# Durations are binned into a fixed histogram so recording a sample never
+# allocates. Anything longer than BUCKET_WIDTH * BUCKET_COUNT (40 ms) ends up
+# in the last bucket, which is fine since it is an overrun either way.
+BUCKET_WIDTH = 0.0001
+BUCKET_COUNT = 400
+
+# How often (in seconds) summaries are published to NetworkTables
+PUBLISH_PERIOD = 5.0
+
+# Telemetry key each phase's summary is published under, followed by its name
+KEY_PREFIX = 'loop_timing/'
+
+
+def percentile(buckets, samples, maximum, fraction):
+    """
+    Returns the upper edge (in seconds) of the bucket holding the given
+    fraction of the samples, or 0 if there are no samples.
+    """
+    if samples == 0:
+        return 0.0
+    target = fraction * samples
+    seen = 0
+    for index, count in enumerate(buckets):
+        seen += count
+        if seen >= target:
+            return min((index + 1) * BUCKET_WIDTH, maximum)
+    return maximum
+
+
+def summarize(buckets, samples, maximum, overruns, total_overruns):
+    """
+    Returns [p50, p99, max] in milliseconds followed by the overruns in the
+    window and since startup.
+    """
+    return [
+        percentile(buckets, samples, maximum, 0.5) * 1000,
+        percentile(buckets, samples, maximum, 0.99) * 1000,
+        maximum * 1000,
+        overruns,
+        total_overruns,
+    ]
+
+
+class Window(Deferred):
+    """
+    One publish period of a PhaseStats, taken by PhaseStats.swap along with
+    its histogram. It is resolved on the Telemetry thread, which works out the
+    summary, clears the histogram and gives it back as the phase's spare.
+    """
+    def __init__(self, stats, buckets):
+        self.stats = stats
+        self.buckets = buckets
+        self.samples = stats.samples
+        self.max = stats.max
+        self.overruns = stats.overruns
+        self.total_overruns = stats.total_overruns
+
+    def resolve(self):
+        summary = summarize(self.buckets, self.samples, self.max,
+                            self.overruns, self.total_overruns)
+        for index in range(BUCKET_COUNT):
+            self.buckets[index] = 0
+        self.stats.spare_ready = True
+        return summary
+
+
+class PhaseStats:
+    """
+    Keeps a histogram of how long one phase of the loop took since the last
+    time it was published, along with the slowest time and how many times it
+    went over its budget.
+
+    It has a second, spare histogram so a window can be handed off with swap
+    without clearing anything on the control thread.
+    """
+    def __init__(self, name, budget=None):
+        self.name = name
+        self.budget = budget
+        self.buckets = array('l', [0]) * BUCKET_COUNT
+        self.spare = array('l', [0]) * BUCKET_COUNT
+        # Whether the spare has been cleared and can be swapped in
+        self.spare_ready = True
+        self.samples = 0
+        self.max = 0.0
+        self.overruns = 0
+        # Overruns since the robot started, never reset
+        self.total_overruns = 0
+
+    def record(self, elapsed):
+        index = int(elapsed / BUCKET_WIDTH)
+        if index >= BUCKET_COUNT:
+            index = BUCKET_COUNT - 1
+        self.buckets[index] += 1
+        self.samples += 1
+        if elapsed > self.max:
+            self.max = elapsed
+        if self.budget is not None and elapsed > self.budget:
+            self.overruns += 1
+            self.total_overruns += 1
+
+    def percentile(self, fraction):
+        return percentile(self.buckets, self.samples, self.max, fraction)
+
+    def summary(self):
+        return summarize(self.buckets, self.samples, self.max,
+                         self.overruns, self.total_overruns)
+
+    def swap(self):
+        """
+        Ends the current window and returns it as a Window, starting a new
+        one in the spare histogram. Returns None if the last Window hasn't
+        been resolved yet, in which case the current window carries on.
+        """
+        if not self.spare_ready:
+            return None
+        window = Window(self, self.buckets)
+        self.buckets = self.spare
+        self.spare = window.buckets
+        self.spare_ready = False
+        self.samples = 0
+        self.max = 0.0
+        self.overruns = 0
+        return window
+
+    def unswap(self, window):
+        """
+        Puts back a window that could not be handed off, merging in anything
+        recorded since it was swapped out.
+        """
+        buckets = self.buckets
+        for index in range(BUCKET_COUNT):
+            window.buckets[index] += buckets[index]
+            buckets[index] = 0
+        self.buckets = window.buckets
+        self.spare = buckets
+        self.spare_ready = True
+        self.samples += window.samples
+        self.max = max(self.max, window.max)
+        self.overruns += window.overruns
+
+    def reset(self):
+        for index in range(BUCKET_COUNT):
+            self.buckets[index] = 0
+        self.samples = 0
+        self.max = 0.0
+        self.overruns = 0
+
+
+class Phase:
+    """
+    Context manager that times the code inside it. Get one from
+    LoopTimer.phase once and reuse it every loop, so timing a block costs two
+    clock reads and a histogram update.
+    """
+    def __init__(self, stats, clock):
+        self.stats = stats
+        self.clock = clock
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = self.clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stats.record(self.clock() - self.start)
+        return False
+
+
+class LoopTimer:
+    """
+    Times the phases of the robot loop and publishes a summary of each phase
+    through telemetry every publish_period seconds. The summaries are worked
+    out on the telemetry thread; all the loop does is swap histograms.
+
+    Call start_loop at the beginning of each mode's periodic method and
+    end_loop at the end of robotPeriodic; the time between the two is recorded
+    as the "loop" phase and checked against the 20 ms loop period.
+    """
+    def __init__(self, telemetry=None, publish_period=PUBLISH_PERIOD, clock=time.perf_counter):
+        self.telemetry = telemetry
+        self.publish_period = publish_period
+        self.clock = clock
+        self.phases = {}
+        self.keys = {}
+        self.loop_stats = self.stats("loop", budget=LOOP_PERIOD)
+        self.loop_start = None
+        self.last_publish = clock()
+
+    def stats(self, name, budget=None):
+        if name not in self.phases:
+            self.phases[name] = PhaseStats(name, budget)
+            self.keys[name] = KEY_PREFIX + name
+        return self.phases[name]
+
+    def phase(self, name, budget=None):
+        return Phase(self.stats(name, budget), self.clock)
+
+    def start_loop(self):
+        self.loop_start = self.clock()
+
+    def end_loop(self):
+        now = self.clock()
+        if self.loop_start is not None:
+            self.loop_stats.record(now - self.loop_start)
+            self.loop_start = None
+        if now - self.last_publish >= self.publish_period:
+            self.publish()
+            self.last_publish = now
+
+    def publish(self):
+        for name, stats in self.phases.items():
+            if self.telemetry is None:
+                stats.reset()
+                continue
+            window = stats.swap()
+            if window is not None and not self.telemetry.put(self.keys[name], window):
+                stats.unswap(window)
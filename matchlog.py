@@ -0,0 +1,401 @@
+import collections
+import math
+import mmap
+import operator
+import os
+import struct
+
+import actuators
+import autonomous
+import network
+import snapshot
+from subsystems.odometry import Pose
+
+# Robot modes, as stored in the log's mode column. The names match the
+# IterativeRobot methods for each mode, e.g. autonomousInit.
+DISABLED = 0
+AUTONOMOUS = 1
+TELEOP = 2
+MODE_NAMES = ('disabled', 'autonomous', 'teleop')
+
+# Enough for ten minutes at 50 loops a second. Until the robot is first
+# enabled only the newest PREMATCH_ROWS (30 seconds) are kept, however long
+# it sits disabled, and the rest is left for the match. Recording stops
+# once that is full.
+MATCH_ROWS = 30000
+PREMATCH_ROWS = 1500
+
+# Each log is several megabytes, so only the newest few are kept
+KEEP_LOGS = 10
+
+# Game messages are stored as their index in GAME_MESSAGES, plus one so that
+# 0 means there wasn't one.
+GAME_MESSAGE_CODES = {message: code + 1 for code, message in enumerate(autonomous.GAME_MESSAGES)}
+
+OUTPUT_PREFIX = 'out_'
+
+# File layout: a header, a table of column names and struct formats, then one
+# contiguous block per column holding that column's value for every row. The
+# header holds the number of rows written, which is updated after each row so
+# a log cut off by a crash or power loss can still be read.
+MAGIC = b'MLOG'
+VERSION = 6
+HEADER = struct.Struct('<4sHHII')
+ROWS = struct.Struct('<I')
+ROWS_OFFSET = HEADER.size - ROWS.size
+COLUMN = struct.Struct('<32sc')
+ALIGNMENT = 8
+
+Column = collections.namedtuple('Column', ('name', 'format', 'getter'))
+Difference = collections.namedtuple('Difference', ('row', 'time', 'name', 'recorded', 'replayed'))
+
+CONTROLLER_COLUMNS = (
+    ('left_x', 'f'), ('left_y', 'f'), ('right_x', 'f'), ('right_y', 'f'),
+    ('left_trigger', 'f'), ('right_trigger', 'f'), ('pov', 'h'),
+    ('a_button', '?'), ('b_button', '?'), ('x_button', '?'), ('y_button', '?'),
+    ('left_bumper', '?'), ('right_bumper', '?'),
+)
+TALON_COLUMNS = (
+    ('position', 'i'), ('velocity', 'i'), ('current', 'f'),
+    ('forward_limit', '?'), ('reverse_limit', '?'),
+)
+
+ODOMETRY_COLUMNS = (
+    ('time', 'd'), ('x', 'd'), ('y', 'd'), ('heading', 'd'),
+)
+
+# Autonomous reads odometry through the snapshot too, so every mode can be
+# replayed exactly
+REPLAYED_MODES = (DISABLED, AUTONOMOUS, TELEOP)
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _layout(formats, capacity):
+    """
+    Returns the offset of each column's block, and the total file size.
+    """
+    offset = _align(HEADER.size + len(formats) * COLUMN.size)
+    offsets = []
+    for fmt in formats:
+        offsets.append(offset)
+        offset = _align(offset + capacity * struct.calcsize('<' + fmt))
+    return offsets, offset
+
+
+def _vision_angle(robot):
+    sample = robot.sensors.vision.sample
+    return sample.angle if sample is not None else math.nan
+
+
+def _vision_time(robot):
+    sample = robot.sensors.vision.sample
+    return sample.receive_time if sample is not None else math.nan
+
+
+def robot_columns(bank, talons=()):
+    """
+    Returns the columns recorded for the robot: the mode, everything in its
+    SensorSnapshot, and the last output written to each actuator in bank.
+    talons are the names of the Talons in the snapshot.
+    """
+    columns = [
+        Column('time', 'd', operator.attrgetter('sensors.time')),
+        Column('mode', 'B', operator.attrgetter('mode')),
+        Column('game_message', 'B', lambda robot: GAME_MESSAGE_CODES.get(robot.sensors.game_message, 0)),
+    ]
+    for controller in ('driver', 'operator'):
+        for field, fmt in CONTROLLER_COLUMNS:
+            columns.append(Column(
+                '{}_{}'.format(controller, field), fmt,
+                operator.attrgetter('sensors.{}.{}'.format(controller, field))))
+    columns += [
+        Column('gyro_angle', 'd', operator.attrgetter('sensors.gyro.angle')),
+        Column('gyro_rate', 'f', operator.attrgetter('sensors.gyro.rate')),
+        # Packet ids are unsigned 32 bit, and -1 means no sample
+        Column('vision_id', 'q', lambda robot: robot.sensors.vision.get_id()),
+        Column('vision_angle', 'f', _vision_angle),
+        Column('vision_time', 'd', _vision_time),
+    ]
+    for field, fmt in ODOMETRY_COLUMNS:
+        columns.append(Column(
+            'odometry_' + field, fmt, operator.attrgetter('sensors.odometry.pose.' + field)))
+    columns += [
+        Column('odometry_distance', 'd', operator.attrgetter('sensors.odometry.distance')),
+        Column('odometry_resets', 'I', operator.attrgetter('sensors.odometry.resets')),
+    ]
+    for name in sorted(talons):
+        for field, fmt in TALON_COLUMNS:
+            columns.append(Column(
+                '{}_{}'.format(name, field), fmt,
+                lambda robot, name=name, read=operator.attrgetter(field): read(robot.sensors.talons[name])))
+    for name, actuator in sorted(bank.actuators.items()):
+        columns.append(Column(OUTPUT_PREFIX + name, 'f', lambda robot, actuator=actuator: actuator.output))
+    return columns
+
+
+def next_log_path(directory, extension='.mlog', keep=KEEP_LOGS):
+    """
+    Returns a path for a new log in directory, numbered one after the newest
+    log there. The roboRIO's clock isn't set until the driver station
+    connects, so numbers are more useful than timestamps.
+
+    The oldest logs are deleted so that, with the new one, there are at most
+    keep of them.
+    """
+    os.makedirs(directory, exist_ok=True)
+    logs = sorted(
+        (int(name[:-len(extension)]), name) for name in os.listdir(directory)
+        if name.endswith(extension) and name[:-len(extension)].isdigit())
+    for _, name in logs[:max(len(logs) - keep + 1, 0)]:
+        os.remove(os.path.join(directory, name))
+    number = logs[-1][0] + 1 if logs else 0
+    return os.path.join(directory, '{:04d}{}'.format(number, extension))
+
+
+class MatchRecorder:
+    """
+    Appends one row per loop to a memory-mapped columnar log. The file is
+    sized for capacity rows up front, and each value is packed straight into
+    its place in the map, so recording a row doesn't allocate or make any
+    system calls.
+
+    Until start_match is called, only the newest lead rows are sure to be
+    kept: when the log fills up they are moved to the front and the rest
+    are written over.
+    """
+    def __init__(self, path, columns, capacity=MATCH_ROWS, lead=PREMATCH_ROWS):
+        self.path = path
+        self.capacity = capacity
+        self.lead = min(lead, capacity - 1)
+        self.rows = 0
+        self.dropped = 0
+        self.started = False
+
+        formats = [column.format for column in columns]
+        offsets, size = _layout(formats, capacity)
+        with open(path, 'w+b') as f:
+            f.truncate(size)
+            self.buffer = mmap.mmap(f.fileno(), size)
+
+        HEADER.pack_into(self.buffer, 0, MAGIC, VERSION, len(columns), capacity, 0)
+        for i, column in enumerate(columns):
+            COLUMN.pack_into(
+                self.buffer, HEADER.size + i * COLUMN.size,
+                column.name.encode('ascii'), column.format.encode('ascii'))
+
+        self.columns = []
+        for column, offset in zip(columns, offsets):
+            packer = struct.Struct('<' + column.format)
+            self.columns.append((packer.pack_into, offset, packer.size, column.getter))
+
+    def start_match(self):
+        """
+        Called when the robot is first enabled. Keeps the newest lead rows
+        from before, and records the match linearly after them. Does nothing
+        if the match has already started.
+        """
+        if self.started:
+            return
+        self.started = True
+        if self.rows > self.lead:
+            self._keep_newest(self.lead)
+
+    def _keep_newest(self, count):
+        buffer = self.buffer
+        first = self.rows - count
+        # Empty while the rows are moved, so a log cut off part way through
+        # doesn't have a mix of old and new rows in it
+        ROWS.pack_into(buffer, ROWS_OFFSET, 0)
+        for _, offset, size, _ in self.columns:
+            buffer.move(offset, offset + first * size, count * size)
+        self.rows = count
+        ROWS.pack_into(buffer, ROWS_OFFSET, count)
+
+    def record(self, source):
+        """
+        Records one row, reading each column from source. Returns False if
+        the log is full and the row was dropped.
+        """
+        row = self.rows
+        if row >= self.capacity:
+            if self.started:
+                self.dropped += 1
+                return False
+            self._keep_newest(self.lead)
+            row = self.rows
+        buffer = self.buffer
+        for pack_into, offset, size, getter in self.columns:
+            pack_into(buffer, offset + row * size, getter(source))
+        self.rows = row + 1
+        ROWS.pack_into(buffer, ROWS_OFFSET, self.rows)
+        return True
+
+    def close(self):
+        if not self.buffer.closed:
+            self.buffer.flush()
+            self.buffer.close()
+
+
+class MatchLog:
+    """
+    Reads a log written by MatchRecorder. column() returns a memoryview of
+    the rows that were written, without copying them.
+    """
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count, capacity, rows = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('{} is not a version {} match log'.format(path, VERSION))
+        self.capacity = capacity
+        self.rows = rows
+
+        self.formats = collections.OrderedDict()
+        for i in range(count):
+            name, fmt = COLUMN.unpack_from(self.buffer, HEADER.size + i * COLUMN.size)
+            self.formats[name.rstrip(b'\0').decode('ascii')] = fmt.decode('ascii')
+
+        offsets, _ = _layout(list(self.formats.values()), capacity)
+        self.columns = {}
+        view = memoryview(self.buffer)
+        for (name, fmt), offset in zip(self.formats.items(), offsets):
+            size = struct.calcsize('<' + fmt)
+            self.columns[name] = view[offset:offset + rows * size].cast(fmt)
+
+    @property
+    def names(self):
+        return list(self.formats)
+
+    def column(self, name):
+        return self.columns[name]
+
+    def row(self, index):
+        return {name: column[index] for name, column in self.columns.items()}
+
+    def __len__(self):
+        return self.rows
+
+    def close(self):
+        for column in self.columns.values():
+            column.release()
+        self.columns = {}
+        self.buffer.close()
+
+
+class ReplaySnapshot:
+    """
+    Stands in for a SensorSnapshot, with the values from one row of a log.
+    update() loads the row set by advance(), so the robot sees each row from
+    the same point in the loop it read its sensors at when it was recorded,
+    and now() returns the logged time, so this can be used as the clock for
+    autonomous commands too.
+
+    talons maps names to the TalonStates the logged Talon readings are
+    loaded into. Pass the robot's own, so the subsystems reading them see
+    the logged values.
+    """
+    def __init__(self, log, talons=None):
+        self.log = log
+        self.next_row = None
+        self.time = 0.0
+        self.game_message = ''
+        self.driver = snapshot.ControllerState()
+        self.operator = snapshot.ControllerState()
+        self.gyro = snapshot.GyroState()
+        self.vision = snapshot.VisionState(None)
+        self.odometry = snapshot.OdometryState()
+        self._odometry_columns = [log.column('odometry_' + field) for field, _ in ODOMETRY_COLUMNS]
+        self._controller_columns = [
+            (state, field, log.column('{}_{}'.format(controller, field)))
+            for controller, state in (('driver', self.driver), ('operator', self.operator))
+            for field, _ in CONTROLLER_COLUMNS
+        ]
+        self.talons = talons if talons is not None else {}
+        self._talon_columns = [
+            (state, field, log.column('{}_{}'.format(name, field)))
+            for name, state in self.talons.items()
+            for field, _ in TALON_COLUMNS
+        ]
+
+    def load(self, row):
+        log = self.log
+        self.time = log.column('time')[row]
+        code = log.column('game_message')[row]
+        self.game_message = autonomous.GAME_MESSAGES[code - 1] if code else ''
+        for state, field, column in self._controller_columns:
+            setattr(state, field, column[row])
+        for state, field, column in self._talon_columns:
+            setattr(state, field, column[row])
+        self.gyro.angle = log.column('gyro_angle')[row]
+        self.gyro.rate = log.column('gyro_rate')[row]
+        vision_id = log.column('vision_id')[row]
+        if vision_id == -1:
+            self.vision.sample = None
+        else:
+            receive_time = log.column('vision_time')[row]
+            self.vision.sample = network.VisionSample(
+                receive_time, receive_time, vision_id, log.column('vision_angle')[row])
+        self.vision.time = self.time
+        self.odometry.load(
+            Pose._make(column[row] for column in self._odometry_columns),
+            log.column('odometry_distance')[row], log.column('odometry_resets')[row])
+
+    def advance(self, row):
+        """
+        Make row the one the next update() loads.
+        """
+        self.next_row = row
+
+    def update(self, controllers=True):
+        # The controllers are loaded with the rest of the row either way
+        if self.next_row is not None:
+            self.load(self.next_row)
+            self.next_row = None
+
+    def now(self):
+        return self.time
+
+
+def replay(robot, log, tolerance=actuators.MOTOR_EPSILON, modes=REPLAYED_MODES):
+    """
+    Runs an initialized robot through a log as fast as it will go, calling
+    the same Init and Periodic methods the robot ran when it was recorded,
+    and returns a Difference for every actuator output in one of modes that
+    doesn't match what was recorded.
+
+    Only what the robot reads from its SensorSnapshot and clock is replayed,
+    so anything read straight from the hardware can make the outputs differ
+    even when the code hasn't changed.
+    """
+    sensors = ReplaySnapshot(log, robot.sensors.talons)
+    robot.sensors = sensors
+    robot.clock = sensors
+    # Autonomous routines hold on to the sensors they were built with
+    robot.routine_table = None
+
+    outputs = [
+        (name[len(OUTPUT_PREFIX):], log.column(name))
+        for name in log.names if name.startswith(OUTPUT_PREFIX)
+    ]
+    recorded_modes = log.column('mode')
+    mode = None
+    differences = []
+    for row in range(len(log)):
+        sensors.advance(row)
+        if recorded_modes[row] != mode:
+            mode = recorded_modes[row]
+            getattr(robot, MODE_NAMES[mode] + 'Init')()
+        getattr(robot, MODE_NAMES[mode] + 'Periodic')()
+        robot.robotPeriodic()
+        # In case nothing read the sensors this loop
+        sensors.update()
+        if mode not in modes:
+            continue
+        for name, recorded in outputs:
+            replayed = robot.actuators.actuators[name].output
+            if abs(replayed - recorded[row]) > tolerance:
+                differences.append(Difference(row, sensors.time, name, recorded[row], replayed))
+    return differences
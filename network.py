@@ -1,11 +1,240 @@
 import json
+import math
+import selectors
 import socket
+import struct
 import time
+from array import array
+from collections import namedtuple
 from threading import Thread
 
 UDP_IP = '10.10.76.2' # 0.0.0.0
 UDP_PORT = 5880
 BUFFER_SIZE = 1024
+# Number of vision samples kept by VisionHistory. At 30 frames per second
+# this is a bit over two seconds of history.
+HISTORY_SIZE = 64
+# Most datagrams read per wakeup before the newest packets are applied, so
+# a flood of packets can't keep the receive thread from ever updating.
+MAX_DRAIN = 64
+
+# Binary vision packets are a fixed layout, little endian struct:
+#   magic (uint16) | version (uint8) | sender (uint8) | id (uint32) | angle (float32)
+# Version 2 appends the latency (float32, seconds) between the frame being
+# captured and the packet being sent.
+# The magic is chosen so the first byte can never be '{', which lets us tell
+# binary packets apart from the old JSON packets by looking at a single byte.
+PACKET_MAGIC = 0x1076
+PACKET_VERSION = 2
+PACKET_HEADER = struct.Struct('<HB')
+PACKET_V1 = struct.Struct('<HBBIf')
+PACKET_V2 = struct.Struct('<HBBIff')
+PACKET_LAYOUTS = {1: PACKET_V1, 2: PACKET_V2}
+
+# Sender codes used by binary packets. JSON packets use the string names.
+SENDER_UNKNOWN = 0
+SENDER_VISION = 1
+SENDERS = {"vision": SENDER_VISION}
+
+JSON_START = ord('{')
+
+
+def encode_packet(packet_id, angle, latency=0.0, sender=SENDER_VISION):
+    """
+    Build a binary vision packet. This is what the coprocessor should send,
+    and is also handy for testing.
+    """
+    return PACKET_V2.pack(PACKET_MAGIC, PACKET_VERSION, sender, packet_id, angle, latency)
+
+
+def decode_packet(data):
+    """
+    Decode a vision packet into a (sender, id, angle, latency) tuple. data may
+    be any bytes-like object, including a memoryview into a receive buffer, and
+    is not copied when it holds a binary packet. Packets that don't carry a
+    latency report it as 0.
+    Packets starting with '{' are treated as the old JSON format, so coprocessor
+    code that hasn't been updated keeps working.
+    Raises ValueError for packets that can't be decoded, including JSON
+    packets with fields of the wrong type, and KeyError for JSON packets
+    that are missing fields.
+    """
+    if len(data) == 0:
+        raise ValueError("Empty vision packet")
+    if data[0] == JSON_START:
+        parsed = json.loads(str(data, 'utf-8'))
+        if not isinstance(parsed, dict):
+            raise ValueError("JSON vision packet is not an object")
+        sender_name = parsed["sender"]
+        if not isinstance(sender_name, str):
+            raise ValueError("Bad vision packet sender: {!r}".format(sender_name))
+        sender = SENDERS.get(sender_name, SENDER_UNKNOWN)
+        if sender == SENDER_UNKNOWN:
+            return sender, None, None, 0.0
+        return (sender,) + _json_fields(parsed["id"], parsed["angle"], parsed.get("latency", 0.0))
+
+    if len(data) < PACKET_HEADER.size:
+        raise ValueError("Vision packet too short ({} bytes)".format(len(data)))
+    magic, version = PACKET_HEADER.unpack_from(data)
+    if magic != PACKET_MAGIC:
+        raise ValueError("Bad vision packet magic: {:#x}".format(magic))
+    layout = PACKET_LAYOUTS.get(version)
+    if layout is None:
+        raise ValueError("Unsupported vision packet version: {}".format(version))
+    if len(data) < layout.size:
+        raise ValueError("Vision packet too short ({} bytes)".format(len(data)))
+    if version == 1:
+        _, _, sender, packet_id, angle = PACKET_V1.unpack_from(data)
+        return sender, packet_id, angle, 0.0
+    _, _, sender, packet_id, angle, latency = PACKET_V2.unpack_from(data)
+    return sender, packet_id, angle, latency
+
+
+def _json_fields(packet_id, angle, latency):
+    # Coerced to the same types a binary packet has, so a coprocessor
+    # sending "angle": "12" can't break VisionHistory
+    try:
+        packet_id = int(packet_id)
+        angle = float(angle)
+        latency = float(latency)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("Bad JSON vision packet fields: {!r}, {!r}, {!r}".format(packet_id, angle, latency))
+    if not 0 <= packet_id <= 0xFFFFFFFF:
+        raise ValueError("Vision packet id out of range: {}".format(packet_id))
+    if not (math.isfinite(angle) and math.isfinite(latency)):
+        raise ValueError("Vision packet angle or latency isn't finite: {}, {}".format(angle, latency))
+    return packet_id, angle, latency
+
+
+VisionSample = namedtuple('VisionSample', ['capture_time', 'receive_time', 'id', 'angle'])
+
+
+class VisionHistory:
+    """
+    A fixed size ring buffer of the most recent vision samples. All of the
+    storage is allocated up front, and samples are stored in parallel arrays
+    so appending a sample doesn't allocate anything.
+
+    Only one thread (the VisionSocket thread) should append samples. Other
+    threads may read at any time; count is only bumped after a sample is fully
+    written, so readers never see a half written sample unless the buffer
+    wraps all the way around while they are reading it.
+
+    Samples are kept in capture time order, which get_angle_at relies on.
+    A sample captured before the newest one (its packet was delayed, or
+    the latency jittered) is rejected and counted in rejected.
+    """
+    def __init__(self, capacity=HISTORY_SIZE):
+        self.capacity = capacity
+        self.capture_times = array('d', [0.0]) * capacity
+        self.receive_times = array('d', [0.0]) * capacity
+        self.ids = array('q', [0]) * capacity
+        self.angles = array('d', [0.0]) * capacity
+        # Total number of samples ever appended. The newest sample lives at
+        # index (count - 1) % capacity.
+        self.count = 0
+        self.rejected = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, capture_time, receive_time, packet_id, angle):
+        """
+        Adds a sample, and returns whether it was kept. See the class
+        docstring for the samples that aren't.
+        """
+        if self.count and capture_time < self.capture_times[(self.count - 1) % self.capacity]:
+            self.rejected += 1
+            return False
+        index = self.count % self.capacity
+        self.capture_times[index] = capture_time
+        self.receive_times[index] = receive_time
+        self.ids[index] = packet_id
+        self.angles[index] = angle
+        self.count += 1
+        return True
+
+    def sample(self, number):
+        """
+        Returns the sample with the given sequence number (0 is the first
+        sample ever appended) as a VisionSample.
+        """
+        index = number % self.capacity
+        return VisionSample(self.capture_times[index], self.receive_times[index],
+                            self.ids[index], self.angles[index])
+
+    def latest(self):
+        """
+        Returns the newest sample, or None if nothing has been received yet.
+        """
+        if self.count == 0:
+            return None
+        return self.sample(self.count - 1)
+
+    def history(self, n):
+        """
+        Returns a view of the newest n samples, newest first. The view reads
+        straight from the ring buffer instead of copying it.
+        """
+        return HistoryView(self, n)
+
+    def get_angle_at(self, t):
+        """
+        Returns the target angle at the time t, linearly interpolating between
+        the two samples captured around t. If t is newer than the newest sample
+        the newest angle is returned. Returns None if there are no samples or t
+        is older than the oldest sample in the buffer.
+        """
+        count = self.count
+        size = min(count, self.capacity)
+        if size == 0:
+            return None
+        capture_times = self.capture_times
+        angles = self.angles
+        capacity = self.capacity
+        newest = (count - 1) % capacity
+        if t >= capture_times[newest]:
+            return angles[newest]
+        if t < capture_times[(count - size) % capacity]:
+            return None
+
+        # Binary search for the first sample captured at or after t
+        low = count - size
+        high = count - 1
+        while low < high:
+            middle = (low + high) // 2
+            if capture_times[middle % capacity] < t:
+                low = middle + 1
+            else:
+                high = middle
+        after = low % capacity
+        if capture_times[after] == t:
+            return angles[after]
+        before = (low - 1) % capacity
+        span = capture_times[after] - capture_times[before]
+        fraction = (t - capture_times[before]) / span
+        return angles[before] + (angles[after] - angles[before]) * fraction
+
+
+class HistoryView:
+    """
+    A read only, newest first view of the last n samples in a VisionHistory.
+    Samples are read out of the ring buffer as they are indexed.
+    """
+    def __init__(self, history, n):
+        self.history = history
+        self.newest = history.count - 1
+        self.size = max(0, min(n, len(history)))
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.size
+        if not 0 <= i < self.size:
+            raise IndexError("history index out of range")
+        return self.history.sample(self.newest - i)
 
 class MockSocket(Thread):
     def __init__(self):
@@ -20,6 +249,16 @@ class MockSocket(Thread):
     def get_angle(self, max_staleness):
         return 15
 
+    def get_angle_at(self, t):
+        return 15
+
+    def latest_sample(self):
+        now = time.time()
+        return VisionSample(now, now, self.get_id(), self.get_angle(0))
+
+    def history(self, n):
+        return ()
+
     def is_bound(self):
         print("WARNING: This is a mock socket!")
         return True
@@ -36,18 +275,26 @@ class VisionSocket(Thread):
     The VisionSocket reads from a socket, processing incoming packets from
     the vision sensor.
     """
-    def __init__(self):
+    def __init__(self, ip=UDP_IP, port=UDP_PORT):
         Thread.__init__(self)
         self.bound = False
+        self.closed = False
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        self.socket.settimeout(0.1) # Timeout after 0.1 seconds
+        self.socket.setblocking(False)
+        # Writing to wakeup_send wakes the receive thread up from select()
+        # so close() doesn't have to wait for a packet or a timeout.
+        self.wakeup_receive, self.wakeup_send = socket.socketpair()
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.socket, selectors.EVENT_READ)
+        self.selector.register(self.wakeup_receive, selectors.EVENT_READ)
         try:
-            self.socket.bind((UDP_IP, UDP_PORT))
+            self.socket.bind((ip, port))
             self.bound = True
         except IOError as e:
             print("Could not bind: {}".format(e))
         self.last_packet_time = time.time()
         self.angle = None
+        self.samples = VisionHistory()
         self.running = True
         # Marks that this thread is a Daemon, meaning the thread will be killed
         # automatically when the main thread exits. This is done to prevent pytest
@@ -55,33 +302,93 @@ class VisionSocket(Thread):
         # can't seem to figure out how to make threads exit as a non-daemon thread)
         self.daemon = True
         self.packet_id = -1 # -1 is never a valid packet ID
+        # Packets are received straight into this buffer with recv_into, so
+        # the receive loop doesn't allocate a new bytes object per datagram.
+        self.buffer = bytearray(BUFFER_SIZE)
+        self.buffer_view = memoryview(self.buffer)
+        # "binary" or "json", whichever format the last packet was sent in.
+        self.packet_format = None
+        # Newest decoded packet per sender, filled while draining the socket
+        self.pending = {}
 
+        # Receive statistics, useful for debugging the vision link
+        self.received_packets = 0
+        # Packets skipped because a newer one from the same sender was queued
+        self.dropped_packets = 0
+        self.bad_packets = 0
+        # Number of datagrams that were queued up on the last/busiest wakeup
+        self.last_backlog = 0
+        self.max_backlog = 0
 
     """
     Called as part of the Thread API. Don't call this yourself, use start()
     instead to start the thread.
     """
     def run(self):
-        while self.running:
-            try:
-                data = self.socket.recv(BUFFER_SIZE)
-                self._read_packet(data)
-            except IOError as e:
-                pass
-            except KeyError as e:
-                print(e)
+        try:
+            while self.running:
+                for key, _ in self.selector.select():
+                    if key.fileobj is self.socket:
+                        self._drain()
+        finally:
+            self._close_sockets()
         print("good bye sockets")
 
+    """
+    Read every datagram queued on the socket, keeping only the newest packet
+    from each sender, then apply those packets.
+    """
+    def _drain(self):
+        pending = self.pending
+        backlog = 0
+        while backlog < MAX_DRAIN:
+            try:
+                size = self.socket.recv_into(self.buffer)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                print("Vision socket error: {}".format(e))
+                break
+            backlog += 1
+            data = self.buffer_view[:size]
+            try:
+                packet = decode_packet(data)
+            except (KeyError, TypeError, ValueError) as e:
+                self.bad_packets += 1
+                print("Bad vision packet: {}".format(e))
+                continue
+            self.packet_format = "json" if data[0] == JSON_START else "binary"
+            if packet[0] in pending:
+                self.dropped_packets += 1
+            pending[packet[0]] = packet
+
+        self.received_packets += backlog
+        self.last_backlog = backlog
+        if backlog > self.max_backlog:
+            self.max_backlog = backlog
+        for packet in pending.values():
+            self._apply_packet(packet)
+        pending.clear()
+
     """
     Read a packet from the socket, and
     updating the relevant values from said packets.
+    data may be either a binary or a JSON packet, see decode_packet.
     """
     def _read_packet(self, data):
-        parsed = json.loads(data.decode())
-        if parsed["sender"] == "vision":
-            self.angle = parsed["angle"]
-            self.packet_id = parsed["id"]
-        self.last_packet_time = time.time()
+        packet = decode_packet(data)
+        self.packet_format = "json" if data[0] == JSON_START else "binary"
+        self._apply_packet(packet)
+
+    def _apply_packet(self, packet):
+        sender, packet_id, angle, latency = packet
+        receive_time = time.time()
+        # A sample captured before the newest one is out of date already
+        if sender == SENDER_VISION and self.samples.append(
+                receive_time - latency, receive_time, packet_id, angle):
+            self.angle = angle
+            self.packet_id = packet_id
+        self.last_packet_time = receive_time
 
 
     """
@@ -95,6 +402,26 @@ class VisionSocket(Thread):
             # print("Stale data! {}".format(time.time() - self.last_packet_time))
             return None
 
+    """
+    Returns the target angle at the time t (as given by time.time()), using
+    the capture times of the frames rather than when the packets arrived.
+    See VisionHistory.get_angle_at.
+    """
+    def get_angle_at(self, t):
+        return self.samples.get_angle_at(t)
+
+    """
+    Returns the newest VisionSample, or None if none have been received.
+    """
+    def latest_sample(self):
+        return self.samples.latest()
+
+    """
+    Returns the newest n VisionSamples, newest first, without copying them.
+    """
+    def history(self, n):
+        return self.samples.history(n)
+
     def get_id(self):
         return self.packet_id
 
@@ -105,11 +432,28 @@ class VisionSocket(Thread):
         return self.bound
 
     """
-    Close the vision socket and end the thread. Should be called only once(?)
+    Close the vision socket and end the thread. The thread is woken up right
+    away instead of waiting for the next packet. Safe to call more than once.
     """
     def close(self):
-        self.socket.close()
         self.running = False
+        if self.is_alive():
+            # The thread closes the sockets itself once it wakes up
+            try:
+                self.wakeup_send.send(b'\0')
+            except OSError:
+                pass
+        else:
+            self._close_sockets()
+
+    def _close_sockets(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.selector.close()
+        self.socket.close()
+        self.wakeup_receive.close()
+        self.wakeup_send.close()
 
 """
 Builds a RotateAutonomous object which attempts to rotate towards the target.
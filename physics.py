@@ -0,0 +1,57 @@
+"""
+Moves the robot in the pyfrc simulator from the Talon outputs, using the
+model in simulation.py. pyfrc loads this automatically when the robot is
+run with `python3 robot.py sim`, and the tests use it too.
+"""
+import math
+
+import ctre
+
+import simulation
+from robot import ELEVATOR_ID, FEET_PER_COUNT, LEFT1_ID, RIGHT1_ID, SHIFTER_HIGH_CHANNEL
+from subsystems.elevator import COUNTS_PER_FOOT
+
+
+class PhysicsEngine:
+    """
+    Simulates the drivetrain (in either gear), gyro, drive encoders and
+    elevator, including the elevator's encoder, limit switches and Motion
+    Magic.
+    """
+    def __init__(self, physics_controller):
+        self.physics_controller = physics_controller
+        self.physics_controller.add_device_gyro_channel('adxrs450_spi_0_angle')
+        self.model = simulation.DriveModel(1)
+
+    def update_sim(self, hal_data, now, tm_diff):
+        can = hal_data['CAN']
+        # DifferentialDrive inverts the right side, so forwards is negative
+        left = can[LEFT1_ID]['value']
+        right = -can[RIGHT1_ID]['value']
+        elevator = can[ELEVATOR_ID]
+
+        model = self.model
+        # The shifter's reverse channel puts it in high gear
+        model.high_gear[0] = hal_data['pcm'][0][SHIFTER_HIGH_CHANNEL]['value']
+        if elevator['control_mode'] == ctre.ControlMode.MotionMagic:
+            output = simulation.elevator_output(elevator['value'] / COUNTS_PER_FOOT, model.elevator[0])
+        else:
+            output = elevator['value']
+        model.step(left, right, output, tm_diff)
+
+        # This moves the robot on the field display and turns the gyro
+        speed = (model.left_speed[0] + model.right_speed[0]) / 2
+        self.physics_controller.drive(speed, math.radians(model.rate[0]), tm_diff)
+
+        # The encoders are on the first Talon of each side, and the right one
+        # counts backwards, see Robot.robotInit
+        can[LEFT1_ID]['quad_position'] = int(model.left_distance[0] / FEET_PER_COUNT)
+        can[RIGHT1_ID]['quad_position'] = int(-model.right_distance[0] / FEET_PER_COUNT)
+        # Speeds are in counts per 100 ms
+        can[LEFT1_ID]['quad_velocity'] = int(model.left_speed[0] / FEET_PER_COUNT / 10)
+        can[RIGHT1_ID]['quad_velocity'] = int(-model.right_speed[0] / FEET_PER_COUNT / 10)
+
+        height = model.elevator[0]
+        elevator['quad_position'] = int(height * COUNTS_PER_FOOT)
+        elevator['limit_switch_closed_rev'] = bool(height <= 0)
+        elevator['limit_switch_closed_for'] = bool(height >= model.elevator_height)
@@ -1,24 +1,27 @@
+import atexit
+import math
+import os
+
 import ctre
 import wpilib
 from networktables import NetworkTables
 from wpilib import DoubleSolenoid, SmartDashboard
-from wpilib.interfaces import GenericHID
 
+import actuators
 import autonomous
+import looptiming
+import matchlog
 import network
-from subsystems.drivetrain import Drivetrain
+import shaping
+import snapshot
+import telemetry
+import trajectory
+from subsystems.drivetrain import AutoShifter, Drivetrain
 from subsystems.elevator import Elevator
 from subsystems.grabber import Grabber
+from subsystems.odometry import Odometry
 from subsystems.wings import Wings
 
-# Left and right sides for the Xbox Controller
-# Note that these dont' referr to just the sticks, but more generally
-# Refer to the left and right features of the controller.
-# Ex: LEFT may refer to the actual left joystick, the left trigger,
-# or left bumper.
-LEFT = GenericHID.Hand.kLeft
-RIGHT = GenericHID.Hand.kRight
-
 # @TODO: Actually have motor IDs for these
 ELEVATOR_ID = 5
 LEFT_GRABBER_ID = 6
@@ -31,49 +34,103 @@ LEFT2_ID = 4
 RIGHT1_ID = 1
 RIGHT2_ID = 2
 
+# @TODO: Find actual non-placeholder values for the shifter's channels
+SHIFTER_LOW_CHANNEL = 6
+SHIFTER_HIGH_CHANNEL = 7
+
 # If you modify this key, also update the value in index.html!
 SIDE_SELECTOR = "side_selector"
 
+# If you modify this key, also update the value in index.html!
+PROFILE_SELECTOR = "driver_profile"
+# Deadbands, curves and slew rates for the sticks, see shaping.py
+DRIVER_PROFILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'driver_profiles.json')
+
+# How often (in loops) robotPeriodic publishes diagnostics
+TELEMETRY_PERIOD = 50
+TELEMETRY_LOG = '/home/lvuser/telemetry.log'
+PROFILE_CACHE = '/home/lvuser/profiles.json'
+MATCH_LOG_DIR = '/home/lvuser/matchlogs'
+
+# The controller fields teleop uses; the rest are never read
+DRIVER_FIELDS = (
+    'right_y', 'left_x', 'left_trigger', 'right_trigger', 'pov',
+    'a_button', 'x_button', 'y_button',
+)
+OPERATOR_FIELDS = (
+    'right_y', 'left_trigger', 'right_trigger', 'pov',
+    'a_button', 'x_button', 'y_button', 'left_bumper', 'right_bumper',
+)
+
+# @TODO: Check these against the real drivetrain
+# 6 inch wheels, with a 4096 count per revolution encoder on the wheel shaft
+WHEEL_DIAMETER = 0.5 # feet
+ENCODER_COUNTS_PER_REV = 4096
+FEET_PER_COUNT = math.pi * WHEEL_DIAMETER / ENCODER_COUNTS_PER_REV
+
 class Robot(wpilib.IterativeRobot):
     def robotInit(self):
-        left1 = ctre.WPI_TalonSRX(LEFT1_ID)
-        left2 = ctre.WPI_TalonSRX(LEFT2_ID)
+        # Every motor and solenoid goes through a CachedActuator, which skips
+        # writes that wouldn't change anything to save CAN traffic.
+        self.actuators = actuators.ActuatorBank()
+
+        left1 = self._motor('left1', ctre.WPI_TalonSRX(LEFT1_ID))
+        left2 = self._motor('left2', ctre.WPI_TalonSRX(LEFT2_ID))
         left = wpilib.SpeedControllerGroup(left1, left2)
         left1.setNeutralMode(ctre.NeutralMode.Brake)
         left2.setNeutralMode(ctre.NeutralMode.Brake)
 
-        right1 = ctre.WPI_TalonSRX(RIGHT1_ID)
-        right2 = ctre.WPI_TalonSRX(RIGHT2_ID)
+        right1 = self._motor('right1', ctre.WPI_TalonSRX(RIGHT1_ID))
+        right2 = self._motor('right2', ctre.WPI_TalonSRX(RIGHT2_ID))
         right = wpilib.SpeedControllerGroup(right1, right2)
         right1.setNeutralMode(ctre.NeutralMode.Brake)
         right2.setNeutralMode(ctre.NeutralMode.Brake)
 
+        shifter = self._solenoid('shifter', wpilib.DoubleSolenoid(SHIFTER_LOW_CHANNEL, SHIFTER_HIGH_CHANNEL))
+        self.drivetrain = Drivetrain(left, right, shifter)
 
-        self.drivetrain = Drivetrain(left, right, None)
-
-        self.grabber = Grabber(
-            ctre.WPI_TalonSRX(LEFT_GRABBER_ID),
-            ctre.WPI_TalonSRX(RIGHT_GRABBER_ID),
-            None,
-        )
-
-        self.elevator = Elevator(ctre.WPI_TalonSRX(ELEVATOR_ID))
+        left_grabber = ctre.WPI_TalonSRX(LEFT_GRABBER_ID)
+        right_grabber = ctre.WPI_TalonSRX(RIGHT_GRABBER_ID)
+        elevator_talon = ctre.WPI_TalonSRX(ELEVATOR_ID)
 
         # @TODO: Find actual non-placeholder values for the channel IDs
         self.wings = Wings(
-            wpilib.DoubleSolenoid(2, 3),
-            wpilib.DoubleSolenoid(4, 5),
+            self._solenoid('left_wing', wpilib.DoubleSolenoid(2, 3)),
+            self._solenoid('right_wing', wpilib.DoubleSolenoid(4, 5)),
         )
 
-        self.brake = wpilib.DoubleSolenoid(0, 1)
+        self.brake = self._solenoid('brake', wpilib.DoubleSolenoid(0, 1))
 
         self.driver = wpilib.XboxController(0)
         self.operator = wpilib.XboxController(1)
 
         self.auto_exec = iter([])
 
+        # Solve the autonomous motion profiles now (or load them from the
+        # cache) so it never happens while the robot is moving.
+        trajectory.load(PROFILE_CACHE if Robot.isReal() else None)
+
+        # Autonomous routines for every game message, see disabledPeriodic
+        self.routine_table = None
+        self.routine_position = None
+        self.default_routine = None
+        # Replaced with the log's clock when a match log is replayed
+        self.clock = autonomous.WALL_CLOCK
+        self.mode = matchlog.DISABLED
+
         self.gyro = wpilib.ADXRS450_Gyro()
 
+        # The encoders are plugged into the first Talon on each side. The
+        # right side is reversed, since its motors spin the other way.
+        left1.configSelectedFeedbackSensor(ctre.FeedbackDevice.QuadEncoder, 0, 10)
+        right1.configSelectedFeedbackSensor(ctre.FeedbackDevice.QuadEncoder, 0, 10)
+        self.odometry = Odometry(
+            self.gyro,
+            lambda: left1.getSelectedSensorPosition(0) * FEET_PER_COUNT,
+            lambda: -right1.getSelectedSensorPosition(0) * FEET_PER_COUNT,
+        )
+        self.odometry.start()
+
         # Use a mock socket in tests instead of a real one because we can't
         # actually bind to a port when testing the code.
         if Robot.isReal():
@@ -82,45 +139,198 @@ class Robot(wpilib.IterativeRobot):
             self.vision_socket = network.MockSocket()
 
         self.vision_socket.start()
+        # The socket only binds once, when it is created
+        self.vision_bound = self.vision_socket.is_bound()
         self.timer = 0
 
+        # Every sensor and controller is read once per loop into this
+        # snapshot, and everything else reads from it. Autonomous commands
+        # get the snapshot's gyro, vision and odometry in place of the real
+        # ones, and subsystems read their Talons' sensors from it.
+        self.sensors = snapshot.SensorSnapshot(
+            self.driver, self.operator, self.gyro, self.vision_socket,
+            wpilib.DriverStation.getInstance(),
+            # The Talons themselves, so reading them skips the wrappers
+            talons={
+                'left_drive': left1.device,
+                'right_drive': right1.device,
+                'elevator': elevator_talon,
+                'left_grabber': left_grabber,
+                'right_grabber': right_grabber,
+            },
+            driver_fields=DRIVER_FIELDS,
+            operator_fields=OPERATOR_FIELDS,
+            odometry=self.odometry)
+        talons = self.sensors.talons
+
+        self.elevator = Elevator(self._motor('elevator', elevator_talon), talons['elevator'])
+        self.elevator.configure()
+
+        # The robot's clock is looked up each time, since a replay swaps it
+        self.grabber = Grabber(
+            self._motor('left_grabber', left_grabber),
+            self._motor('right_grabber', right_grabber),
+            None,
+            clock=lambda: self.clock.now(),
+            current=lambda: (talons['left_grabber'].current + talons['right_grabber'].current) / 2,
+        )
+
+        # The Talons give speeds in counts per 100 ms
+        self.auto_shifter = AutoShifter(
+            self.drivetrain,
+            lambda: (talons['left_drive'].velocity - talons['right_drive'].velocity)
+            / 2 * FEET_PER_COUNT * 10,
+            clock=lambda: self.clock.now(),
+        )
+
         self.sd = NetworkTables.getTable('SmartDashboard')
 
+        # Diagnostics are formatted and sent by a background thread so the
+        # control loop never blocks on console or network I/O.
+        self.telemetry = telemetry.Telemetry(
+            NetworkTables.getTable('Telemetry'),
+            log_path=TELEMETRY_LOG if Robot.isReal() else None,
+        )
+        self.telemetry.start()
+        # Stop the thread before NetworkTables goes away rather than relying
+        # on __del__, which may run late or not at all
+        wpilib.Resource._add_global_resource(self.telemetry)
+        atexit.register(self.telemetry.free)
+        self.telemetry.put('vision_bound', self.vision_bound)
+        # Turned into a dict by the telemetry thread rather than every
+        # TELEMETRY_PERIOD loops on this one
+        self.saved_writes = telemetry.Deferred(self.actuators.saved_writes)
+
         self.chooser = wpilib.SendableChooser()
         self.chooser.addObject('left', autonomous.Position.LEFT)
         self.chooser.addObject('right', autonomous.Position.RIGHT)
         self.chooser.addObject('center', autonomous.Position.CENTER)
         SmartDashboard.putData(SIDE_SELECTOR, self.chooser)
 
+        # The first profile in the file is the default
+        self.profile_chooser = wpilib.SendableChooser()
+        for i, profile in enumerate(shaping.load_profiles(DRIVER_PROFILES).values()):
+            if i == 0:
+                self.profile_chooser.addDefault(profile.name, profile)
+                self.profile = profile
+            else:
+                self.profile_chooser.addObject(profile.name, profile)
+        SmartDashboard.putData(PROFILE_SELECTOR, self.profile_chooser)
+
+        # Every loop's inputs and outputs are recorded so a match can be
+        # replayed afterwards, see matchlog.replay.
+        if Robot.isReal():
+            self.recorder = matchlog.MatchRecorder(
+                matchlog.next_log_path(MATCH_LOG_DIR),
+                matchlog.robot_columns(self.actuators, self.sensors.talons))
+        else:
+            self.recorder = None
+
+        # Timing for each periodic method and the subsystem calls inside them.
+        # The phases are created once here so timing them each loop is cheap.
+        self.loop_timer = looptiming.LoopTimer(self.telemetry)
+        budget = looptiming.LOOP_PERIOD
+        self.robot_periodic_timer = self.loop_timer.phase('robotPeriodic', budget)
+        self.teleop_periodic_timer = self.loop_timer.phase('teleopPeriodic', budget)
+        self.autonomous_periodic_timer = self.loop_timer.phase('autonomousPeriodic', budget)
+        self.drivetrain_timer = self.loop_timer.phase('drivetrain')
+        self.elevator_timer = self.loop_timer.phase('elevator')
+        self.wings_timer = self.loop_timer.phase('wings')
+        self.grabber_timer = self.loop_timer.phase('grabber')
+        self.vision_timer = self.loop_timer.phase('vision')
+
+    def _motor(self, name, motor):
+        return self.actuators.add(name, actuators.CachedActuator(motor, actuators.MOTOR_EPSILON))
+
+    def _solenoid(self, name, solenoid):
+        return self.actuators.add(name, actuators.CachedActuator(solenoid, refresh_period=None))
+
     def robotPeriodic(self):
-        if self.timer % 1000 == 0:
-            print(self.vision_socket.get_angle(1.0))
-            print("ID: ", self.vision_socket.get_id())
-            print("is bound: ", self.vision_socket.is_bound())
-            print("choosen: ", self.chooser.getSelected())
-            game_message = wpilib.DriverStation.getInstance().getGameSpecificMessage()
-            print("game msg: ", autonomous.get_game_specific_message(game_message))
-            print("routine: ", autonomous.get_routine(self.chooser.getSelected(), autonomous.get_game_specific_message(game_message)))
-        self.timer += 1
+        with self.robot_periodic_timer:
+            if self.timer % TELEMETRY_PERIOD == 0:
+                with self.vision_timer:
+                    self.telemetry.put('vision_angle', self.sensors.vision.get_angle(1.0))
+                    self.telemetry.put('vision_id', self.sensors.vision.get_id())
+                chosen = self.chooser.getSelected()
+                switch_position = autonomous.get_game_specific_message(self.sensors.game_message)
+                self.telemetry.put('chosen', chosen)
+                self.telemetry.put('game_message', switch_position)
+                self.telemetry.put('routine', autonomous.get_routine(chosen, switch_position))
+                self.telemetry.put('can_utilization', self.actuators.can_utilization())
+                self.telemetry.put('saved_writes', self.saved_writes)
+                self.telemetry.put('grabber', self.grabber.state.value)
+                self.telemetry.put('has_cube', self.grabber.has_cube())
+            self.timer += 1
+            if self.recorder is not None:
+                self.recorder.record(self)
+        # robotPeriodic runs after the mode's periodic method, so this is the
+        # end of the loop.
+        self.loop_timer.end_loop()
 
     def teleopInit(self):
         print("Teleop Init Begin!")
+        # For practice, where teleop starts without autonomous
+        self._start_match()
+        self.profile = self.profile_chooser.getSelected() or self.profile
+        self.profile.reset()
+        self.auto_shifter.reset()
+        # Stay wherever autonomous left the elevator
+        self.elevator.hold()
 
     def teleopPeriodic(self):
-        # @Todo: Deadzone these
-        forward = self.driver.getY(RIGHT)
-        rotate = self.driver.getX(LEFT)
-
-        if self.driver.getXButton():
-            self.drivetrain.stop()
-        else:
-            self.drivetrain.arcade_drive(forward, rotate)
-
-        self.elevator.go_up(self.operator.getY(RIGHT))
-
-        if self.operator.getPOV() != -1 and self.driver.getPOV() != -1:
-            op_pov = self.operator.getPOV()
-            driver_pov = self.driver.getPOV()
+        self.loop_timer.start_loop()
+        self.mode = matchlog.TELEOP
+        with self.teleop_periodic_timer:
+            self.sensors.update()
+            self.elevator.update()
+            self.grabber.update()
+            self._teleop()
+
+    def _teleop(self):
+        driver = self.sensors.driver
+        operator = self.sensors.operator
+        profile = self.profile
+
+        with self.drivetrain_timer:
+            if driver.x_button:
+                self.drivetrain.stop()
+                profile.forward.reset()
+                profile.rotate.reset()
+                forward = 0.0
+            else:
+                # The profile does the shaping that squaring the inputs did
+                forward = profile.forward.shape(driver.right_y)
+                rotate = profile.rotate.shape(driver.left_x)
+                self.drivetrain.arcade_drive(forward, rotate, squared=False)
+
+            # Holding a trigger keeps the drivetrain in that gear, otherwise
+            # it shifts by itself
+            if driver.left_trigger > profile.trigger_level:
+                gear = Drivetrain.LOW_GEAR
+            elif driver.right_trigger > profile.trigger_level:
+                gear = Drivetrain.HIGH_GEAR
+            else:
+                gear = None
+            self.auto_shifter.update(forward, gear)
+
+        with self.elevator_timer:
+            # The stick drives the elevator by hand, and takes over from the
+            # presets. Once it's let go the elevator holds where it is.
+            manual = profile.elevator.shape(operator.right_y)
+            if manual != 0:
+                self.elevator.go_up(manual)
+            elif operator.left_bumper:
+                self.elevator.go_to(Elevator.GROUND)
+            elif operator.x_button:
+                self.elevator.go_to(Elevator.SWITCH)
+            elif operator.right_bumper:
+                self.elevator.go_to(Elevator.SCALE)
+            elif self.elevator.setpoint is None:
+                self.elevator.hold()
+
+        op_pov = operator.pov
+        driver_pov = driver.pov
+        if op_pov != -1 and driver_pov != -1:
             left_wing_up = (
                 (op_pov < 20 or 340 < op_pov) and
                 (driver_pov < 20 or 340 < driver_pov)
@@ -130,65 +340,108 @@ class Robot(wpilib.IterativeRobot):
             left_wing_up = False
             left_wing_down = False
 
-        right_wing_up = self.operator.getYButton() and self.driver.getYButton()
-        right_wing_down = self.operator.getAButton() and self.driver.getAButton()
-
-        if left_wing_up:
-            self.wings.raise_left()
-            self.brake.set(DoubleSolenoid.Value.kReverse)
-        if left_wing_down:
-            self.wings.lower_left()
-            self.brake.set(DoubleSolenoid.Value.kForward)
-        if right_wing_up:
-            self.wings.raise_right()
-            self.brake.set(DoubleSolenoid.Value.kReverse)
-        if right_wing_down:
-            self.wings.lower_right()
-            self.brake.set(DoubleSolenoid.Value.kForward)
-
-        left_trigger = self.operator.getTriggerAxis(LEFT)
-        right_trigger = self.operator.getTriggerAxis(RIGHT)
-        TRIGGER_LEVEL = 0.4
-        if right_trigger > TRIGGER_LEVEL and left_trigger > TRIGGER_LEVEL:
-            self.grabber.spit(min(right_trigger, left_trigger))
-        elif right_trigger > TRIGGER_LEVEL or left_trigger > TRIGGER_LEVEL:
-            self.grabber.absorb(max(right_trigger, left_trigger))
+        right_wing_up = operator.y_button and driver.y_button
+        right_wing_down = operator.a_button and driver.a_button
+
+        with self.wings_timer:
+            if left_wing_up:
+                self.wings.raise_left()
+                self.brake.set(DoubleSolenoid.Value.kReverse)
+            if left_wing_down:
+                self.wings.lower_left()
+                self.brake.set(DoubleSolenoid.Value.kForward)
+            if right_wing_up:
+                self.wings.raise_right()
+                self.brake.set(DoubleSolenoid.Value.kReverse)
+            if right_wing_down:
+                self.wings.lower_right()
+                self.brake.set(DoubleSolenoid.Value.kForward)
+
+        left_trigger = operator.left_trigger
+        right_trigger = operator.right_trigger
+        trigger_level = profile.trigger_level
+        with self.grabber_timer:
+            # The intake stops by itself and holds the cube once it's in
+            if right_trigger > trigger_level and left_trigger > trigger_level:
+                self.grabber.eject(min(right_trigger, left_trigger))
+            elif right_trigger > trigger_level or left_trigger > trigger_level:
+                self.grabber.intake(max(right_trigger, left_trigger))
+            else:
+                self.grabber.release()
+
+    def disabledInit(self):
+        # Routines are used up once they run, so build new ones
+        self.routine_table = None
+
+    def disabledPeriodic(self):
+        self.loop_timer.start_loop()
+        self.mode = matchlog.DISABLED
+        self.sensors.update(controllers=False)
+        self.elevator.update()
+        self.grabber.update()
+        # Build every routine while we have time to spare, so that starting
+        # autonomous doesn't cost anything. They are rebuilt whenever the
+        # starting position on the dashboard changes.
+        robot_position = self.chooser.getSelected() or autonomous.Position.CENTER
+        if self.routine_table is None or robot_position != self.routine_position:
+            self._build_routines(robot_position)
+
+    def _build_routines(self, robot_position):
+        self.routine_position = robot_position
+        self.routine_table, self.default_routine = autonomous.build_routine_table(
+            robot_position, self.drivetrain, self.sensors.gyro, self.sensors.vision,
+            self.elevator, self.grabber, self.sensors.odometry, self.clock)
 
     def autonomousInit(self):
-        print("Autonomous Begin!")
         # The game specific message is only given once autonomous starts
         # It is not avaliable during disable mode before the game starts
         # and it is not useful in teleop mode, so we only get the message here.
-        game_message = wpilib.DriverStation.getInstance().getGameSpecificMessage()
-        switch_position = autonomous.get_game_specific_message(game_message)
-        robot_position = autonomous.Position.CENTER # TODO: have an actual way to set this outside of the program
-        routine = autonomous.get_routine(robot_position=robot_position, switch_position=switch_position)
-        print("Switch Position: ", switch_position)
-
-        if routine == autonomous.AutonomousRoutine.CENTER:
-            self.auton = autonomous.center_to_switch(self.drivetrain, self.gyro, self.vision_socket, switch_position)
-        elif routine == autonomous.AutonomousRoutine.SIDE_TO_SAME:
-            self.auton = autonomous.switch_same_side(self.drivetrain, self.gyro, self.vision_socket, switch_position)
-        elif routine == autonomous.AutonomousRoutine.SIDE_TO_OPPOSITE:
-            self.auton = autonomous.switch_opposite_side(self.drivetrain, self.gyro, self.vision_socket, switch_position)
-        else:
-            # Default to the center autonomous
-            self.auton = autonomous.center_to_switch(self.drivetrain, self.gyro, self.vision_socket, switch_position)
-
+        # Reset before starting the routine, since commands read where the
+        # robot is when they start. Resetting first means the snapshot
+        # already has the new pose.
+        self.odometry.reset()
+        self.sensors.update(controllers=False)
+        game_message = self.sensors.game_message
+        if self.routine_table is None:
+            # Only happens if we never went through disabled mode
+            self._build_routines(self.chooser.getSelected() or autonomous.Position.CENTER)
+        command = self.routine_table.get(game_message, self.default_routine)
+        self.routine_table = None
+        self.auton = command.run()
+        self._start_match()
+        # The motion profiles are planned for low gear
+        self.drivetrain.shift_low()
+        self.telemetry.put('auto_game_message', game_message)
+
+
+    def _start_match(self):
+        # Keep the match log from filling up with time spent disabled
+        if self.recorder is not None:
+            self.recorder.start_match()
 
     def autonomousPeriodic(self):
-        try:
-            next(self.auton)
-        except StopIteration:
-            # WPILib prints a ton of error messages when the motor has no output
-            # send to it, so we stop the drivetrain to make it quiet. Also,
-            # this ensures that we actually stop at the end of autonomous instead
-            # of potentially running away for no reason.
-            self.drivetrain.stop()
+        self.loop_timer.start_loop()
+        self.mode = matchlog.AUTONOMOUS
+        with self.autonomous_periodic_timer:
+            self.sensors.update(controllers=False)
+            self.elevator.update()
+            self.grabber.update()
+            try:
+                next(self.auton)
+            except StopIteration:
+                # WPILib prints a ton of error messages when the motor has no output
+                # send to it, so we stop the drivetrain to make it quiet. Also,
+                # this ensures that we actually stop at the end of autonomous instead
+                # of potentially running away for no reason.
+                self.drivetrain.stop()
 
     # Close the socket when the main process ends.
     def __del__(self):
         self.vision_socket.close()
+        self.odometry.stop()
+        self.telemetry.free()
+        if self.recorder is not None:
+            self.recorder.close()
 
 
 if __name__ == '__main__':
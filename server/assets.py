@@ -0,0 +1,150 @@
+'''
+    Serves the dashboard's static files so browsers only download them once.
+
+    At startup every file in www is read into memory, along with gzip (and
+    brotli, if it's installed) versions of it. Everything but the HTML pages
+    is also served under a name with a hash of its contents in it, e.g.
+    jquery.3f2a9c1b0d4e.js, with headers telling the browser to cache it
+    forever. The HTML pages are rewritten to use those names and are never
+    cached, so reloading a page only downloads the page itself, and a changed
+    file gets a new name the browser hasn't cached.
+'''
+
+import collections
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+
+import tornado.web
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger('assets')
+
+HASH_LENGTH = 12
+HTML_EXTENSIONS = ('.html', '.htm')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+NO_CACHE = 'no-cache'
+
+# src="..." and href="..." attributes in the HTML pages
+LINK = re.compile(r'''\b(src|href)=(["'])([^"']+)\2''')
+
+Asset = collections.namedtuple('Asset', ('content_type', 'cache_control', 'etag', 'encodings'))
+
+
+def compress(content):
+    '''
+        Returns the encodings worth sending for content, best first, as a
+        list of (Content-Encoding, body). The uncompressed body is always
+        last.
+    '''
+    encodings = []
+    if brotli is not None:
+        encodings.append(('br', brotli.compress(content)))
+    encodings.append(('gzip', gzip.compress(content, 9)))
+    encodings = [(name, body) for name, body in encodings if len(body) < len(content)]
+    encodings.append((None, content))
+    return encodings
+
+
+def hashed_name(path, content):
+    digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+    root, extension = os.path.splitext(path)
+    return '{}.{}{}'.format(root, digest, extension)
+
+
+def _asset(path, content, cache_control):
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    etag = '"{}"'.format(hashlib.sha256(content).hexdigest()[:HASH_LENGTH])
+    return Asset(content_type, cache_control, etag, compress(content))
+
+
+def load_assets(www_dir):
+    '''
+        Returns a dict of URL path (relative to www_dir) to Asset for every
+        file in www_dir.
+    '''
+    files = {}
+    for root, _, names in os.walk(www_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, 'rb') as f:
+                files[os.path.relpath(path, www_dir).replace(os.sep, '/')] = f.read()
+
+    assets = {}
+    renames = {}
+    for path, content in files.items():
+        if path.endswith(HTML_EXTENSIONS):
+            continue
+        renames[path] = hashed_name(path, content)
+        assets[renames[path]] = _asset(path, content, IMMUTABLE)
+        # Keep the plain name working for anything that isn't rewritten,
+        # like a file loaded from javascript, but don't let it be cached.
+        assets[path] = _asset(path, content, NO_CACHE)
+
+    for path, content in files.items():
+        if not path.endswith(HTML_EXTENSIONS):
+            continue
+        directory = os.path.dirname(path)
+
+        def rename(match):
+            target = os.path.normpath(os.path.join(directory, match.group(3))).replace(os.sep, '/')
+            if target not in renames:
+                return match.group(0)
+            link = os.path.relpath(renames[target], directory or '.').replace(os.sep, '/')
+            return '{}={}{}{}'.format(match.group(1), match.group(2), link, match.group(2))
+
+        html = LINK.sub(rename, content.decode('utf-8')).encode('utf-8')
+        assets[path] = _asset(path, html, NO_CACHE)
+
+    logger.info("Loaded %s assets from %s", len(files), www_dir)
+    return assets
+
+
+class AssetHandler(tornado.web.RequestHandler):
+    '''
+        Serves assets from load_assets, in the best encoding the browser
+        accepts. Pass default to serve a page for the empty path.
+    '''
+
+    def initialize(self, assets, default=None):
+        self.assets = assets
+        self.default = default
+
+    def head(self, path):
+        self.get(path, include_body=False)
+
+    def get(self, path, include_body=True):
+        asset = self.assets.get(path or self.default)
+        if asset is None:
+            raise tornado.web.HTTPError(404)
+
+        accepted = self.request.headers.get('Accept-Encoding', '')
+        for encoding, body in asset.encodings:
+            if encoding is None or encoding in accepted:
+                break
+
+        self.set_header('Content-Type', asset.content_type)
+        self.set_header('Cache-Control', asset.cache_control)
+        self.set_header('Vary', 'Accept-Encoding')
+        if encoding is not None:
+            self.set_header('Content-Encoding', encoding)
+            # Each encoding is a different body, so it needs its own Etag
+            self.set_header('Etag', '{}-{}"'.format(asset.etag[:-1], encoding))
+        else:
+            self.set_header('Etag', asset.etag)
+
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+        if include_body:
+            self.write(body)
+        else:
+            self.set_header('Content-Length', len(body))
@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+'''
+    A stand-in for the robot's camera server, for testing the dashboard's
+    camera relay without a robot. Serves an MJPEG stream at /?action=stream
+    like mjpg-streamer does, at a fixed frame rate.
+
+    The frames only look like JPEGs to the relay (they start and end with
+    the JPEG markers and hold a frame counter), so a browser will show them
+    as broken images. Use /camera/stats on the dashboard server to see what
+    was relayed.
+
+    Run it, then start the dashboard with --camera-url http://localhost:5800/?action=stream
+'''
+
+import json
+import logging
+from optparse import OptionParser
+
+import tornado.web
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
+
+logger = logging.getLogger('fake_camera')
+
+BOUNDARY = 'boundarydonotcross'
+
+
+def make_frame(number, size):
+    body = 'frame {}'.format(number).encode('ascii').ljust(max(size - 4, 0), b'.')
+    return b'\xff\xd8' + body + b'\xff\xd9'
+
+
+class StreamHandler(tornado.web.RequestHandler):
+
+    def initialize(self, fps, size):
+        self.fps = fps
+        self.size = size
+
+    async def get(self):
+        if self.get_argument('action', None) != 'stream':
+            self.write(json.dumps({'fake': True}))
+            return
+
+        logger.info("Streaming to %s", self.request.remote_ip)
+        self.set_header('Content-Type', 'multipart/x-mixed-replace;boundary=' + BOUNDARY)
+        number = 0
+        try:
+            while True:
+                frame = make_frame(number, self.size)
+                self.write('--{}\r\nContent-Type: image/jpeg\r\nContent-Length: {}\r\n\r\n'.format(
+                    BOUNDARY, len(frame)))
+                self.write(frame)
+                self.write(b'\r\n')
+                await self.flush()
+                number += 1
+                await gen.sleep(1.0 / self.fps)
+        except StreamClosedError:
+            logger.info("%s disconnected after %s frames", self.request.remote_ip, number)
+
+
+def main():
+    parser = OptionParser()
+    parser.add_option('-p', '--port', type=int, default=5800,
+                      help='Port to serve the stream on')
+    parser.add_option('--fps', type=float, default=30,
+                      help='Frames per second to send')
+    parser.add_option('--size', type=int, default=20000,
+                      help='Size of each frame in bytes')
+    options, args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    app = tornado.web.Application([
+        (r"/.*", StreamHandler, {"fps": options.fps, "size": options.size}),
+    ])
+    logger.info("Streaming on http://localhost:%s/?action=stream", options.port)
+    app.listen(options.port)
+    IOLoop.current().start()
+
+
+if __name__ == '__main__':
+    main()
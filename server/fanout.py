@@ -0,0 +1,131 @@
+'''
+    Sends NetworkTables changes to the dashboard pages in batches.
+
+    Forwarding every change to every page as it happens means the browser
+    does a DOM update per change, which falls behind once the robot sends
+    high-rate telemetry. Instead the server listens to NetworkTables once,
+    keeps the newest value of each key that a page hasn't been sent yet, and
+    sends each page one frame with all of them every update interval.
+'''
+
+import base64
+import json
+import logging
+import threading
+
+import tornado.websocket
+from tornado.ioloop import PeriodicCallback
+
+from networktables import NetworkTables
+
+logger = logging.getLogger('fanout')
+
+# Frames per second sent to each page, unless the page asks for a different
+# rate with ?rate= in its URL.
+UPDATE_RATE = 10
+MAX_UPDATE_RATE = 60
+
+
+def _encode_value(value):
+    # Raw entries are sent as base64 strings, and anything else JSON can't
+    # hold as its str(), so one odd value can't lose a whole frame
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode('ascii')
+    return str(value)
+
+
+def encode_frame(changes):
+    '''
+        Returns the JSON frame sent to a page for a batch of changes.
+    '''
+    return json.dumps(changes, separators=(',', ':'), default=_encode_value)
+
+
+class NetworkTablesFanout:
+    '''
+        Keeps, for each connected page, the changes it hasn't been sent yet.
+        The NetworkTables listener runs on the NetworkTables thread and the
+        pages are flushed from the IOLoop, so everything is done under a lock.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = {}
+        self.pending = {}
+
+    def start(self):
+        NetworkTables.addGlobalListener(self._on_change, immediateNotify=True)
+
+    def _on_change(self, key, value, isNew):
+        with self.lock:
+            self.values[key] = value
+            for changes in self.pending.values():
+                changes[key] = value
+
+    def subscribe(self, client):
+        # A new page needs every value, not just the ones that change later
+        with self.lock:
+            self.pending[client] = dict(self.values)
+
+    def unsubscribe(self, client):
+        with self.lock:
+            self.pending.pop(client, None)
+
+    def take(self, client):
+        '''
+            Returns the changes since the last call, newest value per key.
+        '''
+        with self.lock:
+            changes = self.pending.get(client)
+            if changes:
+                self.pending[client] = {}
+        return changes
+
+
+class CoalescingWebSocket(tornado.websocket.WebSocketHandler):
+    '''
+        Sends a page one JSON object of {key: value} per update interval,
+        holding only the changes since the last frame. If the page hasn't
+        finished receiving the last frame, the changes keep coalescing until
+        it has, instead of queueing up in the socket.
+    '''
+
+    def initialize(self, fanout, rate=UPDATE_RATE):
+        self.fanout = fanout
+        self.default_rate = rate
+
+    def open(self):
+        try:
+            rate = float(self.get_argument('rate', self.default_rate))
+        except ValueError:
+            rate = self.default_rate
+        rate = min(max(rate, 1), MAX_UPDATE_RATE)
+
+        self.writing = None
+        self.frames = 0
+        self.fanout.subscribe(self)
+        self.timer = PeriodicCallback(self.flush, 1000.0 / rate)
+        self.timer.start()
+        logger.info("Page connected from %s at %s updates/s", self.request.remote_ip, rate)
+        self.flush()
+
+    def flush(self):
+        if self.writing is not None and not self.writing.done():
+            return
+        changes = self.fanout.take(self)
+        if not changes:
+            return
+        try:
+            self.writing = self.write_message(encode_frame(changes))
+        except tornado.websocket.WebSocketClosedError:
+            return
+        self.frames += 1
+
+    def on_message(self, message):
+        # Pages write values through the regular networktables.js socket
+        pass
+
+    def on_close(self):
+        self.timer.stop()
+        self.fanout.unsubscribe(self)
+        logger.info("Page disconnected from %s after %s frames", self.request.remote_ip, self.frames)
@@ -0,0 +1,315 @@
+'''
+    Relays the robot's MJPEG camera stream to any number of dashboard pages
+    over a single connection to the robot.
+
+    Each page opening the camera directly from the robot adds a full stream
+    to the robot's radio link. Instead the dashboard server keeps one
+    connection to the camera, open only while someone is watching, and hands
+    each page the newest frame whenever the page is ready for one. A page
+    that can't keep up skips frames rather than falling behind, and each
+    page's frame rate and bandwidth can be capped.
+'''
+
+import json
+import logging
+import re
+import time
+from urllib.parse import urlsplit
+
+import tornado.web
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.iostream import StreamClosedError
+from tornado.locks import Condition
+from tornado.tcpclient import TCPClient
+
+logger = logging.getLogger('mjpeg')
+
+# Frames per second sent to each page, unless it asks for less with ?fps=
+MAX_FPS = 30
+# Seconds to wait before reconnecting to the camera after losing it
+RECONNECT_DELAY = 1.0
+CONNECT_TIMEOUT = 5.0
+# How long a page waits for a frame before checking if it disconnected
+FRAME_TIMEOUT = 1.0
+READ_SIZE = 65536
+# Anything bigger than this isn't a frame, so the parser starts over
+MAX_FRAME_SIZE = 4 * 1024 * 1024
+
+BOUNDARY = 'frame'
+BOUNDARY_PARAMETER = re.compile(br'boundary="?([^";\r\n]+)', re.IGNORECASE)
+CONTENT_LENGTH = re.compile(br'^content-length:\s*(\d+)', re.IGNORECASE | re.MULTILINE)
+
+
+class MjpegParser:
+    '''
+        Splits a multipart/x-mixed-replace body into JPEG frames. Uses each
+        part's Content-Length when it has one, and otherwise looks for the
+        next boundary.
+    '''
+
+    def __init__(self, boundary):
+        if boundary.startswith(b'--'):
+            boundary = boundary[2:]
+        self.boundary = b'--' + boundary
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        '''
+            Adds data from the stream, and returns a list of the frames that
+            are now complete.
+        '''
+        buffer = self.buffer
+        buffer += data
+        frames = []
+        while True:
+            start = buffer.find(self.boundary)
+            if start == -1:
+                # Keep enough to find a boundary split across two reads
+                del buffer[:-len(self.boundary)]
+                break
+            header_end = buffer.find(b'\r\n\r\n', start)
+            if header_end == -1:
+                del buffer[:start]
+                break
+            body_start = header_end + 4
+            length = CONTENT_LENGTH.search(bytes(buffer[start:header_end]))
+            if length is not None:
+                body_end = body_start + int(length.group(1))
+                if len(buffer) < body_end:
+                    del buffer[:start]
+                    break
+                frames.append(bytes(buffer[body_start:body_end]))
+                del buffer[:body_end]
+            else:
+                body_end = buffer.find(self.boundary, body_start)
+                if body_end == -1:
+                    del buffer[:start]
+                    break
+                frames.append(bytes(buffer[body_start:body_end]).rstrip(b'\r\n'))
+                del buffer[:body_end]
+        if len(buffer) > MAX_FRAME_SIZE:
+            logger.warning("Dropping %s bytes of camera data without a frame in them", len(buffer))
+            del buffer[:]
+        return frames
+
+
+class ClientStats:
+    '''
+        What has been sent to one page.
+    '''
+
+    def __init__(self, address, fps, kbps):
+        self.address = address
+        self.fps = fps
+        self.kbps = kbps
+        self.started = time.monotonic()
+        self.frames = 0
+        self.skipped = 0
+        self.bytes = 0
+
+    def to_json(self):
+        elapsed = max(time.monotonic() - self.started, 1e-6)
+        return {
+            'address': self.address,
+            'max_fps': self.fps,
+            'max_kbps': self.kbps,
+            'frames': self.frames,
+            'skipped': self.skipped,
+            'bytes': self.bytes,
+            'fps': self.frames / elapsed,
+            'kbps': self.bytes * 8 / 1000 / elapsed,
+        }
+
+
+class MjpegRelay:
+    '''
+        Keeps the newest frame from the camera at url. The camera is only
+        connected to while at least one page is watching.
+    '''
+
+    def __init__(self, url, reconnect_delay=RECONNECT_DELAY):
+        self.url = urlsplit(url)
+        self.reconnect_delay = reconnect_delay
+        self.frame = None
+        self.sequence = 0
+        self.condition = Condition()
+        self.clients = {}
+        self.running = False
+        self.connected = False
+        self.stream = None
+        self.connects = 0
+        self.upstream_frames = 0
+        self.upstream_bytes = 0
+
+    def add_client(self, client, stats):
+        self.clients[client] = stats
+        if not self.running:
+            self.running = True
+            IOLoop.current().spawn_callback(self._run)
+
+    def remove_client(self, client):
+        self.clients.pop(client, None)
+        if not self.clients and self.stream is not None:
+            # Nobody is watching, so stop using the robot's bandwidth
+            self.stream.close()
+
+    async def next_frame(self, sequence, timeout=FRAME_TIMEOUT):
+        '''
+            Waits for a frame newer than sequence, and returns the newest
+            (sequence, frame), or None if there wasn't one within timeout.
+        '''
+        if self.sequence == sequence:
+            await self.condition.wait(timeout=IOLoop.current().time() + timeout)
+            if self.sequence == sequence:
+                return None
+        return self.sequence, self.frame
+
+    async def _run(self):
+        try:
+            while self.clients:
+                try:
+                    await self._stream()
+                except (StreamClosedError, OSError, ValueError, gen.TimeoutError) as e:
+                    if self.clients:
+                        logger.warning("Lost the camera at %s: %s", self.url.geturl(), e)
+                finally:
+                    # Also closes a connection everyone left while it was
+                    # being made, or one that failed part way through
+                    if self.stream is not None:
+                        self.stream.close()
+                    self.connected = False
+                    self.stream = None
+                if self.clients:
+                    await gen.sleep(self.reconnect_delay)
+        finally:
+            self.running = False
+
+    async def _stream(self):
+        host = self.url.hostname
+        port = self.url.port or 80
+        path = self.url.path or '/'
+        if self.url.query:
+            path += '?' + self.url.query
+
+        self.stream = await gen.with_timeout(
+            IOLoop.current().time() + CONNECT_TIMEOUT, TCPClient().connect(host, port))
+        if not self.clients:
+            return
+        request = 'GET {} HTTP/1.0\r\nHost: {}\r\n\r\n'.format(path, self.url.netloc)
+        await self.stream.write(request.encode('ascii'))
+
+        headers = await self.stream.read_until(b'\r\n\r\n', max_bytes=READ_SIZE)
+        status = headers.split(b'\r\n', 1)[0]
+        if b' 200 ' not in status + b' ':
+            raise ValueError('camera returned {}'.format(status.decode('ascii', 'replace')))
+        boundary = BOUNDARY_PARAMETER.search(headers)
+        if boundary is None:
+            raise ValueError('camera did not send a multipart stream')
+
+        self.connected = True
+        self.connects += 1
+        logger.info("Connected to the camera at %s", self.url.geturl())
+        parser = MjpegParser(boundary.group(1))
+        while self.clients:
+            data = await self.stream.read_bytes(READ_SIZE, partial=True)
+            self.upstream_bytes += len(data)
+            for frame in parser.feed(data):
+                self._publish(frame)
+        self.stream.close()
+
+    def _publish(self, frame):
+        self.frame = frame
+        self.sequence += 1
+        self.upstream_frames += 1
+        self.condition.notify_all()
+
+    def stats(self):
+        return {
+            'url': self.url.geturl(),
+            'connected': self.connected,
+            'connects': self.connects,
+            'frames': self.upstream_frames,
+            'bytes': self.upstream_bytes,
+            'clients': [stats.to_json() for stats in self.clients.values()],
+        }
+
+
+class MjpegHandler(tornado.web.RequestHandler):
+    '''
+        Streams the relay's frames to one page as multipart/x-mixed-replace.
+        ?fps= and ?kbps= lower the page's frame rate and bandwidth below the
+        server's limits.
+    '''
+
+    def initialize(self, relay, fps=MAX_FPS, kbps=0):
+        self.relay = relay
+        self.max_fps = fps
+        self.max_kbps = kbps
+        self.closed = False
+
+    def _limit(self, name, limit):
+        try:
+            value = float(self.get_argument(name, limit))
+        except ValueError:
+            return limit
+        if value <= 0:
+            return limit
+        return min(value, limit) if limit else value
+
+    async def get(self):
+        fps = self._limit('fps', self.max_fps)
+        kbps = self._limit('kbps', self.max_kbps)
+        stats = ClientStats(self.request.remote_ip, fps, kbps)
+
+        self.set_header('Content-Type', 'multipart/x-mixed-replace; boundary=' + BOUNDARY)
+        self.set_header('Cache-Control', 'no-cache')
+        self.relay.add_client(self, stats)
+        sequence = 0
+        try:
+            while not self.closed:
+                result = await self.relay.next_frame(sequence)
+                if result is None:
+                    continue
+                if sequence:
+                    stats.skipped += result[0] - sequence - 1
+                sequence, frame = result
+
+                sent = time.monotonic()
+                self.write('--{}\r\nContent-Type: image/jpeg\r\nContent-Length: {}\r\n\r\n'.format(
+                    BOUNDARY, len(frame)))
+                self.write(frame)
+                self.write(b'\r\n')
+                # Waiting for the page to take the frame is what makes slow
+                # pages skip frames: whatever is newest once it has is next.
+                await self.flush()
+                stats.frames += 1
+                stats.bytes += len(frame)
+
+                interval = 1.0 / fps
+                if kbps:
+                    interval = max(interval, len(frame) * 8 / (kbps * 1000))
+                delay = interval - (time.monotonic() - sent)
+                if delay > 0:
+                    await gen.sleep(delay)
+        except StreamClosedError:
+            pass
+        finally:
+            self.relay.remove_client(self)
+
+    def on_connection_close(self):
+        self.closed = True
+
+
+class MjpegStatsHandler(tornado.web.RequestHandler):
+    '''
+        The relay's stats as JSON. Also tells camera.html the relay is up.
+    '''
+
+    def initialize(self, relay):
+        self.relay = relay
+
+    def get(self):
+        self.set_header('Content-Type', 'application/json')
+        self.set_header('Cache-Control', 'no-cache')
+        self.write(json.dumps(self.relay.stats()))
@@ -17,12 +17,20 @@ from tornado.ioloop import IOLoop
 from networktables import NetworkTables
 from pynetworktables2js import get_handlers, NonCachingStaticFileHandler
 
+from assets import AssetHandler, load_assets
+from fanout import CoalescingWebSocket, NetworkTablesFanout, UPDATE_RATE
+from mjpeg import MjpegHandler, MjpegRelay, MjpegStatsHandler, MAX_FPS
+
 import logging
 logger = logging.getLogger('dashboard')
 
 log_datefmt = "%H:%M:%S"
 log_format = "%(asctime)s:%(msecs)03d %(levelname)-8s: %(name)-20s: %(message)s"
 
+# The robot's camera stream, see camera.html
+CAMERA_PORT = 5800
+CAMERA_PATH = '/?action=stream'
+
 
 def init_networktables(options):
     NetworkTables.setNetworkIdentity(options.identity)
@@ -63,6 +71,21 @@ def main():
     parser.add_option('--identity', default='pynetworktables2js',
                       help='Identity to send to NT server')
 
+    parser.add_option('--update-rate', type=float, default=UPDATE_RATE,
+                      help='Default number of NetworkTables updates per second sent to each page')
+
+    parser.add_option('--cache-assets', default=False, action='store_true',
+                      help='Serve precompressed static files under hashed names that browsers cache forever. Leave this off while editing the pages.')
+
+    parser.add_option('--camera-url',
+                      help="URL of the robot's MJPEG stream. Defaults to port %s on the robot." % CAMERA_PORT)
+
+    parser.add_option('--camera-fps', type=float, default=MAX_FPS,
+                      help='Most camera frames per second sent to each page')
+
+    parser.add_option('--camera-kbps', type=float, default=0,
+                      help='Most camera kilobits per second sent to each page, 0 for no limit')
+
     options, args = parser.parse_args()
     
     # Setup logging
@@ -75,6 +98,16 @@ def main():
     
     # Setup NetworkTables
     init_networktables(options)
+
+    fanout = NetworkTablesFanout()
+    fanout.start()
+
+    # Every page watching the camera shares one connection to the robot
+    camera_url = options.camera_url
+    if camera_url is None:
+        robot = 'roborio-%s-frc.local' % options.team if options.team else options.robot
+        camera_url = 'http://%s:%s%s' % (robot, CAMERA_PORT, CAMERA_PATH)
+    relay = MjpegRelay(camera_url)
     
     # setup tornado application with static handler + networktables support
     www_dir = abspath(join(dirname(__file__), 'www'))
@@ -87,11 +120,23 @@ def main():
     if not exists(index_html):
         logger.warn("%s not found", index_html)
     
-    app = tornado.web.Application(
-        get_handlers() + [
+    if options.cache_assets:
+        static_handlers = [
+            (r"/(.*)", AssetHandler, {"assets": load_assets(www_dir), "default": "index.html"}),
+        ]
+    else:
+        static_handlers = [
             (r"/()", NonCachingStaticFileHandler, {"path": index_html}),
             (r"/(.*)", NonCachingStaticFileHandler, {"path": www_dir})
         ]
+
+    app = tornado.web.Application(
+        [
+            (r"/networktables/delta", CoalescingWebSocket, {"fanout": fanout, "rate": options.update_rate}),
+            (r"/camera/stream", MjpegHandler, {"relay": relay, "fps": options.camera_fps, "kbps": options.camera_kbps}),
+            (r"/camera/stats", MjpegStatsHandler, {"relay": relay}),
+        ] +
+        get_handlers() + static_handlers
     )
     
     # Start the app
@@ -0,0 +1,111 @@
+import json
+from array import array
+from collections import OrderedDict
+
+from looptiming import LOOP_PERIOD
+
+# Number of entries in each axis's lookup table, spread evenly over -1 to 1.
+# Odd so that 0 has an entry of its own.
+TABLE_SIZE = 1001
+
+# How far a trigger has to be pressed to count
+TRIGGER_LEVEL = 0.4
+
+# The axes in a driver profile
+AXES = ('forward', 'rotate', 'elevator')
+
+
+class Axis:
+    """
+    Shapes one joystick axis: ignores a deadband around the center, bends
+    the rest with an expo curve, scales it, then limits how fast the output
+    can change.
+
+    expo blends between a straight line (0) and a cubic (1); in between
+    gives fine control near the center and full speed at the ends. The
+    curve is worked out once into a lookup table, so shaping a value is just
+    an index into it. slew_rate is the most the output can change per second,
+    or None for no limit.
+    """
+    def __init__(self, deadband=0.0, expo=0.0, scale=1.0, slew_rate=None, period=LOOP_PERIOD):
+        if not 0 <= deadband < 1:
+            raise ValueError("deadband ({}) must be between 0 and 1".format(deadband))
+        if not 0 <= expo <= 1:
+            raise ValueError("expo ({}) must be between 0 and 1".format(expo))
+        self.deadband = deadband
+        self.expo = expo
+        self.scale = scale
+        self.max_step = slew_rate * period if slew_rate is not None else None
+        self.half = (TABLE_SIZE - 1) / 2
+        self.table = array('d', (self.curve(i / self.half - 1) for i in range(TABLE_SIZE)))
+        self.output = 0.0
+
+    def curve(self, value):
+        """
+        The shaping curve, without the table or slew limit.
+        """
+        magnitude = abs(value)
+        if magnitude <= self.deadband:
+            return 0.0
+        # Start from 0 at the edge of the deadband instead of jumping
+        magnitude = min((magnitude - self.deadband) / (1 - self.deadband), 1.0)
+        magnitude = (1 - self.expo) * magnitude + self.expo * magnitude ** 3
+        return self.scale * (magnitude if value > 0 else -magnitude)
+
+    def shape(self, value):
+        index = int((value + 1.0) * self.half + 0.5)
+        if index < 0:
+            index = 0
+        elif index >= TABLE_SIZE:
+            index = TABLE_SIZE - 1
+        target = self.table[index]
+
+        max_step = self.max_step
+        if max_step is not None:
+            output = self.output
+            if target > output + max_step:
+                target = output + max_step
+            elif target < output - max_step:
+                target = output - max_step
+        self.output = target
+        return target
+
+    def reset(self, value=0.0):
+        """
+        Forget the last output, so the slew limit starts from value.
+        """
+        self.output = value
+
+
+class DriverProfile:
+    """
+    How one drive team likes their controls: an Axis for each of AXES, and
+    how far the grabber triggers have to be pressed.
+    """
+    def __init__(self, name, trigger_level=TRIGGER_LEVEL, **axes):
+        unknown = set(axes) - set(AXES)
+        if unknown:
+            raise ValueError("Unknown axes in profile {}: {}".format(name, ', '.join(sorted(unknown))))
+        self.name = name
+        self.trigger_level = trigger_level
+        for axis in AXES:
+            setattr(self, axis, Axis(**axes.get(axis, {})))
+
+    def reset(self):
+        for axis in AXES:
+            getattr(self, axis).reset()
+
+
+def load_profiles(path):
+    """
+    Returns the driver profiles in the JSON file at path, by name, in the
+    order they are in the file. Each profile is an object with the settings
+    for each axis (see Axis) and optionally trigger_level, e.g.
+
+        {"default": {"forward": {"deadband": 0.1, "expo": 0.5}}}
+    """
+    with open(path) as f:
+        settings = json.load(f, object_pairs_hook=OrderedDict)
+    return OrderedDict(
+        (name, DriverProfile(name, **profile)) for name, profile in settings.items()
+    )
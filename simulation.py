@@ -0,0 +1,330 @@
+"""
+A simple model of the drivetrain, gyro and elevator, driven by the motor
+outputs, for trying out autonomous routines without a robot.
+
+DriveModel steps any number of robots at once as NumPy arrays, so a batch
+of simulations costs little more than one. physics.py uses it (with one
+robot) to move the robot in the pyfrc simulator. BatchSimulation runs
+autonomous routines against it headless, as fast as the computer can go,
+with one routine per simulated robot.
+"""
+import collections
+import math
+
+import numpy as np
+
+import autonomous
+import trajectory
+from subsystems.drivetrain import Drivetrain
+from subsystems.elevator import COUNTS_PER_FOOT, Elevator
+from subsystems.grabber import Grabber
+from subsystems.odometry import Pose
+
+# @TODO: Check these against the real robot
+# Top speed of the robot (feet/second) at full output in low gear. This is
+# the same top speed the motion profiles are planned with. HIGH_GEAR_SPEED
+# is the top speed in high gear.
+MAX_SPEED = trajectory.MAX_VELOCITY
+HIGH_GEAR_SPEED = 16.0
+# Distance between the left and right wheels, in feet
+TRACK_WIDTH = 2.0
+# How long (seconds) the drivetrain takes to get about two thirds of the way
+# to a new speed
+DRIVE_TIME_CONSTANT = 0.15
+# Elevator speed (feet/second) at full output, and how high it goes
+ELEVATOR_SPEED = 4.0
+ELEVATOR_HEIGHT = 6.0
+# The Talon's Motion Magic is modelled as a proportional loop on the height,
+# with this much output per foot from the setpoint. That's close enough to
+# see how long the elevator takes to get somewhere.
+ELEVATOR_KP = 2.0
+
+# Outputs smaller than this are ignored by DifferentialDrive
+DRIVE_DEADBAND = 0.02
+
+
+def arcade_mix(forward, rotate, squared=True):
+    """
+    Returns the (left, right) outputs DifferentialDrive.arcadeDrive gives for
+    forward and rotate, both positive for driving forwards.
+    """
+    forward = max(-1.0, min(1.0, forward))
+    rotate = max(-1.0, min(1.0, rotate))
+    if abs(forward) < DRIVE_DEADBAND:
+        forward = 0.0
+    if abs(rotate) < DRIVE_DEADBAND:
+        rotate = 0.0
+    if squared:
+        forward = math.copysign(forward * forward, forward)
+        rotate = math.copysign(rotate * rotate, rotate)
+
+    largest = math.copysign(max(abs(forward), abs(rotate)), forward)
+    if forward >= 0:
+        if rotate >= 0:
+            return largest, forward - rotate
+        return forward + rotate, largest
+    if rotate >= 0:
+        return forward + rotate, largest
+    return largest, forward - rotate
+
+
+def elevator_output(setpoint, height):
+    """
+    The output the elevator's Talon gives to get from height to setpoint
+    (feet), for one robot or an array of them.
+    """
+    return np.clip((setpoint - height) * ELEVATOR_KP, -1, 1)
+
+
+class DriveModel:
+    """
+    count robots, each a tank drivetrain with a gyro and an elevator.
+
+    The wheel speeds lag behind the motor outputs with a first order time
+    constant, which is enough to make turns overshoot like the real robot
+    does. Headings are in degrees, clockwise, like the gyro, and positions
+    are in feet with x forward and y to the left of where the robot started,
+    like Odometry.
+    """
+    def __init__(self, count=1, max_speed=MAX_SPEED, high_gear_speed=HIGH_GEAR_SPEED,
+                 track_width=TRACK_WIDTH, time_constant=DRIVE_TIME_CONSTANT,
+                 elevator_speed=ELEVATOR_SPEED, elevator_height=ELEVATOR_HEIGHT):
+        self.count = count
+        self.max_speed = max_speed
+        self.high_gear_speed = high_gear_speed
+        self.track_width = track_width
+        self.time_constant = time_constant
+        self.elevator_speed = elevator_speed
+        self.elevator_height = elevator_height
+        self.reset()
+
+    def reset(self):
+        count = self.count
+        self.x = np.zeros(count)
+        self.y = np.zeros(count)
+        self.heading = np.zeros(count)
+        self.rate = np.zeros(count)
+        self.left_speed = np.zeros(count)
+        self.right_speed = np.zeros(count)
+        self.left_distance = np.zeros(count)
+        self.right_distance = np.zeros(count)
+        self.elevator = np.zeros(count)
+        # Every robot starts in low gear
+        self.high_gear = np.zeros(count, dtype=bool)
+
+    def step(self, left, right, elevator=0.0, dt=autonomous.LOOP_PERIOD):
+        """
+        Advance every robot by dt seconds. left, right and elevator are the
+        motor outputs, from -1 to 1, either one per robot or one for all of
+        them. left and right are positive for driving forwards.
+        """
+        blend = min(dt / self.time_constant, 1.0)
+        top_speed = np.where(self.high_gear, self.high_gear_speed, self.max_speed)
+        self.left_speed += (np.clip(left, -1, 1) * top_speed - self.left_speed) * blend
+        self.right_speed += (np.clip(right, -1, 1) * top_speed - self.right_speed) * blend
+
+        speed = (self.left_speed + self.right_speed) / 2
+        self.rate = np.degrees((self.left_speed - self.right_speed) / self.track_width)
+        # Drive along the heading halfway through the step
+        direction = -np.radians(self.heading + self.rate * dt / 2)
+        self.x += speed * dt * np.cos(direction)
+        self.y += speed * dt * np.sin(direction)
+        self.heading += self.rate * dt
+
+        self.left_distance += self.left_speed * dt
+        self.right_distance += self.right_speed * dt
+        self.elevator = np.clip(
+            self.elevator + np.clip(elevator, -1, 1) * self.elevator_speed * dt,
+            0, self.elevator_height)
+
+
+class SimDrivetrain:
+    """
+    Stands in for a Drivetrain, writing its outputs and gear into the batch.
+    """
+    def __init__(self, outputs, model, index):
+        self.outputs = outputs
+        self.model = model
+        self.index = index
+        self.gear = None
+
+    def arcade_drive(self, forward, rotate, squared=True):
+        left, right = arcade_mix(forward, rotate, squared)
+        self.outputs[0, self.index] = left
+        self.outputs[1, self.index] = right
+
+    def stop(self):
+        self.outputs[:, self.index] = 0.0
+
+    def shift_low(self):
+        self.model.high_gear[self.index] = False
+        self.gear = Drivetrain.LOW_GEAR
+
+    def shift_high(self):
+        self.model.high_gear[self.index] = True
+        self.gear = Drivetrain.HIGH_GEAR
+
+
+class SimGyro:
+    def __init__(self, model, index):
+        self.model = model
+        self.index = index
+
+    def getAngle(self):
+        return float(self.model.heading[self.index])
+
+    def getRate(self):
+        return float(self.model.rate[self.index])
+
+
+class SimOdometry:
+    """
+    Stands in for Odometry, reading the pose straight from the model. There
+    is no history, so get_pose_at returns the current pose.
+    """
+    def __init__(self, model, index, clock):
+        self.model = model
+        self.index = index
+        self.clock = clock
+        self.reset()
+
+    def reset(self, x=0.0, y=0.0):
+        i = self.index
+        self.offset = (self.model.x[i] - x, self.model.y[i] - y, self.model.heading[i], self._distance())
+
+    def _distance(self):
+        i = self.index
+        return (self.model.left_distance[i] + self.model.right_distance[i]) / 2
+
+    def get_pose(self):
+        i = self.index
+        x, y, heading, _ = self.offset
+        return Pose(self.clock.now(), float(self.model.x[i] - x), float(self.model.y[i] - y),
+                    float(self.model.heading[i] - heading))
+
+    def get_pose_at(self, t):
+        return self.get_pose()
+
+    def get_distance(self):
+        return float(self._distance() - self.offset[3])
+
+
+class SimTalon:
+    """
+    Stands in for the elevator's Talon, so the batch runs the real Elevator.
+    Motor outputs are written into the batch, and closed loop setpoints are
+    followed with elevator_output.
+    """
+    def __init__(self, model, outputs, setpoints, index):
+        self.model = model
+        self.outputs = outputs
+        self.setpoints = setpoints
+        self.index = index
+
+    def set(self, *args):
+        if len(args) == 1:
+            self.outputs[self.index] = args[0]
+            self.setpoints[self.index] = np.nan
+        else:
+            self.setpoints[self.index] = args[1] / COUNTS_PER_FOOT
+
+    def getSelectedSensorPosition(self, pid):
+        return int(self.model.elevator[self.index] * COUNTS_PER_FOOT)
+
+
+class SimMotor:
+    """
+    Stands in for one of the grabber's Talons, writing the motor output into
+    the batch. There are no cubes in the simulation, so it never stalls.
+    """
+    def __init__(self, outputs, index):
+        self.outputs = outputs
+        self.index = index
+
+    def set(self, value):
+        self.outputs[self.index] = value
+
+    def getOutputCurrent(self):
+        return 0.0
+
+
+class NoVision:
+    """
+    A vision socket that never sees the target.
+    """
+    def get_angle(self, max_staleness):
+        return None
+
+    def get_id(self):
+        return -1
+
+    def latest_sample(self):
+        return None
+
+
+SimRobot = collections.namedtuple(
+    'SimRobot', ['drivetrain', 'gyro', 'vision_socket', 'elevator', 'grabber', 'odometry'])
+
+
+class BatchSimulation:
+    """
+    Runs one autonomous routine per simulated robot, stepping all of them
+    together on a SimulatedClock. Build each routine with the parts in
+    robots[i] and the clock, e.g. with routine().
+    """
+    def __init__(self, count, **model_settings):
+        self.count = count
+        self.model = DriveModel(count, **model_settings)
+        self.clock = autonomous.SimulatedClock()
+        self.drive_outputs = np.zeros((2, count))
+        self.elevator_outputs = np.zeros(count)
+        self.elevator_setpoints = np.full(count, np.nan)
+        self.grabber_outputs = np.zeros((2, count))
+        self.robots = [
+            SimRobot(
+                SimDrivetrain(self.drive_outputs, self.model, i),
+                SimGyro(self.model, i),
+                NoVision(),
+                Elevator(SimTalon(self.model, self.elevator_outputs, self.elevator_setpoints, i)),
+                Grabber(SimMotor(self.grabber_outputs[0], i), SimMotor(self.grabber_outputs[1], i), None,
+                        clock=self.clock.now),
+                SimOdometry(self.model, i, self.clock),
+            )
+            for i in range(count)
+        ]
+
+    def routine(self, index, function, switch_position, **parameters):
+        """
+        Builds one of the autonomous.ROUTINES functions for robot index,
+        passing parameters on to it.
+        """
+        robot = self.robots[index]
+        return function(
+            robot.drivetrain, robot.gyro, robot.vision_socket, switch_position,
+            robot.elevator, robot.grabber, robot.odometry, clock=self.clock, **parameters)
+
+    def run(self, routines, timeout=15.0):
+        """
+        Runs routines (one command per robot, see routine) until they have all finished or
+        timeout seconds have passed. Returns how long each took, or NaN for
+        the ones that didn't finish.
+        """
+        finished = np.full(self.count, np.nan)
+        active = {i: routine.run() for i, routine in enumerate(routines)}
+        start = self.clock.now()
+        while active and self.clock.now() - start < timeout:
+            for i, routine in list(active.items()):
+                self.robots[i].grabber.update()
+                try:
+                    next(routine)
+                except StopIteration:
+                    finished[i] = self.clock.now() - start
+                    self.robots[i].drivetrain.stop()
+                    del active[i]
+            closed = ~np.isnan(self.elevator_setpoints)
+            self.elevator_outputs[closed] = elevator_output(
+                self.elevator_setpoints[closed], self.model.elevator[closed])
+            self.model.step(self.drive_outputs[0], self.drive_outputs[1], self.elevator_outputs,
+                            self.clock.period)
+            self.clock.step()
+        return finished
@@ -0,0 +1,275 @@
+import collections
+import time
+
+from wpilib.interfaces import GenericHID
+
+from subsystems.odometry import Pose, PoseHistory
+
+# Left and right sides for the Xbox Controller
+# Note that these dont' referr to just the sticks, but more generally
+# Refer to the left and right features of the controller.
+# Ex: LEFT may refer to the actual left joystick, the left trigger,
+# or left bumper.
+LEFT = GenericHID.Hand.kLeft
+RIGHT = GenericHID.Hand.kRight
+
+# How each ControllerState field is read from an XboxController: the method
+# and the arguments it is called with
+READERS = collections.OrderedDict([
+    ('left_x', ('getX', (LEFT,))),
+    ('left_y', ('getY', (LEFT,))),
+    ('right_x', ('getX', (RIGHT,))),
+    ('right_y', ('getY', (RIGHT,))),
+    ('left_trigger', ('getTriggerAxis', (LEFT,))),
+    ('right_trigger', ('getTriggerAxis', (RIGHT,))),
+    ('pov', ('getPOV', ())),
+    ('a_button', ('getAButton', ())),
+    ('b_button', ('getBButton', ())),
+    ('x_button', ('getXButton', ())),
+    ('y_button', ('getYButton', ())),
+    ('left_bumper', ('getBumper', (LEFT,))),
+    ('right_bumper', ('getBumper', (RIGHT,))),
+])
+
+
+class ControllerState:
+    """
+    Everything we use from an XboxController, read once per loop.
+
+    Only the given fields (all of them by default) are read from controller;
+    the rest keep their defaults. Without a controller nothing is read, and
+    the fields are set from outside, like ReplaySnapshot does.
+    """
+    __slots__ = (
+        'left_x', 'left_y', 'right_x', 'right_y',
+        'left_trigger', 'right_trigger', 'pov',
+        'a_button', 'b_button', 'x_button', 'y_button',
+        'left_bumper', 'right_bumper', 'reads',
+    )
+
+    def __init__(self, controller=None, fields=None):
+        self.left_x = 0.0
+        self.left_y = 0.0
+        self.right_x = 0.0
+        self.right_y = 0.0
+        self.left_trigger = 0.0
+        self.right_trigger = 0.0
+        self.pov = -1
+        self.a_button = False
+        self.b_button = False
+        self.x_button = False
+        self.y_button = False
+        self.left_bumper = False
+        self.right_bumper = False
+        # The reads are looked up once here rather than every loop
+        self.reads = []
+        if controller is not None:
+            for field in (fields if fields is not None else READERS):
+                method, args = READERS[field]
+                self.reads.append((field, getattr(controller, method), args))
+
+    def update(self):
+        for field, read, args in self.reads:
+            setattr(self, field, read(*args))
+
+
+class GyroState:
+    """
+    The gyro readings for this loop. Has the same getAngle/getRate methods
+    as the gyro, so it can be handed to autonomous commands in its place.
+    """
+    __slots__ = ('angle', 'rate')
+
+    def __init__(self):
+        self.angle = 0.0
+        self.rate = 0.0
+
+    def update(self, gyro):
+        self.angle = gyro.getAngle()
+        self.rate = gyro.getRate()
+
+    def getAngle(self):
+        return self.angle
+
+    def getRate(self):
+        return self.rate
+
+
+class TalonState:
+    """
+    What we use from a Talon this loop: its encoder, output current and
+    limit switches. Has the same methods as the Talon (and as its
+    SensorCollection, for the limit switches), so it can be handed to a
+    subsystem to read in the Talon's place.
+    """
+    __slots__ = ('position', 'velocity', 'current', 'forward_limit', 'reverse_limit')
+
+    def __init__(self):
+        self.position = 0
+        self.velocity = 0
+        self.current = 0.0
+        self.forward_limit = False
+        self.reverse_limit = False
+
+    def update(self, talon, limits):
+        self.position = talon.getSelectedSensorPosition(0)
+        self.velocity = talon.getSelectedSensorVelocity(0)
+        self.current = talon.getOutputCurrent()
+        self.forward_limit = bool(limits.isFwdLimitSwitchClosed())
+        self.reverse_limit = bool(limits.isRevLimitSwitchClosed())
+
+    def getSelectedSensorPosition(self, pid=0):
+        return self.position
+
+    def getSelectedSensorVelocity(self, pid=0):
+        return self.velocity
+
+    def getOutputCurrent(self):
+        return self.current
+
+    def getSensorCollection(self):
+        return self
+
+    def isFwdLimitSwitchClosed(self):
+        return self.forward_limit
+
+    def isRevLimitSwitchClosed(self):
+        return self.reverse_limit
+
+
+class VisionState:
+    """
+    The newest vision sample as of the start of this loop. get_angle and
+    get_id work like they do on the VisionSocket, so this can be handed to
+    autonomous commands in its place; anything else is passed through to the
+    socket.
+    """
+    __slots__ = ('socket', 'sample', 'time')
+
+    def __init__(self, socket):
+        self.socket = socket
+        self.sample = None
+        self.time = 0.0
+
+    def update(self, now):
+        self.sample = self.socket.latest_sample()
+        self.time = now
+
+    def get_angle(self, max_staleness):
+        """
+        Returns the newest angle, or None if it is older than max_staleness
+        seconds as of when the snapshot was taken.
+        """
+        sample = self.sample
+        if sample is not None and max_staleness > self.time - sample.receive_time:
+            return sample.angle
+        return None
+
+    def get_id(self):
+        return self.sample.id if self.sample is not None else -1
+
+    def latest_sample(self):
+        return self.sample
+
+    def __getattr__(self, name):
+        return getattr(self.socket, name)
+
+
+class OdometryState:
+    """
+    The odometry pose as of the start of each loop. get_pose, get_distance
+    and get_pose_at work like they do on Odometry, so this can be handed to
+    autonomous commands in its place.
+
+    Its history only has the poses seen at the start of each loop rather
+    than every odometry update, so that a replayed log, which loads the same
+    poses with load(), answers get_pose_at exactly like it did on the robot.
+    """
+    __slots__ = ('odometry', 'pose', 'distance', 'resets', 'history')
+
+    def __init__(self, odometry=None):
+        self.odometry = odometry
+        self.pose = Pose(0.0, 0.0, 0.0, 0.0)
+        self.distance = 0.0
+        self.resets = 0
+        self.history = PoseHistory()
+
+    def update(self):
+        if self.odometry is not None:
+            odometry = self.odometry
+            self.load(odometry.get_pose(), odometry.get_distance(), odometry.resets)
+
+    def load(self, pose, distance, resets):
+        if resets != self.resets:
+            # Poses from before a reset are in a different frame
+            self.history.clear()
+            self.resets = resets
+        # The odometry may not have updated since the last loop
+        if self.history.pose is None or pose.time > self.history.pose.time:
+            self.history.record(pose)
+        self.pose = pose
+        self.distance = distance
+
+    def get_pose(self):
+        return self.pose
+
+    def get_distance(self):
+        return self.distance
+
+    def get_pose_at(self, t):
+        return self.history.get_pose_at(t)
+
+
+class SensorSnapshot:
+    """
+    Reads every sensor and controller once at the start of each loop, so the
+    rest of the loop sees consistent values and each one is only read from
+    the hardware once. Call update() first thing in every periodic method.
+
+    talons maps names to the Talons whose sensors are read; their readings
+    are in self.talons under the same names. driver_fields and
+    operator_fields limit which ControllerState fields are read.
+    """
+    __slots__ = (
+        'time', 'driver', 'operator', 'gyro', 'vision', 'odometry', 'game_message', 'talons',
+        'driver_controller', 'operator_controller', 'gyro_sensor',
+        'driver_station', 'clock', 'talon_devices',
+    )
+
+    def __init__(self, driver, operator, gyro, vision_socket, driver_station=None, clock=time.time,
+                 talons=None, driver_fields=None, operator_fields=None, odometry=None):
+        self.driver_controller = driver
+        self.operator_controller = operator
+        self.gyro_sensor = gyro
+        self.driver_station = driver_station
+        self.clock = clock
+        self.time = 0.0
+        self.game_message = ''
+        self.driver = ControllerState(driver, driver_fields)
+        self.operator = ControllerState(operator, operator_fields)
+        self.gyro = GyroState()
+        self.vision = VisionState(vision_socket)
+        self.odometry = OdometryState(odometry)
+        self.talons = collections.OrderedDict()
+        self.talon_devices = []
+        for name, talon in (talons or {}).items():
+            state = self.talons[name] = TalonState()
+            self.talon_devices.append((state, talon, talon.getSensorCollection()))
+
+    def update(self, controllers=True):
+        """
+        Reads everything. Pass controllers=False in modes that don't use the
+        controllers, and they keep the values from the last update that read
+        them.
+        """
+        self.time = self.clock()
+        if controllers:
+            self.driver.update()
+            self.operator.update()
+        self.gyro.update(self.gyro_sensor)
+        self.vision.update(self.time)
+        self.odometry.update()
+        for state, talon, limits in self.talon_devices:
+            state.update(talon, limits)
+        if self.driver_station is not None:
+            self.game_message = self.driver_station.getGameSpecificMessage()
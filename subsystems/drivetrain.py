@@ -1,7 +1,30 @@
+import time
+
 import wpilib
 import wpilib.drive
 from wpilib import DoubleSolenoid
 
+# @TODO: Tune these on the practice field
+# Speeds are in feet/second, throttles are the driver's forward stick
+# (after shaping) from 0 to 1.
+# Shift up once going faster than this with at least UPSHIFT_THROTTLE, and
+# not slowing down faster than UPSHIFT_DECELERATION (feet/second^2)...
+UPSHIFT_SPEED = 7.0
+UPSHIFT_THROTTLE = 0.7
+UPSHIFT_DECELERATION = 2.0
+# ...and back down once slower than this. The gap keeps it from hunting
+# between gears at speeds in between.
+DOWNSHIFT_SPEED = 4.0
+# Slowing down faster than this (feet/second^2) with at least PUSH_THROTTLE
+# means we've run into something, so shift down to push
+PUSH_THROTTLE = 0.6
+PUSH_DECELERATION = 8.0
+# Never shift again within this many seconds of the last shift
+MIN_SHIFT_INTERVAL = 0.5
+# How much of each new acceleration reading goes into the smoothed one
+ACCELERATION_FILTER = 0.3
+
+
 class Drivetrain:
     """
     The drivetrain class handles driving around as well as shifting between
@@ -13,15 +36,98 @@ class Drivetrain:
     def __init__(self, left, right, gear_shifter):
         self.robot_drive = wpilib.drive.DifferentialDrive(left, right)
         self.gear_shifter = gear_shifter
+        # Not known until the first shift
+        self.gear = None
 
-    def arcade_drive(self, forward, rotate):
-        self.robot_drive.arcadeDrive(forward, rotate)
+    def arcade_drive(self, forward, rotate, squared=True):
+        """
+        Inputs are squared by default, which makes driving by hand easier.
+        Pass squared=False when the outputs are computed, like when following
+        a motion profile.
+        """
+        self.robot_drive.arcadeDrive(forward, rotate, squared)
 
     def stop(self):
         self.robot_drive.stopMotor()
 
     def shift_low(self):
         self.gear_shifter.set(Drivetrain.LOW_GEAR)
+        self.gear = Drivetrain.LOW_GEAR
 
     def shift_high(self):
         self.gear_shifter.set(Drivetrain.HIGH_GEAR)
+        self.gear = Drivetrain.HIGH_GEAR
+
+
+class AutoShifter:
+    """
+    Shifts the drivetrain by itself: up to high gear for sprinting across
+    the field, and down to low gear for pushing and for driving slowly.
+
+    It shifts up once the robot is going faster than UPSHIFT_SPEED, the
+    driver is still asking for speed and the robot isn't slowing down. It
+    shifts down once it slows below DOWNSHIFT_SPEED, or when the driver is
+    pushing hard but the robot is slowing anyway. The driver can hold
+    either gear with override, which shifts straight away.
+
+    speed is a function returning how fast the robot is going forwards, in
+    feet/second. drivetrain can be anything with the gear, shift_low and
+    shift_high of a Drivetrain, like simulation.SimDrivetrain.
+    """
+    def __init__(self, drivetrain, speed, clock=time.monotonic):
+        self.drivetrain = drivetrain
+        self.speed = speed
+        self.clock = clock
+        self.shifts = 0
+        self.reset()
+
+    def reset(self):
+        """
+        Start again in low gear, forgetting the last speed.
+        """
+        self.last_speed = None
+        self.last_time = None
+        self.acceleration = 0.0
+        self._shift(Drivetrain.LOW_GEAR, self.clock())
+
+    def update(self, throttle, override=None):
+        """
+        Called once per loop with the driver's forward throttle, and the gear
+        the driver wants, or None to let it choose. Returns the gear.
+        """
+        now = self.clock()
+        speed = abs(self.speed())
+        if self.last_time is not None and now > self.last_time:
+            acceleration = (speed - self.last_speed) / (now - self.last_time)
+            self.acceleration += (acceleration - self.acceleration) * ACCELERATION_FILTER
+        self.last_speed = speed
+        self.last_time = now
+
+        gear = self.drivetrain.gear
+        if override is not None:
+            wanted = override
+        elif now - self.last_shift < MIN_SHIFT_INTERVAL:
+            wanted = gear
+        else:
+            wanted = self._choose(gear, speed, abs(throttle))
+        if wanted != gear:
+            self._shift(wanted, now)
+        return wanted
+
+    def _choose(self, gear, speed, throttle):
+        if gear == Drivetrain.LOW_GEAR:
+            if (speed > UPSHIFT_SPEED and throttle >= UPSHIFT_THROTTLE and
+                    self.acceleration > -UPSHIFT_DECELERATION):
+                return Drivetrain.HIGH_GEAR
+        elif speed < DOWNSHIFT_SPEED or (
+                throttle >= PUSH_THROTTLE and self.acceleration < -PUSH_DECELERATION):
+            return Drivetrain.LOW_GEAR
+        return gear
+
+    def _shift(self, gear, now):
+        if gear == Drivetrain.HIGH_GEAR:
+            self.drivetrain.shift_high()
+        else:
+            self.drivetrain.shift_low()
+        self.last_shift = now
+        self.shifts += 1
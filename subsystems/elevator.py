@@ -1,17 +1,142 @@
-import wpilib
+import math
+
+import ctre
+
+# @TODO: Measure these on the real elevator
+# 4096 count per revolution encoder on a 1.5 inch diameter spool
+COUNTS_PER_FOOT = 4096 / (math.pi * 1.5 / 12)
+# Highest the elevator is allowed to go (feet above the bottom). The top
+# limit switch is a little above this.
+MAX_HEIGHT = 5.5
+
+# Motion Magic settings, in feet/second and feet/second^2
+CRUISE_VELOCITY = 3.0
+ACCELERATION = 6.0
+# Closed loop gains, in Talon units (1023 is full output). KF is full output
+# over the encoder speed at full output, about 4 feet/second.
+KF = 1023 / (4.0 * COUNTS_PER_FOOT / 10)
+KP = 0.4
+KD = 4.0
+
+# How close (feet) the elevator has to be to its setpoint to be there
+TOLERANCE = 0.05
+# How long configuration calls wait for the Talon to answer (ms)
+CONFIG_TIMEOUT = 10
+
+
+def to_counts(height):
+    return int(round(height * COUNTS_PER_FOOT))
 
 
 class Elevator:
     """
     The elevator will lift the grabber up and down to reach the cube.
     A motor will control a pulley/chain to bring it up or down.
-    Limit switches will stop the motor when it gets too high or too low.
+
+    go_to moves to a height using Motion Magic, which runs the motion
+    profile and the closed loop on the Talon itself; the setpoint is only
+    sent when it changes. go_up and go_down drive it by hand instead.
+    Either way, the Talon stops the motor at its soft limits (the bottom
+    and MAX_HEIGHT) and at the limit switches wired to it. Heights are in
+    feet above the bottom.
+
+    The encoder and limit switches are read from feedback, which is the
+    Talon itself unless something that reads them once per loop is given,
+    like a snapshot.TalonState.
     """
-    def __init__(self, motor):
+    GROUND = 0.0
+    SWITCH = 2.0
+    SCALE = MAX_HEIGHT
+
+    def __init__(self, motor, feedback=None):
         self.motor = motor
+        self.feedback = motor if feedback is None else feedback
+        self.setpoint = None
+        self.limits = None
+        self.at_bottom = False
+
+    def configure(self):
+        """
+        Set up the encoder, Motion Magic and the limits on the Talon. Called
+        once from robotInit; the Talon keeps these until it is power cycled.
+        """
+        motor = self.motor
+        motor.setNeutralMode(ctre.NeutralMode.Brake)
+        motor.configSelectedFeedbackSensor(ctre.FeedbackDevice.QuadEncoder, 0, CONFIG_TIMEOUT)
+        motor.selectProfileSlot(0, 0)
+        motor.config_kF(0, KF, CONFIG_TIMEOUT)
+        motor.config_kP(0, KP, CONFIG_TIMEOUT)
+        motor.config_kI(0, 0.0, CONFIG_TIMEOUT)
+        motor.config_kD(0, KD, CONFIG_TIMEOUT)
+        # The Talon wants these per 100 ms
+        motor.configMotionCruiseVelocity(to_counts(CRUISE_VELOCITY / 10), CONFIG_TIMEOUT)
+        motor.configMotionAcceleration(to_counts(ACCELERATION / 10), CONFIG_TIMEOUT)
+
+        motor.configForwardSoftLimitThreshold(to_counts(MAX_HEIGHT), CONFIG_TIMEOUT)
+        motor.configReverseSoftLimitThreshold(0, CONFIG_TIMEOUT)
+        motor.configForwardSoftLimitEnable(True, CONFIG_TIMEOUT)
+        motor.configReverseSoftLimitEnable(True, CONFIG_TIMEOUT)
+        # The limit switches are on the Talon's feedback connector, which
+        # the Talon watches by default (normally open)
+        motor.overrideLimitSwitchesEnable(True)
+        self.limits = self.feedback.getSensorCollection()
+
+        # The elevator starts the match all the way down
+        motor.setSelectedSensorPosition(0, 0, CONFIG_TIMEOUT)
+
+    def update(self):
+        """
+        Called once per loop. Zeros the encoder whenever the elevator reaches
+        the bottom limit switch, so a slipped chain (or an elevator that
+        wasn't all the way down at power on) is fixed the next time it gets
+        to the bottom, and the soft limits stay where they should be.
+        """
+        if self.limits is None:
+            return
+        at_bottom = bool(self.limits.isRevLimitSwitchClosed())
+        if at_bottom and not self.at_bottom:
+            self.motor.setSelectedSensorPosition(0, 0, 0)
+        self.at_bottom = at_bottom
+
+    def height(self):
+        return self.feedback.getSelectedSensorPosition(0) / COUNTS_PER_FOOT
+
+    def go_to(self, height):
+        """
+        Move to height, which is clamped to the soft limits. Returns straight
+        away; see at_setpoint.
+        """
+        height = max(0.0, min(MAX_HEIGHT, height))
+        if height == self.setpoint:
+            return
+        self.setpoint = height
+        self.motor.set(ctre.ControlMode.MotionMagic, to_counts(height))
+
+    def hold(self):
+        """
+        Stay at the current height.
+        """
+        self.go_to(self.height())
+
+    def at_setpoint(self, tolerance=TOLERANCE):
+        """
+        Whether the elevator has reached the height given to go_to. Always
+        False while it is being driven by hand.
+        """
+        if self.setpoint is None:
+            return False
+        if self.setpoint == 0.0 and self.at_bottom:
+            return True
+        return abs(self.height() - self.setpoint) <= tolerance
 
     def go_up(self, speed=1.0):
+        self.setpoint = None
         self.motor.set(speed)
 
     def go_down(self, speed=1.0):
+        self.setpoint = None
         self.motor.set(-speed)
+
+    def stop(self):
+        self.setpoint = None
+        self.motor.set(0)
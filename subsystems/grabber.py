@@ -1,14 +1,56 @@
-import wpilib
+import time
+from enum import Enum
+
+# @TODO: Tune these on the practice field
+# How long (seconds) the cube sensor has to read the same before we believe it
+DEBOUNCE_TIME = 0.1
+# Without a sensor, a cube is seated once the intake motors have drawn more
+# than STALL_CURRENT amps (on average) for STALL_TIME seconds. The first
+# INRUSH_TIME seconds of intaking are ignored, since the motors draw a lot
+# while they spin up too.
+STALL_CURRENT = 15.0
+STALL_TIME = 0.15
+INRUSH_TIME = 0.25
+# How hard to keep pulling on a cube once it's seated, so it stays there
+HOLD_SPEED = 0.15
+
+
+class State(Enum):
+    IDLE = "idle"
+    INTAKING = "intaking"
+    HOLDING = "holding"
+    SPITTING = "spitting"
+
 
 class Grabber:
     """
     The grabber will absorb a cube, use a sensor to know when the cube has been fully absorbed,
     and release the cube on commmand.
+
+    intake, eject and release drive a small state machine, which update
+    moves along once per loop: intaking stops by itself and holds the cube
+    once one is seated. Without a sensor (sensor=None), a cube is noticed
+    by the intake motors stalling on it instead. absorb, spit and stop drive
+    the motors directly.
+
+    current is a function returning the average current (amps) the intake
+    motors are drawing. By default it reads both motors.
     """
-    def __init__(self, left, right, sensor):
+    def __init__(self, left, right, sensor, clock=time.monotonic, current=None):
         self.left_motor = left
         self.right_motor = right
         self.sensor = sensor
+        self.clock = clock
+        self.current = current if current is not None else self._motor_current
+        self.state = State.IDLE
+        self.cube = False
+        # Goes up by one every time a cube is seated, so commands can wait
+        # for it to change, see autonomous.IntakeCube
+        self.acquired = 0
+        self.reading = False
+        self.reading_since = clock()
+        self.intake_start = 0.0
+        self.stall_since = None
 
     def absorb(self, speed=1.0):
         # @Direction: We might need to reverse the signs
@@ -19,5 +61,79 @@ class Grabber:
         self.left_motor.set(-speed)
         self.right_motor.set(speed)
 
+    def stop(self):
+        self.left_motor.set(0)
+        self.right_motor.set(0)
+
     def has_cube(self):
-        return self.sensor.get()
+        return self.cube
+
+    def intake(self, speed=1.0):
+        """
+        Pull a cube in, until one is seated. Call every loop while intaking.
+        """
+        if self.state == State.HOLDING:
+            return
+        if self.state != State.INTAKING:
+            self.state = State.INTAKING
+            self.intake_start = self.clock()
+            self.stall_since = None
+        self.absorb(speed)
+
+    def eject(self, speed=1.0):
+        self.state = State.SPITTING
+        if self.sensor is None:
+            # Nothing will tell us it's gone, so assume it is
+            self.cube = False
+        self.spit(speed)
+
+    def release(self):
+        """
+        Stop the intake, unless it's holding a cube.
+        """
+        if self.state != State.HOLDING:
+            self.state = State.IDLE
+            self.stop()
+
+    def update(self):
+        """
+        Called once per loop, before intake, eject or release.
+        """
+        now = self.clock()
+        if self.sensor is not None:
+            cube = self._debounce(bool(self.sensor.get()), now)
+        elif self.state == State.INTAKING:
+            cube = self.cube or self._stalled(now)
+        else:
+            cube = self.cube
+        if cube and not self.cube:
+            self.acquired += 1
+        self.cube = cube
+
+        if self.state == State.INTAKING and cube:
+            self.state = State.HOLDING
+            self.absorb(HOLD_SPEED)
+        elif self.state == State.HOLDING and not cube:
+            # Knocked out, or the sensor was wrong
+            self.state = State.IDLE
+            self.stop()
+
+    def _debounce(self, reading, now):
+        if reading != self.reading:
+            self.reading = reading
+            self.reading_since = now
+        if now - self.reading_since >= DEBOUNCE_TIME:
+            return reading
+        return self.cube
+
+    def _motor_current(self):
+        return (self.left_motor.getOutputCurrent() + self.right_motor.getOutputCurrent()) / 2
+
+    def _stalled(self, now):
+        current = self.current()
+        if now - self.intake_start < INRUSH_TIME or current < STALL_CURRENT:
+            self.stall_since = None
+            return False
+        if self.stall_since is None:
+            self.stall_since = now
+        return now - self.stall_since >= STALL_TIME
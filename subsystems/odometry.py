@@ -0,0 +1,188 @@
+import math
+import time
+from array import array
+from collections import namedtuple
+from threading import Lock
+
+import wpilib
+
+# How often (in seconds) the pose is updated. This is faster than the 20 ms
+# robot loop so fast turns don't smear the position estimate.
+UPDATE_PERIOD = 0.005
+# Number of poses kept for get_pose_at, a bit over a second at 200 Hz
+HISTORY_SIZE = 256
+
+# x and y are in feet, with x pointing the way the robot faced when the pose
+# was last reset and y to its left. heading is the gyro angle in degrees
+# (clockwise positive, like the gyro).
+Pose = namedtuple('Pose', ['time', 'x', 'y', 'heading'])
+
+
+class PoseHistory:
+    """
+    The last size poses, in preallocated arrays so recording one never
+    allocates, for looking up where the robot was at some time. Poses must
+    be recorded in time order.
+    """
+    def __init__(self, size=HISTORY_SIZE):
+        self.size = size
+        self.times = array('d', [0.0]) * size
+        self.xs = array('d', [0.0]) * size
+        self.ys = array('d', [0.0]) * size
+        self.headings = array('d', [0.0]) * size
+        self.count = 0
+        self.pose = None
+
+    def clear(self):
+        self.count = 0
+        self.pose = None
+
+    def record(self, pose):
+        index = self.count % self.size
+        self.times[index] = pose.time
+        self.xs[index] = pose.x
+        self.ys[index] = pose.y
+        self.headings[index] = pose.heading
+        self.count += 1
+        self.pose = pose
+
+    def get_pose_at(self, t):
+        """
+        Returns the Pose at time t, interpolated between the poses around it.
+        Returns the newest pose if t is in the future and None if t is older
+        than the history goes back.
+        """
+        count = self.count
+        if count == 0:
+            return None
+        size = min(count, self.size)
+        newest = (count - 1) % self.size
+        times = self.times
+        if t >= times[newest]:
+            return self.pose
+        if t < times[(count - size) % self.size]:
+            return None
+
+        low = count - size
+        high = count - 1
+        while low < high:
+            middle = (low + high) // 2
+            if times[middle % self.size] < t:
+                low = middle + 1
+            else:
+                high = middle
+        after = low % self.size
+        before = (low - 1) % self.size
+        if times[after] == t or low == count - size:
+            return Pose(times[after], self.xs[after], self.ys[after], self.headings[after])
+        fraction = (t - times[before]) / (times[after] - times[before])
+
+        def between(values):
+            return values[before] + (values[after] - values[before]) * fraction
+
+        return Pose(t, between(self.xs), between(self.ys), between(self.headings))
+
+
+class Odometry:
+    """
+    Keeps track of where the robot is on the field by combining the distance
+    each side of the drivetrain has driven with the gyro heading.
+
+    left_distance and right_distance are functions returning how far (in
+    feet) each side has driven since the robot turned on, positive forwards.
+
+    Once started the pose is updated by a Notifier every UPDATE_PERIOD
+    seconds. Readers never take a lock; the newest pose is a tuple that is
+    replaced in a single assignment, so they always see a whole pose. Only
+    update and reset lock, so a reset can't land in the middle of an update.
+    """
+    def __init__(self, gyro, left_distance, right_distance, clock=time.time):
+        self.gyro = gyro
+        self.left_distance = left_distance
+        self.right_distance = right_distance
+        self.clock = clock
+        self.notifier = None
+        self.lock = Lock()
+
+        self.history = PoseHistory()
+        # How many times reset has been called, so readers can tell when the
+        # pose jumped
+        self.resets = 0
+        self.reset()
+
+    def start(self):
+        if self.notifier is None:
+            self.notifier = wpilib.Notifier(self.update)
+        self.notifier.startPeriodic(UPDATE_PERIOD)
+
+    def stop(self):
+        if self.notifier is not None:
+            self.notifier.stop()
+
+    def reset(self, x=0.0, y=0.0):
+        """
+        Make the robot's current position (x, y) and its current direction
+        the x axis. Clears the pose history.
+        """
+        with self.lock:
+            self.last_left = self.left_distance()
+            self.last_right = self.right_distance()
+            self.heading_offset = self.gyro.getAngle()
+            self.history.clear()
+            self.distance = 0.0
+            self._record(Pose(self.clock(), x, y, 0.0))
+            self.resets += 1
+
+    def update(self):
+        """
+        Work out how far the robot moved since the last update. Called by the
+        notifier; only call this yourself in tests.
+        """
+        with self.lock:
+            self._update()
+
+    def _update(self):
+        left = self.left_distance()
+        right = self.right_distance()
+        heading = self.gyro.getAngle() - self.heading_offset
+        now = self.clock()
+        pose = self.pose
+
+        moved = ((left - self.last_left) + (right - self.last_right)) / 2
+        self.last_left = left
+        self.last_right = right
+        self.distance += moved
+        # Drive along the average of the old and new heading. The gyro is
+        # clockwise positive, while y points left, hence the minus sign.
+        direction = -math.radians((pose.heading + heading) / 2)
+        self._record(Pose(
+            now,
+            pose.x + moved * math.cos(direction),
+            pose.y + moved * math.sin(direction),
+            heading,
+        ))
+
+    def _record(self, pose):
+        self.history.record(pose)
+        self.pose = pose
+
+    def get_pose(self):
+        """
+        Returns the newest Pose.
+        """
+        return self.pose
+
+    def get_distance(self):
+        """
+        Returns how far (in feet) the robot has driven since the last reset,
+        counting backwards as negative, no matter which way it was facing.
+        """
+        return self.distance
+
+    def get_pose_at(self, t):
+        """
+        Returns the Pose at time t, interpolated between the updates around
+        it. Returns the newest pose if t is in the future and None if t is
+        older than the history goes back.
+        """
+        return self.history.get_pose_at(t)
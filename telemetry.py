@@ -0,0 +1,165 @@
+import logging
+import logging.handlers
+import numbers
+from enum import Enum
+from threading import Event, Thread
+
+# Number of values that can be queued between flushes. At 50 Hz this is
+# plenty even if every loop pushes a handful of values.
+QUEUE_SIZE = 512
+# How often (in seconds) the worker thread publishes the queued values
+FLUSH_PERIOD = 0.1
+
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUP_COUNT = 5
+
+
+class Telemetry(Thread):
+    """
+    Publishes diagnostic values without doing any I/O on the control thread.
+
+    The control loop calls put(key, value) which just stores the key and
+    value in a preallocated ring. A background thread drains the ring every
+    FLUSH_PERIOD seconds, keeps the newest value for each key, and writes them
+    to NetworkTables and, if a log path is given, a rotating log file. Values
+    that take work to produce can be queued as a Deferred, so the work is
+    done on the background thread too.
+
+    put should only be called from one thread (the main robot thread).
+    """
+    def __init__(self, table=None, log_path=None, capacity=QUEUE_SIZE, period=FLUSH_PERIOD):
+        Thread.__init__(self)
+        self.daemon = True
+        self.table = table
+        self.capacity = capacity
+        self.period = period
+        self.keys = [None] * capacity
+        self.values = [None] * capacity
+        # head is only written by put and tail only by flush, so the two
+        # threads never write the same variable.
+        self.head = 0
+        self.tail = 0
+        self.dropped = 0
+        # Exceptions raised while flushing, which are counted and otherwise
+        # ignored so the thread keeps running
+        self.errors = 0
+        self.last_error = None
+        self.stopped = Event()
+
+        self.logger = None
+        if log_path is not None:
+            # A private logger, so each Telemetry only writes to its own file
+            self.logger = logging.Logger('telemetry')
+            handler = logging.handlers.RotatingFileHandler(
+                log_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self.logger.addHandler(handler)
+
+    def put(self, key, value):
+        """
+        Queue a value to be published. Never blocks; if the queue is full the
+        value is dropped and counted. Returns whether it was queued.
+        """
+        head = self.head
+        if head - self.tail >= self.capacity:
+            self.dropped += 1
+            return False
+        index = head % self.capacity
+        self.keys[index] = key
+        self.values[index] = value
+        self.head = head + 1
+        return True
+
+    """
+    Called as part of the Thread API. Don't call this yourself, use start()
+    instead to start the thread.
+    """
+    def run(self):
+        while not self.stopped.wait(self.period):
+            self._guarded_flush()
+        self._guarded_flush()
+
+    def _guarded_flush(self):
+        try:
+            self.flush()
+        except Exception as error:
+            self.errors += 1
+            self.last_error = error
+
+    def flush(self):
+        """
+        Drain the queue and publish the newest value of each key.
+        """
+        head = self.head
+        latest = {}
+        for number in range(self.tail, head):
+            index = number % self.capacity
+            key = self.keys[index]
+            value = self.values[index]
+            self.keys[index] = None
+            self.values[index] = None
+            # Consume the entry before resolving it, so a Deferred that raises
+            # isn't tried again on the next flush
+            self.tail = number + 1
+            if isinstance(value, Deferred):
+                value = value.resolve()
+            latest[key] = value
+        self.tail = head
+
+        if not latest:
+            return
+        if self.table is not None:
+            for key, value in latest.items():
+                self._publish(key, value)
+        if self.logger is not None:
+            self.logger.info(" ".join(
+                "{}={}".format(key, format_value(value)) for key, value in sorted(latest.items())))
+
+    def _publish(self, key, value):
+        if value is None:
+            # NetworkTables can't hold None, so leave the old value there
+            return
+        if isinstance(value, bool):
+            self.table.putBoolean(key, value)
+        elif isinstance(value, numbers.Number):
+            self.table.putNumber(key, value)
+        elif isinstance(value, (list, tuple)):
+            self.table.putNumberArray(key, value)
+        else:
+            self.table.putString(key, format_value(value))
+
+    def close(self):
+        """
+        Stop the worker thread. Anything still queued is flushed first.
+        """
+        self.stopped.set()
+
+    def free(self):
+        """
+        Stop the worker thread and wait for it to finish. Registered with
+        wpilib as a global resource, so it is also called between tests
+        before NetworkTables is shut down.
+        """
+        self.close()
+        if self.is_alive():
+            self.join(timeout=1.0)
+
+
+class Deferred:
+    """
+    A value that is too slow to work out on the control thread. Queue it with
+    Telemetry.put and the worker thread calls resolve() and publishes what it
+    returns. Every Deferred that is queued is resolved exactly once, in the
+    order they were queued, even if a newer value for the key replaces it.
+    """
+    def __init__(self, function=None):
+        self.function = function
+
+    def resolve(self):
+        return self.function()
+
+
+def format_value(value):
+    if isinstance(value, Enum):
+        return value.name
+    return str(value)
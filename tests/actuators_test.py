@@ -0,0 +1,95 @@
+from helper import FakeClock, GetSet
+
+from actuators import ActuatorBank, CachedActuator
+
+
+class CountingMotor(GetSet):
+    def __init__(self):
+        GetSet.__init__(self, 0)
+        self.sets = 0
+        self.stops = 0
+
+    def set(self, *args):
+        GetSet.set(self, args[-1])
+        self.sets += 1
+
+    def stopMotor(self):
+        self.state = 0
+        self.stops += 1
+
+    def getOutputCurrent(self):
+        return 4.2
+
+
+def test_skips_unchanged_writes():
+    clock = FakeClock()
+    motor = CountingMotor()
+    cached = CachedActuator(motor, epsilon=0.01, refresh_period=0.1, clock=clock)
+    cached.set(0.5)
+    cached.set(0.5)
+    cached.set(0.505)
+    assert motor.sets == 1
+    assert cached.skipped == 2
+    cached.set(0.52)
+    assert motor.state == 0.52
+    # Going to zero is always written, even from within epsilon of it
+    cached.set(0.005)
+    cached.set(0)
+    assert motor.state == 0
+    assert cached.writes == 4
+
+
+def test_refresh():
+    clock = FakeClock()
+    motor = CountingMotor()
+    cached = CachedActuator(motor, refresh_period=0.1, clock=clock)
+    for _ in range(10):
+        cached.set(1.0)
+        clock.time += 0.02
+    # Written at 0, then refreshed at 0.1 and 0.2
+    assert motor.sets == 2
+    clock.time += 0.1
+    cached.set(1.0)
+    assert motor.sets == 3
+
+
+def test_solenoid_never_refreshes():
+    clock = FakeClock()
+    valve = GetSet(0)
+    cached = CachedActuator(valve, refresh_period=None, clock=clock)
+    cached.set(1)
+    clock.time += 100
+    cached.set(1)
+    assert cached.writes == 1
+    cached.set(2)
+    assert valve.state == 2
+
+
+def test_passthrough():
+    motor = CountingMotor()
+    cached = CachedActuator(motor)
+    assert cached.getOutputCurrent() == 4.2
+    cached.set(0.5)
+    cached.stopMotor()
+    assert motor.stops == 1
+    # Stopping bypasses the cache, so setting the old value again is written
+    cached.set(0.5)
+    assert motor.state == 0.5
+    # Two argument sets, like WPI_TalonSRX.set(mode, value)
+    cached.set(1, 0.5)
+    assert cached.writes == 3
+
+
+def test_can_utilization():
+    clock = FakeClock()
+    bank = ActuatorBank(clock=clock)
+    left = bank.add("left", CachedActuator(CountingMotor(), clock=clock))
+    right = bank.add("right", CachedActuator(CountingMotor(), clock=clock))
+    for tick in range(50):
+        left.set(tick / 100.0)
+        right.set(0.5)
+        clock.time += 0.02
+    assert bank.saved_writes() == {"left": 0, "right": 40}
+    # 60 writes over a second
+    assert abs(bank.can_utilization() - 60 * 128 / 1e6) < 1e-9
+    assert bank.can_utilization() == 0.0
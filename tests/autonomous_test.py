@@ -1,14 +1,62 @@
 import network
 import autonomous
+import trajectory
 from autonomous import Position, AutonomousRoutine, get_routine, get_game_specific_message
+from helper import GetSet, MockTalon
 from subsystems.drivetrain import Drivetrain
-import os
+from subsystems.elevator import Elevator
+from subsystems.grabber import Grabber
+from subsystems.odometry import Pose
 
 def test_get_game_specific_message():
     assert get_game_specific_message("LLL") == Position.LEFT
     assert get_game_specific_message("LRL") == Position.LEFT
     assert get_game_specific_message("RLR") == Position.RIGHT
     assert get_game_specific_message("RRR") == Position.RIGHT
+    assert get_game_specific_message("LLR") == Position.LEFT
+    assert get_game_specific_message("LRR") == Position.LEFT
+    assert get_game_specific_message("RLL") == Position.RIGHT
+    assert get_game_specific_message("RRL") == Position.RIGHT
+    assert get_game_specific_message("") is None
+    assert get_game_specific_message("XYZ") is None
+    assert len(autonomous.GAME_MESSAGES) == 8
+
+
+def test_build_routine_table():
+    drivetrain = MockDrivetrain()
+    gyro = MockGyro()
+    vision_socket = network.MockSocket()
+    for position in Position:
+        clock = autonomous.SimulatedClock()
+        elevator = Elevator(MockTalon())
+        grabber = Grabber(GetSet(0), GetSet(0), None)
+        table, default = autonomous.build_routine_table(
+            position, drivetrain, gyro, vision_socket, elevator, grabber, clock=clock)
+        assert set(table) == set(autonomous.GAME_MESSAGES)
+        routines = list(table.values()) + [default]
+        # Each message gets its own, unstarted routine
+        assert len(set(map(id, routines))) == len(routines)
+        assert all(isinstance(routine, autonomous.BaseAutonomous) for routine in routines)
+        # Unknown messages only drive forward, whichever side we started on
+        assert isinstance(default, autonomous.ProfiledDrive)
+        assert default.profile is trajectory.get("cross_line")
+        assert clock.run(table["RLR"].run()) > 0
+
+
+def test_build_routine_table_missing_profile(monkeypatch):
+    # Profiles are looked up while building, not once the routine gets to them
+    specs = dict(trajectory.PROFILE_SPECS)
+    del specs["center_last"]
+    monkeypatch.setattr(trajectory, "PROFILE_SPECS", specs)
+    monkeypatch.setattr(trajectory, "profiles", {})
+    try:
+        autonomous.build_routine_table(
+            Position.CENTER, MockDrivetrain(), MockGyro(), network.MockSocket(),
+            Elevator(MockTalon()), Grabber(GetSet(0), GetSet(0), None))
+    except KeyError:
+        pass
+    else:
+        assert False, "Built a routine without its profile"
 
 
 def test_routine():
@@ -32,54 +80,223 @@ def test_routine():
 # they don't cause crashes.
 
 def test_autonomous_routines():
-    # These take a long time to run (about 15 seconds total), so we really only
-    # want to run this on TravisCI.
-    # According to https://docs.travis-ci.com/user/environment-variables/#Convenience-Variables
-    # the environment variable "CI" along with others is set to True when we're in a
-    # Travis environment.
-    if os.environ.get("CI") == "true":
-        drivetrain = MockDrivetrain()
-        gyro = MockGyro()
-        vision_socket = network.MockSocket()
-        auton = autonomous.center_to_switch(drivetrain, gyro, vision_socket, autonomous.Position.LEFT)
-        for _ in auton: pass
-        auton = autonomous.switch_same_side(drivetrain, gyro, vision_socket, autonomous.Position.LEFT)
-        for _ in auton: pass
-        auton = autonomous.switch_opposite_side(drivetrain, gyro, vision_socket, autonomous.Position.LEFT)
-        for _ in auton: pass
+    drivetrain = MockDrivetrain()
+    gyro = MockGyro()
+    vision_socket = network.MockSocket()
+    for routine in autonomous.ROUTINES.values():
+        for position in [Position.LEFT, Position.RIGHT]:
+            clock = autonomous.SimulatedClock()
+            elevator = Elevator(MockTalon())
+            grabber = Grabber(GetSet(0), GetSet(0), None)
+            ticks = clock.run(routine(drivetrain, gyro, vision_socket, position, elevator, grabber, clock=clock).run())
+            assert ticks == round(clock.now() / autonomous.LOOP_PERIOD)
+            # Every routine has to finish within the 15 second autonomous period
+            assert 0 < clock.now() < 15
+
+
+def test_profiled_drive_with_odometry():
+    drivetrain = DrivingDrivetrain()
+    profile = trajectory.trapezoidal(5.0)
+    ticks = autonomous.SimulatedClock().run(autonomous.ProfiledDrive(drivetrain, profile, drivetrain).run())
+    assert abs(drivetrain.distance - 5.0) <= 0.1
+    assert ticks <= len(profile) + 25
+
+
+def test_profiled_drive():
+    drivetrain = RecordingDrivetrain()
+    profile = trajectory.trapezoidal(5.0)
+    ticks = autonomous.SimulatedClock().run(autonomous.ProfiledDrive(drivetrain, profile).run())
+    assert ticks == len(profile)
+    assert all(-1 <= forward <= 1 for forward, _ in drivetrain.outputs)
+    assert drivetrain.outputs[0][0] > 0
+    assert drivetrain.stopped
+
+
+def test_timed():
+    clock = autonomous.SimulatedClock()
+    auton = autonomous.Timed(autonomous.ArcadeAutonomous(MockDrivetrain(), forward=0.5), duration=1, clock=clock)
+    ticks = clock.run(auton.run())
+    assert 50 <= ticks <= 51
+
 
 def test_arcade_autonomous():
-    drivetrain = MockDrivetrain()
-    auton = autonomous.ArcadeAutonomous(drivetrain, forward=-0.42, rotate=0.69)
+    drivetrain = RecordingDrivetrain()
+    auton = autonomous.ArcadeAutonomous(drivetrain, forward=-0.42, rotate=0.69).run()
     for _ in range(0, 100):
-        auton.run()
+        next(auton)
+    assert drivetrain.outputs == [(-0.42, 0.69)] * 100
 
 
 def test_rotate_autonomous():
     drivetrain = MockDrivetrain()
     gyro = MockGyro()
-    auton = autonomous.RotateAutonomous(drivetrain, gyro, angle=90, turn_speed=0.5)
+    auton = autonomous.RotateAutonomous(drivetrain, gyro, angle=90, turn_speed=0.5).run()
+    # The gyro never moves, so this would only stop at the timeout
     for _ in range(0, 100):
-        auton.run()
+        next(auton)
+
+
+def test_rotate_converges():
+    for angle in [90, -45, 10]:
+        drivetrain = TurningDrivetrain()
+        clock = autonomous.SimulatedClock()
+        auton = autonomous.RotateAutonomous(drivetrain, drivetrain, angle=angle, turn_speed=0.6, clock=clock)
+        clock.run(auton.run())
+        assert abs(drivetrain.angle - angle) <= 2.0
+        # Finishes on its own well before the timeout
+        assert clock.now() < 1.0
+
+
+def test_rotate_timeout():
+    clock = autonomous.SimulatedClock()
+    auton = autonomous.RotateAutonomous(MockDrivetrain(), MockGyro(), angle=90, turn_speed=0.5,
+                                        timeout=0.5, clock=clock)
+    clock.run(auton.run())
+    assert abs(clock.now() - 0.5) < 0.03
+
+
+class CountingAutonomous(autonomous.BaseAutonomous):
+    """
+    Counts the ticks it runs for, finishing after ticks ticks (or never if
+    ticks is None).
+    """
+    def __init__(self, ticks=None, requirements=()):
+        self.ticks = ticks
+        self.requirements = requirements
+        self.count = 0
+        self.ended = 0
+
+    def execute(self):
+        while self.ticks is None or self.count < self.ticks:
+            self.count += 1
+            yield
+
+    def end(self):
+        self.ended += 1
+
+
+def test_sequence():
+    first = CountingAutonomous(3)
+    second = CountingAutonomous(2)
+    ticks = autonomous.SimulatedClock().run(autonomous.Sequence(first, second).run())
+    assert ticks == 5
+    assert first.ended == 1 and second.ended == 1
+
+
+def test_parallel():
+    short = CountingAutonomous(2)
+    long = CountingAutonomous(5)
+    ticks = autonomous.SimulatedClock().run(autonomous.Parallel(short, long).run())
+    assert ticks == 5
+    assert short.count == 2 and long.count == 5
+    assert short.ended == 1 and long.ended == 1
+
+
+def test_race():
+    short = CountingAutonomous(2)
+    forever = CountingAutonomous()
+    ticks = autonomous.SimulatedClock().run(autonomous.Race(forever, short).run())
+    assert ticks == 2
+    assert short.ended == 1 and forever.ended == 1
+
+
+def test_deadline():
+    deadline = CountingAutonomous(3)
+    short = CountingAutonomous(1)
+    forever = CountingAutonomous()
+    sequence = autonomous.Sequence(CountingAutonomous(1), forever)
+    ticks = autonomous.SimulatedClock().run(autonomous.Deadline(deadline, short, sequence).run())
+    assert ticks == 3
+    assert forever.count == 2
+    assert deadline.ended == 1 and short.ended == 1 and forever.ended == 1
+
+
+def test_parallel_requirements():
+    drivetrain = MockDrivetrain()
+    elevator = Elevator(MockTalon())
+    drive = autonomous.ArcadeAutonomous(drivetrain, forward=0.5)
+    lift = autonomous.Timed(autonomous.ElevatorAutonomous(elevator, 0.5), duration=1)
+    group = autonomous.Parallel(drive, lift)
+    assert set(group.requirements) == {drivetrain, elevator}
+
+    rotate = autonomous.RotateAutonomous(drivetrain, MockGyro(), angle=90, turn_speed=0.5)
+    for group in [autonomous.Parallel, autonomous.Race, autonomous.Deadline]:
+        try:
+            group(autonomous.Sequence(lift), drive, rotate)
+        except ValueError:
+            pass
+        else:
+            assert False, "{} should not allow two drivetrain commands".format(group.__name__)
 
 
 def test_vision_autonomous():
     drivetrain = MockDrivetrain()
     gyro = MockGyro()
     vision_socket = network.MockSocket()
-    auton = autonomous.VisionAuto(drivetrain, gyro, vision_socket, forward=0.5)
+    auton = autonomous.VisionAuto(drivetrain, gyro, vision_socket, forward=0.5).run()
     for _ in range(0, 100):
-        auton.run()
+        next(auton)
+
+
+class OneSampleSocket:
+    """
+    A vision socket that has only ever seen one sample.
+    """
+    def __init__(self, capture_time, angle):
+        self.sample = network.VisionSample(capture_time, capture_time, 0, angle)
+
+    def latest_sample(self):
+        return self.sample
+
+    def get_angle(self, max_staleness):
+        return self.sample.angle
+
+
+def test_vision_holds_heading_between_samples():
+    # One sample is enough to turn onto the target and keep driving at it
+    drivetrain = TurningDrivetrain()
+    socket = OneSampleSocket(0.0, 20)
+    auton = autonomous.VisionAuto(drivetrain, drivetrain, socket, forward=0.5).run()
+    for _ in range(100):
+        next(auton)
+    assert abs(drivetrain.angle - 20) < 1
+
+
+class MockOdometry:
+    """
+    Says the robot has turned 5 degrees since the sample was captured.
+    """
+    def get_pose_at(self, t):
+        return Pose(t, 0, 0, 30)
+
+    def get_pose(self):
+        return Pose(1.0, 0, 0, 35)
+
+
+def test_vision_uses_heading_at_capture():
+    drivetrain = TurningDrivetrain()
+    drivetrain.angle = 100
+    socket = OneSampleSocket(0.5, 10)
+    auton = autonomous.VisionAuto(drivetrain, drivetrain, socket, forward=0.5, odometry=MockOdometry())
+    auton.init()
+    next(auton.execute())
+    # The target was 10 degrees right of where we were facing at capture
+    # time, which was 5 degrees left of where we face now
+    assert abs(auton.heading - 105) < 1e-9
 
 class MockGyro:
     def getAngle(self):
         return 180
 
+    def getRate(self):
+        return 0
+
+
 class MockDrivetrain(Drivetrain):
     def __init__(self):
         pass
 
-    def arcade_drive(self, forward, rotate):
+    def arcade_drive(self, forward, rotate, squared=True):
         pass
 
     def stop(self):
@@ -90,3 +307,104 @@ class MockDrivetrain(Drivetrain):
 
     def shift_high(self):
         pass
+
+class RecordingDrivetrain(MockDrivetrain):
+    def __init__(self):
+        self.outputs = []
+        self.stopped = False
+
+    def arcade_drive(self, forward, rotate, squared=True):
+        self.outputs.append((forward, rotate))
+        self.stopped = False
+
+    def stop(self):
+        self.stopped = True
+
+
+class TurningDrivetrain(MockDrivetrain):
+    """
+    Turns a gyro as if the robot were rotating, at up to 360 degrees per
+    second, with a bit of lag like a real drivetrain.
+    """
+    def __init__(self):
+        self.angle = 0.0
+        self.rate = 0.0
+
+    def getAngle(self):
+        return self.angle
+
+    def getRate(self):
+        return self.rate
+
+    def arcade_drive(self, forward, rotate, squared=True):
+        self.rate += (rotate * 360 - self.rate) * 0.3
+        self.angle += self.rate * autonomous.LOOP_PERIOD
+
+    def stop(self):
+        self.arcade_drive(0, 0)
+
+
+class DrivingDrivetrain(MockDrivetrain):
+    """
+    Moves forward at 80% of the speed the profiles expect, like a robot with
+    a tired battery, and acts as its own odometry.
+    """
+    def __init__(self):
+        self.distance = 0.0
+
+    def get_distance(self):
+        return self.distance
+
+    def arcade_drive(self, forward, rotate, squared=True):
+        self.distance += forward * 0.8 * trajectory.MAX_VELOCITY * autonomous.LOOP_PERIOD
+
+
+def test_elevator_to_height():
+    clock = autonomous.SimulatedClock()
+    motor = MockTalon(instant=False)
+    elevator = Elevator(motor)
+    command = autonomous.ElevatorToHeight(elevator, Elevator.SWITCH, timeout=1.0, clock=clock)
+    ticks = command.run()
+    for _ in range(5):
+        next(ticks)
+        clock.step()
+    assert elevator.setpoint == Elevator.SWITCH
+    motor.position = motor.state
+    assert clock.run(ticks) == 0
+    assert motor.sets == 1
+
+    # Gives up after the timeout
+    clock = autonomous.SimulatedClock()
+    command = autonomous.ElevatorToHeight(elevator, Elevator.SCALE, timeout=1.0, clock=clock)
+    assert clock.run(command.run()) == 50
+
+
+def test_intake_cube():
+    clock = autonomous.SimulatedClock()
+    sensor = GetSet(False)
+    left_motor = GetSet(0)
+    grabber = Grabber(left_motor, GetSet(0), sensor, clock=clock.now)
+    command = autonomous.IntakeCube(grabber, speed=0.8, timeout=2.0, clock=clock)
+    ticks = command.run()
+    for _ in range(10):
+        grabber.update()
+        next(ticks)
+        clock.step()
+    assert left_motor.state == 0.8
+
+    # Finishes once the cube has been seen for long enough
+    sensor.state = True
+    steps = 0
+    for _ in ticks:
+        grabber.update()
+        clock.step()
+        steps += 1
+    assert 4 <= steps <= 6
+    assert grabber.has_cube() and left_motor.state > 0
+
+    # Already holding one
+    assert clock.run(autonomous.IntakeCube(grabber, clock=clock).run()) == 0
+
+    # Gives up without a cube
+    grabber = Grabber(GetSet(0), GetSet(0), GetSet(False), clock=clock.now)
+    assert clock.run(autonomous.IntakeCube(grabber, timeout=1.0, clock=clock).run()) == 50
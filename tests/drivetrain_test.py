@@ -1,7 +1,11 @@
+import numpy as np
 from wpilib import DoubleSolenoid
 
-from helper import GetSet
-from subsystems.drivetrain import Drivetrain
+import autonomous
+import simulation
+from helper import FakeClock, GetSet
+from subsystems import drivetrain as drivetrain_module
+from subsystems.drivetrain import AutoShifter, Drivetrain
 
 
 def test_forward():
@@ -34,3 +38,98 @@ def test_gear_shifter():
     assert pneumatic.state == Drivetrain.HIGH_GEAR
     drivetrain.shift_low()
     assert pneumatic.state ==  Drivetrain.LOW_GEAR
+
+
+def simulated_shifter():
+    model = simulation.DriveModel(1)
+    drivetrain = simulation.SimDrivetrain(np.zeros((2, 1)), model, 0)
+    clock = FakeClock()
+    shifter = AutoShifter(drivetrain, lambda: (model.left_speed[0] + model.right_speed[0]) / 2, clock)
+    shifts = shifter.shifts
+
+    def drive(forward, seconds, override=None):
+        gears = []
+        for _ in range(int(round(seconds / autonomous.LOOP_PERIOD))):
+            drivetrain.arcade_drive(forward, 0, squared=False)
+            gears.append(shifter.update(forward, override))
+            model.step(drivetrain.outputs[0], drivetrain.outputs[1])
+            clock.time += autonomous.LOOP_PERIOD
+        return gears
+
+    return model, drivetrain, shifter, drive, lambda: shifter.shifts - shifts
+
+
+def test_auto_shift_sprint():
+    model, drivetrain, shifter, drive, shifts = simulated_shifter()
+    assert drivetrain.gear == Drivetrain.LOW_GEAR
+
+    # Sprint across the field, shifting up once on the way
+    drive(1.0, 3.0)
+    assert drivetrain.gear == Drivetrain.HIGH_GEAR and shifts() == 1
+    assert model.left_speed[0] > simulation.MAX_SPEED
+
+    # Let go, and it shifts back down once it's slowed down
+    gears = drive(0.0, 2.0)
+    assert gears[0] == Drivetrain.HIGH_GEAR
+    assert drivetrain.gear == Drivetrain.LOW_GEAR and shifts() == 2
+
+    # Driving slowly never shifts up
+    drive(0.5, 3.0)
+    assert drivetrain.gear == Drivetrain.LOW_GEAR and shifts() == 2
+
+
+def test_auto_shift_pushing():
+    clock = FakeClock()
+    speed = [12.0]
+    drivetrain = Drivetrain(None, None, GetSet(None))
+    shifter = AutoShifter(drivetrain, lambda: speed[0], clock)
+    drivetrain.shift_high()
+    clock.time += 1.0
+
+    # Run into another robot at full throttle: slowing down hard, but still
+    # faster than the downshift speed
+    for _ in range(5):
+        shifter.update(1.0)
+        speed[0] -= 0.5
+        clock.time += autonomous.LOOP_PERIOD
+    assert speed[0] > drivetrain_module.DOWNSHIFT_SPEED
+    assert drivetrain.gear == Drivetrain.LOW_GEAR
+
+
+def test_auto_shift_hysteresis():
+    clock = FakeClock()
+    speed = [0.0]
+    drivetrain = Drivetrain(None, None, GetSet(None))
+    shifter = AutoShifter(drivetrain, lambda: speed[0], clock)
+    shifts = shifter.shifts
+
+    # Hovering between the shift speeds doesn't shift at all
+    for i in range(100):
+        speed[0] = 5.0 + (i % 2)
+        shifter.update(1.0)
+        clock.time += autonomous.LOOP_PERIOD
+    assert shifter.shifts == shifts
+
+    # Going fast and slow on alternate loops only shifts as often as it's
+    # allowed to
+    for i in range(100):
+        speed[0] = 8.0 if i % 2 else 3.0
+        shifter.update(1.0)
+        clock.time += autonomous.LOOP_PERIOD
+    assert shifter.shifts - shifts <= 2 / drivetrain_module.MIN_SHIFT_INTERVAL + 1
+
+
+def test_shift_override():
+    model, drivetrain, shifter, drive, shifts = simulated_shifter()
+    # Straight away, even standing still
+    drive(0.0, 0.02, Drivetrain.HIGH_GEAR)
+    assert drivetrain.gear == Drivetrain.HIGH_GEAR and model.high_gear[0]
+
+    # Held in low gear at full speed
+    drive(1.0, 3.0, Drivetrain.LOW_GEAR)
+    assert drivetrain.gear == Drivetrain.LOW_GEAR and shifts() == 2
+    assert model.left_speed[0] <= simulation.MAX_SPEED
+
+    # Let go, and it's up to the shifter again
+    drive(1.0, 1.0)
+    assert drivetrain.gear == Drivetrain.HIGH_GEAR
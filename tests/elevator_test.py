@@ -1,4 +1,8 @@
-from helper import GetSet
+import ctre
+
+from helper import GetSet, MockTalon
+from snapshot import TalonState
+from subsystems import elevator as elevator_module
 from subsystems.elevator import Elevator
 
 
@@ -15,3 +19,85 @@ def test_elevator():
     assert motor.state == -1
     elevator.go_down(speed=0.5)
     assert motor.state == -0.5
+
+
+def test_go_to():
+    motor = MockTalon(instant=False)
+    elevator = Elevator(motor)
+
+    elevator.go_to(Elevator.SWITCH)
+    assert motor.mode == ctre.ControlMode.MotionMagic
+    assert motor.state == elevator_module.to_counts(Elevator.SWITCH)
+    # The setpoint is only sent when it changes
+    for _ in range(10):
+        elevator.go_to(Elevator.SWITCH)
+    assert motor.sets == 1
+
+    assert not elevator.at_setpoint()
+    motor.position = elevator_module.to_counts(Elevator.SWITCH - 0.02)
+    assert elevator.at_setpoint()
+
+    # Driving by hand forgets the setpoint, so going back to it is sent again
+    elevator.go_up(0.5)
+    assert motor.mode is None and not elevator.at_setpoint()
+    elevator.go_to(Elevator.SWITCH)
+    assert motor.sets == 3
+
+
+def test_soft_limits():
+    motor = MockTalon()
+    elevator = Elevator(motor)
+    elevator.go_to(100)
+    assert elevator.setpoint == elevator_module.MAX_HEIGHT
+    elevator.go_to(-1)
+    assert elevator.setpoint == 0.0
+
+
+class MockLimits:
+    def __init__(self):
+        self.bottom = False
+
+    def isRevLimitSwitchClosed(self):
+        return self.bottom
+
+
+def test_bottom_limit_switch_zeros_encoder():
+    motor = MockTalon(instant=False)
+    elevator = Elevator(motor)
+    elevator.limits = MockLimits()
+
+    # The chain slipped, so the encoder says we're still above the bottom
+    motor.position = 2000
+    elevator.go_to(Elevator.GROUND)
+    elevator.update()
+    assert not elevator.at_setpoint()
+
+    elevator.limits.bottom = True
+    elevator.update()
+    assert motor.position == 0
+    assert elevator.at_setpoint()
+
+    # Only zeroed when the switch is first hit
+    motor.position = 10
+    elevator.update()
+    assert motor.position == 10
+
+
+def test_feedback():
+    # With a snapshot, the encoder and limit switches are read from it
+    # instead of the Talon
+    motor = MockTalon(instant=False)
+    feedback = TalonState()
+    elevator = Elevator(motor, feedback)
+    elevator.limits = feedback.getSensorCollection()
+
+    motor.position = elevator_module.to_counts(Elevator.SWITCH)
+    elevator.go_to(Elevator.SWITCH)
+    assert not elevator.at_setpoint()
+    feedback.position = motor.position
+    assert elevator.at_setpoint()
+
+    feedback.reverse_limit = True
+    elevator.update()
+    assert motor.position == 0
+    assert elevator.at_bottom
@@ -0,0 +1,17 @@
+import base64
+import json
+
+from server import fanout
+
+
+def test_encode_frame():
+    changes = {'/SmartDashboard/speed': 1.5, '/SmartDashboard/ready': True}
+    assert json.loads(fanout.encode_frame(changes)) == changes
+
+
+def test_encode_raw_values():
+    # Raw entries would otherwise make json.dumps raise after the changes
+    # were already taken, losing the whole frame
+    frame = json.loads(fanout.encode_frame({'/raw': b'\x00\xff', '/other': 2}))
+    assert base64.b64decode(frame['/raw']) == b'\x00\xff'
+    assert frame['/other'] == 2
@@ -1,5 +1,15 @@
-from helper import GetSet
-from subsystems.grabber import Grabber
+from helper import FakeClock, GetSet
+from subsystems import grabber as grabber_module
+from subsystems.grabber import Grabber, State
+
+
+class CurrentMotor(GetSet):
+    def __init__(self):
+        GetSet.__init__(self, 0)
+        self.current = 0.0
+
+    def getOutputCurrent(self):
+        return self.current
 
 
 def test_make_grabber():
@@ -20,6 +30,110 @@ def test_make_grabber():
     grabber.spit(speed=0.5)
     assert left_motor.state == -0.5
     assert right_motor.state == 0.5
+
+
+def test_sensor_debounce():
+    clock = FakeClock()
+    left_motor = GetSet(0)
+    sensor = GetSet(False)
+    grabber = Grabber(left_motor, GetSet(0), sensor, clock=clock)
+
+    grabber.update()
+    grabber.intake()
+    assert grabber.state == State.INTAKING and left_motor.state == 1
+
+    # A flicker isn't a cube
+    sensor.state = True
+    grabber.update()
+    clock.time += 0.05
+    sensor.state = False
+    grabber.update()
+    clock.time += 0.1
+    grabber.update()
     assert not grabber.has_cube()
+
     sensor.state = True
+    grabber.update()
+    clock.time += 0.05
+    grabber.update()
+    assert not grabber.has_cube()
+    clock.time += 0.06
+    grabber.update()
+    assert grabber.has_cube() and grabber.acquired == 1
+    # Stopped by itself, and holding on to the cube
+    assert grabber.state == State.HOLDING
+    assert left_motor.state == grabber_module.HOLD_SPEED
+
+    # Still holding with the trigger held down or let go
+    grabber.intake()
+    grabber.release()
+    assert left_motor.state == grabber_module.HOLD_SPEED
+
+    grabber.eject()
+    assert grabber.state == State.SPITTING and left_motor.state == -1
+    sensor.state = False
+    grabber.update()
+    clock.time += 0.2
+    grabber.update()
+    grabber.release()
+    assert not grabber.has_cube() and grabber.state == State.IDLE
+    assert left_motor.state == 0 and grabber.acquired == 1
+
+
+def test_current_spike_without_sensor():
+    clock = FakeClock()
+    left_motor = CurrentMotor()
+    right_motor = CurrentMotor()
+    grabber = Grabber(left_motor, right_motor, None, clock=clock)
+    assert not grabber.has_cube()
+
+    def tick(current):
+        left_motor.current = right_motor.current = current
+        grabber.update()
+        grabber.intake()
+        clock.time += 0.02
+
+    # Spinning up draws a lot, but doesn't count
+    for _ in range(10):
+        tick(40.0)
+    assert grabber.state == State.INTAKING
+    for _ in range(10):
+        tick(5.0)
+    # A short spike doesn't count either
+    for _ in range(3):
+        tick(20.0)
+    tick(5.0)
+    assert not grabber.has_cube()
+
+    for _ in range(10):
+        tick(20.0)
+    assert grabber.has_cube() and grabber.acquired == 1
+    assert grabber.state == State.HOLDING
+    assert left_motor.state == grabber_module.HOLD_SPEED
+
+    # Only forgotten once it's spat out
+    grabber.update()
+    grabber.eject()
+    assert not grabber.has_cube()
+
+
+def test_current_from_snapshot():
+    # The robot reads the intake current once per loop into its snapshot
+    # and hands the grabber a function to read it from there
+    clock = FakeClock()
+    left_motor = CurrentMotor()
+    current = [0.0]
+    grabber = Grabber(left_motor, CurrentMotor(), None, clock=clock, current=lambda: current[0])
+    left_motor.current = 40.0
+    for _ in range(30):
+        grabber.update()
+        grabber.intake()
+        clock.time += 0.02
+    assert not grabber.has_cube()
+
+    current[0] = 20.0
+    for _ in range(10):
+        grabber.update()
+        grabber.intake()
+        clock.time += 0.02
     assert grabber.has_cube()
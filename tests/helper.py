@@ -7,3 +7,45 @@ class GetSet:
 
     def set(self, state):
         self.state = state
+
+
+class FakeClock:
+    """
+    A clock function for subsystems that take one, which only moves when a
+    test sets time.
+    """
+    def __init__(self):
+        self.time = 0.0
+
+    def __call__(self):
+        return self.time
+
+
+class MockTalon(GetSet):
+    """
+    A Talon with an encoder. Closed loop setpoints are reached straight
+    away, unless instant is False, in which case position stays wherever
+    the test puts it.
+    """
+    def __init__(self, instant=True):
+        GetSet.__init__(self, 0)
+        self.mode = None
+        self.position = 0
+        self.instant = instant
+        self.sets = 0
+
+    def set(self, *args):
+        self.sets += 1
+        if len(args) == 1:
+            self.mode = None
+            self.state = args[0]
+        else:
+            self.mode, self.state = args
+            if self.instant:
+                self.position = self.state
+
+    def getSelectedSensorPosition(self, pid):
+        return self.position
+
+    def setSelectedSensorPosition(self, position, pid, timeout):
+        self.position = position
@@ -0,0 +1,24 @@
+'''
+    Checks that the periodic methods and subsystem calls stay within their
+    share of the loop, see benchmarks/robot_loop.py. Timing depends on the
+    machine, so this only runs when BENCHMARK_RESULTS says where to save the
+    results.
+'''
+
+import os
+
+import pytest
+
+from benchmarks import robot_loop
+
+RESULTS_PATH = os.environ.get('BENCHMARK_RESULTS')
+
+
+@pytest.mark.skipif(not RESULTS_PATH, reason="set BENCHMARK_RESULTS to run the loop benchmarks")
+def test_loop_budgets(robot):
+    robot.robotInit()
+    results = robot_loop.measure(robot)
+    robot_loop.save(results, RESULTS_PATH)
+
+    over = [name for name, result in results.items() if not result['ok']]
+    assert not over, "Over budget: {}".format(', '.join(over))
@@ -0,0 +1,99 @@
+import looptiming
+from helper import FakeClock
+from looptiming import LoopTimer, PhaseStats
+from telemetry import Telemetry
+
+
+class FakeTable:
+    def __init__(self):
+        self.values = {}
+
+    def putNumberArray(self, key, value):
+        self.values[key] = value
+
+
+def test_phase_stats():
+    stats = PhaseStats("test", budget=0.02)
+    assert stats.summary() == [0, 0, 0, 0, 0]
+    for _ in range(98):
+        stats.record(0.001)
+    stats.record(0.015)
+    stats.record(0.05)
+    p50, p99, worst, overruns, total_overruns = stats.summary()
+    assert abs(p50 - 1.0) < 0.11
+    assert abs(p99 - 15.0) < 0.11
+    assert worst == 50.0
+    assert overruns == 1
+    stats.reset()
+    stats.record(0.03)
+    assert stats.summary()[2:] == [30.0, 1, 2]
+
+
+def test_swap():
+    stats = PhaseStats("test", budget=0.02)
+    stats.record(0.001)
+    stats.record(0.03)
+    window = stats.swap()
+    assert stats.samples == 0 and stats.max == 0.0 and stats.overruns == 0
+    # The spare isn't back yet, so the next window keeps going
+    stats.record(0.002)
+    assert stats.swap() is None
+    assert window.resolve()[1:] == [30.0, 30.0, 1, 1]
+    assert sum(window.buckets) == 0
+    assert stats.spare_ready
+    window = stats.swap()
+    assert window.resolve()[2] == 2.0
+
+
+def test_unswap():
+    stats = PhaseStats("test", budget=0.02)
+    stats.record(0.001)
+    window = stats.swap()
+    stats.record(0.03)
+    stats.unswap(window)
+    assert stats.samples == 2
+    assert stats.summary()[2:] == [30.0, 1, 1]
+    assert stats.swap() is not None
+
+
+def test_loop_timer():
+    clock = FakeClock()
+    table = FakeTable()
+    telemetry = Telemetry(table)
+    timer = LoopTimer(telemetry, publish_period=1.0, clock=clock)
+    drivetrain = timer.phase("drivetrain")
+
+    # 50 loops of 20 ms each, every tenth one overrunning
+    for tick in range(50):
+        timer.start_loop()
+        with drivetrain:
+            clock.time += 0.002
+        clock.time += 0.023 if tick % 10 == 0 else 0.003
+        timer.end_loop()
+        clock.time = (tick + 1) * looptiming.LOOP_PERIOD
+    assert table.values == {}
+
+    timer.start_loop()
+    timer.end_loop()
+    # Stats are reset as soon as the window is handed off, but the summary is
+    # only worked out when the telemetry thread flushes
+    assert timer.phases["drivetrain"].samples == 0
+    assert table.values == {}
+    telemetry.flush()
+    assert abs(table.values["loop_timing/drivetrain"][0] - 2.0) < 1e-6
+    loop = table.values["loop_timing/loop"]
+    assert abs(loop[2] - 25.0) < 1e-6
+    assert loop[3:] == [5, 5]
+
+
+def test_loop_timer_queue_full():
+    clock = FakeClock()
+    telemetry = Telemetry(FakeTable(), capacity=1)
+    timer = LoopTimer(telemetry, publish_period=1.0, clock=clock)
+    timer.phase("drivetrain").stats.record(0.001)
+    clock.time = 1.0
+    timer.end_loop()
+    # Only the loop window fit, so the drivetrain one was put back
+    assert telemetry.dropped == 1
+    assert timer.phases["drivetrain"].samples == 1
+    assert timer.phases["drivetrain"].spare_ready
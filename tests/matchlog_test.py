@@ -0,0 +1,373 @@
+import math
+import os
+
+import actuators
+import matchlog
+import network
+from snapshot import SensorSnapshot, TalonState
+from subsystems.odometry import Pose
+
+
+class MockController:
+    def __init__(self):
+        self.forward = 0.0
+
+    def getX(self, hand):
+        return 0.0
+
+    def getY(self, hand):
+        return self.forward
+
+    def getTriggerAxis(self, hand):
+        return 0.0
+
+    def getPOV(self):
+        return -1
+
+    def getAButton(self):
+        return False
+
+    def getBButton(self):
+        return False
+
+    def getXButton(self):
+        return False
+
+    def getYButton(self):
+        return True
+
+    def getBumper(self, hand):
+        return False
+
+
+class MockGyro:
+    def getAngle(self):
+        return 45.0
+
+    def getRate(self):
+        return 2.0
+
+
+class MockDriverStation:
+    def getGameSpecificMessage(self):
+        return 'LRL'
+
+
+class MockVisionSocket:
+    def __init__(self):
+        self.sample = None
+
+    def latest_sample(self):
+        return self.sample
+
+
+class MockOdometry:
+    def __init__(self):
+        self.pose = Pose(0.0, 0.0, 0.0, 0.0)
+        self.resets = 1
+
+    def get_pose(self):
+        return self.pose
+
+    def get_distance(self):
+        return self.pose.x
+
+
+class MockMotor:
+    def set(self, value):
+        pass
+
+
+class MockTalon:
+    def __init__(self):
+        self.position = 0
+
+    def getSelectedSensorPosition(self, pid):
+        return self.position
+
+    def getSelectedSensorVelocity(self, pid):
+        return 0
+
+    def getOutputCurrent(self):
+        return 1.5
+
+    def getSensorCollection(self):
+        return self
+
+    def isFwdLimitSwitchClosed(self):
+        return False
+
+    def isRevLimitSwitchClosed(self):
+        return self.position == 0
+
+
+class MockRobot:
+    """
+    Drives one motor from the driver's right stick, times a gain, the way
+    teleopPeriodic drives the real robot from its snapshot. In autonomous
+    the motor is driven from how far odometry says the robot went in the
+    last 30 ms.
+    """
+    def __init__(self, clock, gain=1.0):
+        self.driver = MockController()
+        self.vision_socket = MockVisionSocket()
+        self.talon = MockTalon()
+        self.odometry = MockOdometry()
+        self.sensors = SensorSnapshot(
+            self.driver, MockController(), MockGyro(), self.vision_socket,
+            MockDriverStation(), clock=clock, talons={'lift': self.talon},
+            odometry=self.odometry)
+        self.actuators = actuators.ActuatorBank()
+        self.motor = self.actuators.add('motor', actuators.CachedActuator(MockMotor()))
+        self.gain = gain
+        self.mode = matchlog.DISABLED
+        self.calls = []
+
+    def disabledInit(self):
+        self.calls.append('disabledInit')
+
+    def disabledPeriodic(self):
+        self.mode = matchlog.DISABLED
+        self.sensors.update()
+
+    def autonomousInit(self):
+        self.calls.append('autonomousInit')
+
+    def autonomousPeriodic(self):
+        self.mode = matchlog.AUTONOMOUS
+        self.sensors.update(controllers=False)
+        odometry = self.sensors.odometry
+        then = odometry.get_pose_at(self.sensors.time - 0.03)
+        moved = odometry.get_pose().x - then.x if then is not None else 0.0
+        self.motor.set(moved * self.gain)
+
+    def teleopInit(self):
+        self.calls.append('teleopInit')
+
+    def teleopPeriodic(self):
+        self.mode = matchlog.TELEOP
+        self.sensors.update()
+        self.motor.set(self.sensors.driver.right_y * self.gain)
+
+    def robotPeriodic(self):
+        pass
+
+
+def record_match(path):
+    now = [0.0]
+    robot = MockRobot(lambda: now[0])
+    columns = matchlog.robot_columns(robot.actuators, robot.sensors.talons)
+    recorder = matchlog.MatchRecorder(str(path), columns, capacity=100)
+    for tick in range(10):
+        now[0] = tick * 0.02
+        robot.driver.forward = tick / 10
+        robot.talon.position = tick * 100
+        if tick == 5:
+            robot.vision_socket.sample = network.VisionSample(0.09, 0.1, 7, 12.5)
+        if tick < 3:
+            robot.disabledPeriodic()
+        else:
+            robot.teleopPeriodic()
+        recorder.record(robot)
+    recorder.close()
+
+
+def test_round_trip(tmpdir):
+    path = tmpdir.join('match.mlog')
+    record_match(path)
+
+    log = matchlog.MatchLog(str(path))
+    assert len(log) == 10
+    assert list(log.column('mode')) == [matchlog.DISABLED] * 3 + [matchlog.TELEOP] * 7
+    assert abs(log.column('time')[9] - 0.18) < 1e-9
+    assert abs(log.column('driver_right_y')[4] - 0.4) < 1e-6
+    assert log.column('driver_pov')[0] == -1
+    assert log.column('driver_y_button')[0] is True
+    assert log.column('gyro_angle')[0] == 45.0
+    assert matchlog.autonomous.GAME_MESSAGES[log.column('game_message')[0] - 1] == 'LRL'
+    assert log.column('vision_id')[4] == -1
+    assert math.isnan(log.column('vision_angle')[4])
+    assert log.column('vision_id')[5] == 7
+    assert log.column('vision_angle')[5] == 12.5
+    assert log.column('out_motor')[2] == 0.0
+    assert abs(log.column('out_motor')[4] - 0.4) < 1e-6
+    assert log.column('lift_position')[4] == 400
+    assert log.column('lift_current')[4] == 1.5
+    assert log.column('lift_reverse_limit')[0] is True
+    assert log.column('lift_reverse_limit')[1] is False
+    log.close()
+
+
+def test_large_vision_id(tmpdir):
+    path = tmpdir.join('ids.mlog')
+    robot = MockRobot(lambda: 1.0)
+    recorder = matchlog.MatchRecorder(str(path), matchlog.robot_columns(robot.actuators), capacity=10)
+    robot.vision_socket.sample = network.VisionSample(0.9, 1.0, 0xFFFFFFFF, 3.0)
+    robot.disabledPeriodic()
+    assert recorder.record(robot)
+    recorder.close()
+
+    log = matchlog.MatchLog(str(path))
+    assert log.column('vision_id')[0] == 0xFFFFFFFF
+    log.close()
+
+
+def test_next_log_path(tmpdir):
+    directory = str(tmpdir.join('logs'))
+    paths = []
+    for _ in range(5):
+        paths.append(matchlog.next_log_path(directory, keep=3))
+        open(paths[-1], 'w').close()
+    assert [path[-9:] for path in paths] == ['0000.mlog', '0001.mlog', '0002.mlog', '0003.mlog', '0004.mlog']
+    # Only the newest are kept, and numbering carries on after the newest
+    assert sorted(os.listdir(directory)) == ['0002.mlog', '0003.mlog', '0004.mlog']
+    tmpdir.join('logs', 'notes.txt').write('')
+    assert matchlog.next_log_path(directory, keep=3).endswith('0005.mlog')
+    assert sorted(os.listdir(directory)) == ['0003.mlog', '0004.mlog', 'notes.txt']
+
+
+def test_full_log_drops_rows(tmpdir):
+    path = str(tmpdir.join('full.mlog'))
+    columns = [matchlog.Column('value', 'i', lambda source: source)]
+    recorder = matchlog.MatchRecorder(path, columns, capacity=3)
+    recorder.start_match()
+    assert all(recorder.record(i) for i in range(3))
+    assert not recorder.record(3)
+    assert recorder.dropped == 1
+    recorder.close()
+
+    log = matchlog.MatchLog(path)
+    assert list(log.column('value')) == [0, 1, 2]
+    log.close()
+
+
+def test_prematch_rows_are_overwritten(tmpdir):
+    # However long the robot sits disabled, only the newest rows from before
+    # the match are kept, and the match gets the rest of the log
+    path = str(tmpdir.join('prematch.mlog'))
+    columns = [
+        matchlog.Column('value', 'i', lambda source: source),
+        matchlog.Column('half', 'd', lambda source: source / 2),
+    ]
+    recorder = matchlog.MatchRecorder(path, columns, capacity=10, lead=3)
+    assert all(recorder.record(i) for i in range(25))
+    assert recorder.dropped == 0
+    recorder.start_match()
+    assert recorder.rows == 3
+    assert all(recorder.record(i) for i in range(100, 107))
+    assert not recorder.record(107)
+    recorder.close()
+
+    log = matchlog.MatchLog(path)
+    assert list(log.column('value')) == [22, 23, 24] + list(range(100, 107))
+    assert list(log.column('half')) == [value / 2 for value in log.column('value')]
+    log.close()
+
+
+def test_partial_log_is_readable(tmpdir):
+    # Rows are counted in the header as they're written, so a log that was
+    # never closed still reads back up to the last complete row.
+    path = str(tmpdir.join('partial.mlog'))
+    columns = [matchlog.Column('value', 'd', lambda source: source)]
+    recorder = matchlog.MatchRecorder(path, columns, capacity=10)
+    recorder.record(1.5)
+    recorder.record(2.5)
+
+    log = matchlog.MatchLog(path)
+    assert list(log.column('value')) == [1.5, 2.5]
+    log.close()
+    recorder.close()
+
+
+def test_replay_snapshot(tmpdir):
+    path = tmpdir.join('match.mlog')
+    record_match(path)
+    log = matchlog.MatchLog(str(path))
+
+    sensors = matchlog.ReplaySnapshot(log)
+    sensors.load(6)
+    assert sensors.now() == sensors.time
+    assert abs(sensors.driver.right_y - 0.6) < 1e-6
+    assert sensors.operator.right_y == 0.0
+    assert sensors.gyro.getAngle() == 45.0
+    assert sensors.game_message == 'LRL'
+    assert sensors.vision.get_id() == 7
+    assert sensors.vision.get_angle(1.0) == 12.5
+    sensors.load(0)
+    assert sensors.vision.get_angle(1.0) is None
+
+    # Talon readings are loaded into the states given, and rows given to
+    # advance are only loaded on update
+    lift = TalonState()
+    sensors = matchlog.ReplaySnapshot(log, {'lift': lift})
+    sensors.advance(3)
+    assert lift.getSelectedSensorPosition(0) == 0
+    sensors.update()
+    assert lift.getSelectedSensorPosition(0) == 300
+    assert lift.getOutputCurrent() == 1.5
+    assert not lift.getSensorCollection().isRevLimitSwitchClosed()
+    log.close()
+
+
+def test_replay_matches(tmpdir):
+    path = tmpdir.join('match.mlog')
+    record_match(path)
+    log = matchlog.MatchLog(str(path))
+
+    robot = MockRobot(lambda: 0.0)
+    assert matchlog.replay(robot, log) == []
+    assert robot.calls == ['disabledInit', 'teleopInit']
+    log.close()
+
+
+def record_autonomous(path):
+    now = [0.0]
+    robot = MockRobot(lambda: now[0])
+    columns = matchlog.robot_columns(robot.actuators, robot.sensors.talons)
+    recorder = matchlog.MatchRecorder(str(path), columns, capacity=100)
+    for tick in range(10):
+        now[0] = tick * 0.02
+        # Odometry updates faster than the loop, but not in step with it
+        robot.odometry.pose = Pose(now[0] - 0.003, tick * tick * 0.01, 0.0, 0.0)
+        robot.autonomousPeriodic()
+        recorder.record(robot)
+    recorder.close()
+
+
+def test_replay_autonomous(tmpdir):
+    path = tmpdir.join('auto.mlog')
+    record_autonomous(path)
+    log = matchlog.MatchLog(str(path))
+    assert abs(log.column('odometry_x')[5] - 0.25) < 1e-9
+    assert log.column('odometry_resets')[0] == 1
+
+    # The robot's own odometry is somewhere else entirely, but autonomous
+    # only sees the logged poses
+    robot = MockRobot(lambda: 0.0)
+    robot.odometry.pose = Pose(0.0, 100.0, 0.0, 0.0)
+    assert matchlog.replay(robot, log) == []
+    assert robot.calls == ['autonomousInit']
+
+    robot = MockRobot(lambda: 0.0, gain=0.5)
+    differences = matchlog.replay(robot, log)
+    assert [difference.row for difference in differences] == list(range(2, 10))
+    log.close()
+
+
+def test_replay_finds_differences(tmpdir):
+    path = tmpdir.join('match.mlog')
+    record_match(path)
+    log = matchlog.MatchLog(str(path))
+
+    robot = MockRobot(lambda: 0.0, gain=0.5)
+    differences = matchlog.replay(robot, log)
+    # Ticks 3 through 9 are teleop, where the output is halved
+    assert [difference.row for difference in differences] == list(range(3, 10))
+    assert all(difference.name == 'motor' for difference in differences)
+    assert abs(differences[-1].recorded - 0.9) < 1e-6
+    assert abs(differences[-1].replayed - 0.45) < 1e-6
+
+    # Only the modes asked for are compared
+    robot = MockRobot(lambda: 0.0, gain=0.5)
+    assert matchlog.replay(robot, log, modes=(matchlog.DISABLED,)) == []
+    log.close()
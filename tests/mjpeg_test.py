@@ -0,0 +1,81 @@
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+
+from server import mjpeg
+
+
+def part(frame, boundary=b'--frame', length=True):
+    headers = boundary + b'\r\nContent-Type: image/jpeg\r\n'
+    if length:
+        headers += 'Content-Length: {}\r\n'.format(len(frame)).encode('ascii')
+    return headers + b'\r\n' + frame + b'\r\n'
+
+
+def test_parse_frames():
+    parser = mjpeg.MjpegParser(b'frame')
+    assert parser.feed(part(b'first') + part(b'second')) == [b'first', b'second']
+    # The boundary can be given with its dashes, and the frames can contain
+    # anything, even a boundary, since the Content-Length is used
+    parser = mjpeg.MjpegParser(b'--frame')
+    assert parser.feed(b'junk before the first part\r\n' + part(b'--frame\r\n')) == [b'--frame\r\n']
+
+
+def test_parse_without_length():
+    # Without a Content-Length, a frame ends at the next boundary
+    parser = mjpeg.MjpegParser(b'frame')
+    assert parser.feed(part(b'first', length=False)) == []
+    assert parser.feed(part(b'second', length=False)) == [b'first']
+    assert parser.feed(b'--frame') == [b'second']
+
+
+def test_parse_split_frames():
+    data = part(b'\xff\xd8' + b'x' * 100 + b'\xff\xd9') + part(b'second')
+    for size in [1, 3, 7, 64]:
+        parser = mjpeg.MjpegParser(b'frame')
+        frames = []
+        for i in range(0, len(data), size):
+            frames += parser.feed(data[i:i + size])
+        assert frames == [b'\xff\xd8' + b'x' * 100 + b'\xff\xd9', b'second']
+
+
+def test_parse_drops_oversized(monkeypatch):
+    monkeypatch.setattr(mjpeg, 'MAX_FRAME_SIZE', 100)
+    parser = mjpeg.MjpegParser(b'frame')
+    assert parser.feed(b'--frame\r\nContent-Length: 1000\r\n\r\n' + b'x' * 200) == []
+    assert len(parser.buffer) == 0
+    # It starts over with the next part
+    assert parser.feed(part(b'next')) == [b'next']
+
+
+class MockStream:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_relay_closes_unwatched_connection(monkeypatch):
+    # Everyone leaves while the relay is still connecting to the camera
+    relay = mjpeg.MjpegRelay('http://camera:1181/stream.mjpg', reconnect_delay=0)
+    page = object()
+    stream = MockStream()
+
+    class MockClient:
+        def connect(self, host, port):
+            relay.remove_client(page)
+            connected = Future()
+            connected.set_result(stream)
+            return connected
+
+    monkeypatch.setattr(mjpeg, 'TCPClient', MockClient)
+
+    async def watch():
+        relay.add_client(page, mjpeg.ClientStats('page', mjpeg.MAX_FPS, 0))
+        while relay.running:
+            await gen.sleep(0.01)
+
+    IOLoop.current().run_sync(watch, timeout=5)
+    assert stream.closed
+    assert relay.stream is None
@@ -1,3 +1,6 @@
+import socket
+import time
+
 import network
 
 def test_read_packet():
@@ -6,3 +9,198 @@ def test_read_packet():
     assert vision_socket.get_angle(max_staleness=9999) == 420
     assert vision_socket.get_id() == 69
     vision_socket.close()
+
+def test_read_binary_packet():
+    vision_socket = network.VisionSocket()
+    vision_socket._read_packet(network.encode_packet(packet_id=70, angle=-12.5))
+    assert vision_socket.get_angle(max_staleness=9999) == -12.5
+    assert vision_socket.get_id() == 70
+    assert vision_socket.packet_format == "binary"
+    vision_socket.close()
+
+def test_read_packet_from_buffer():
+    vision_socket = network.VisionSocket()
+    packet = network.encode_packet(packet_id=71, angle=3.0)
+    vision_socket.buffer[:len(packet)] = packet
+    vision_socket._read_packet(vision_socket.buffer_view[:len(packet)])
+    assert vision_socket.get_angle(max_staleness=9999) == 3.0
+    assert vision_socket.get_id() == 71
+    vision_socket.close()
+
+def test_decode_packet():
+    assert network.decode_packet(network.encode_packet(5, 1.5, 0.25)) == (network.SENDER_VISION, 5, 1.5, 0.25)
+    json_packet = b'{"sender": "vision", "angle": 1.5, "id": 5}'
+    assert network.decode_packet(json_packet) == (network.SENDER_VISION, 5, 1.5, 0.0)
+    v1_packet = network.PACKET_V1.pack(network.PACKET_MAGIC, 1, network.SENDER_VISION, 5, 1.5)
+    assert network.decode_packet(v1_packet) == (network.SENDER_VISION, 5, 1.5, 0.0)
+    assert network.decode_packet(b'{"sender": "other"}')[0] == network.SENDER_UNKNOWN
+
+def test_decode_bad_packets():
+    bad_packets = [
+        b'',
+        b'\x76',
+        b'garbage packet',
+        network.encode_packet(5, 1.5)[:-1],
+        network.PACKET_V1.pack(network.PACKET_MAGIC, 99, network.SENDER_VISION, 5, 1.5),
+    ]
+    for packet in bad_packets:
+        try:
+            network.decode_packet(packet)
+        except ValueError:
+            pass
+        else:
+            assert False, "Expected {} to be rejected".format(packet)
+
+def test_decode_bad_json_fields():
+    # Decodes, but with values of the wrong type; these used to get as far
+    # as VisionHistory and kill the receive thread
+    bad_packets = [
+        b'{"sender": "vision", "angle": 1.5, "id": null}',
+        b'{"sender": "vision", "angle": 1.5, "id": "five"}',
+        b'{"sender": "vision", "angle": "left", "id": 5}',
+        b'{"sender": "vision", "angle": null, "id": 5}',
+        b'{"sender": "vision", "angle": 1.5, "id": 5, "latency": "slow"}',
+        b'{"sender": "vision", "angle": 1.5, "id": -1}',
+        b'{"sender": "vision", "angle": 1.5, "id": 1e400}',
+        b'{"sender": "vision", "angle": NaN, "id": 5}',
+        b'["sender", "vision"]',
+        b'{"sender": ["vision"]}',
+    ]
+    for packet in bad_packets:
+        try:
+            network.decode_packet(packet)
+        except ValueError:
+            pass
+        except (KeyError, TypeError) as e:
+            # Still caught by the receive loop, but shouldn't happen
+            assert isinstance(e, KeyError), "{} raised {!r}".format(packet, e)
+        else:
+            assert False, "Expected {} to be rejected".format(packet)
+
+    # Numbers are coerced to the types a binary packet has
+    packet = network.decode_packet(b'{"sender": "vision", "angle": 2, "id": 5.0, "latency": 0}')
+    assert packet == (network.SENDER_VISION, 5, 2.0, 0.0)
+    assert type(packet[1]) is int and type(packet[2]) is float
+
+def test_bad_json_packets_keep_receiving():
+    vision_socket = network.VisionSocket(ip='127.0.0.1', port=0)
+    address = vision_socket.socket.getsockname()
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    vision_socket.start()
+    for packet in [b'{"sender": "vision", "angle": 1.5, "id": null}',
+                   b'{"sender": "vision", "angle": "1.5x", "id": 1}',
+                   b'{"sender": "vision", "angle": 1.5, "id": 2, "latency": "x"}',
+                   b'[1, 2]']:
+        sender.sendto(packet, address)
+    wait_for(lambda: vision_socket.bad_packets == 4)
+    sender.sendto(network.encode_packet(packet_id=9, angle=4.0), address)
+    wait_for(lambda: vision_socket.get_id() == 9)
+    assert vision_socket.is_alive()
+    sender.close()
+    vision_socket.close()
+
+def test_vision_history():
+    history = network.VisionHistory(capacity=4)
+    assert history.latest() is None
+    assert history.get_angle_at(1.0) is None
+    assert len(history.history(3)) == 0
+
+    for i in range(6):
+        history.append(capture_time=i, receive_time=i + 0.1, packet_id=i, angle=i * 10.0)
+
+    assert len(history) == 4
+    assert history.latest() == (5, 5.1, 5, 50.0)
+    recent = history.history(3)
+    assert len(recent) == 3
+    assert [sample.id for sample in recent] == [5, 4, 3]
+    assert recent[-1].id == 3
+    # Only samples 2 through 5 are still in the buffer
+    assert len(history.history(10)) == 4
+    assert history.get_angle_at(1.5) is None
+    assert history.get_angle_at(2) == 20.0
+    assert history.get_angle_at(3.25) == 32.5
+    assert history.get_angle_at(5) == 50.0
+    assert history.get_angle_at(99) == 50.0
+
+def test_vision_history_out_of_order():
+    history = network.VisionHistory(capacity=8)
+    # Jittered latencies: packets arrive in order, but the frames weren't
+    # captured in order
+    receive_times = [1.0, 1.1, 1.2, 1.3, 1.4, 1.5]
+    latencies = [0.05, 0.2, 0.02, 0.3, 0.1, 0.1]
+    kept = [
+        history.append(receive_time - latency, receive_time, i, i * 10.0)
+        for i, (receive_time, latency) in enumerate(zip(receive_times, latencies))
+    ]
+    assert kept == [True, False, True, False, True, True]
+    assert history.rejected == 2
+    capture_times = [sample.capture_time for sample in history.history(len(history))]
+    assert capture_times == sorted(capture_times, reverse=True)
+    # Interpolates between neighbouring capture times, never across a
+    # rejected sample
+    for t in [0.95, 1.0, 1.1, 1.18, 1.25, 1.3, 1.35, 1.4]:
+        angle = history.get_angle_at(t)
+        assert 0.0 <= angle <= 50.0
+    assert history.get_angle_at(1.18) == 20.0
+    assert abs(history.get_angle_at(1.24) - 30.0) < 1e-6
+    # Same capture time as the newest is fine
+    assert history.append(1.4, 1.6, 6, 60.0)
+    assert history.get_angle_at(1.4) == 60.0
+
+def test_out_of_order_packet_ignored():
+    vision_socket = network.VisionSocket()
+    vision_socket._read_packet(network.encode_packet(packet_id=1, angle=10.0, latency=0.0))
+    vision_socket._read_packet(network.encode_packet(packet_id=2, angle=20.0, latency=5.0))
+    assert vision_socket.get_id() == 1
+    assert vision_socket.get_angle(max_staleness=9999) == 10.0
+    assert len(vision_socket.samples) == 1
+    vision_socket.close()
+
+def test_latency_compensation():
+    vision_socket = network.VisionSocket()
+    vision_socket._read_packet(network.encode_packet(packet_id=1, angle=10.0, latency=0.5))
+    sample = vision_socket.latest_sample()
+    assert sample.id == 1
+    assert abs(sample.receive_time - sample.capture_time - 0.5) < 1e-6
+    assert vision_socket.get_angle_at(sample.capture_time) == 10.0
+    assert vision_socket.history(1)[0] == sample
+    vision_socket.close()
+
+def wait_for(condition, timeout=2.0):
+    end_time = time.time() + timeout
+    while not condition():
+        assert time.time() < end_time, "Timed out waiting"
+        time.sleep(0.001)
+
+def test_receive_burst_keeps_newest():
+    vision_socket = network.VisionSocket(ip='127.0.0.1', port=0)
+    assert vision_socket.is_bound()
+    address = vision_socket.socket.getsockname()
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    # Queue a burst of packets before the thread starts so they are all
+    # read on the first wakeup.
+    for packet_id in range(1, 4):
+        sender.sendto(network.encode_packet(packet_id=packet_id, angle=packet_id * 1.0), address)
+    sender.sendto(b'not a packet', address)
+    vision_socket.start()
+    wait_for(lambda: vision_socket.received_packets == 4)
+    assert vision_socket.get_id() == 3
+    assert vision_socket.get_angle(max_staleness=9999) == 3.0
+    assert vision_socket.dropped_packets == 2
+    assert vision_socket.bad_packets == 1
+    assert vision_socket.last_backlog == 4
+    assert vision_socket.max_backlog == 4
+    sender.close()
+
+    start = time.time()
+    vision_socket.close()
+    vision_socket.join(timeout=1.0)
+    assert not vision_socket.is_alive()
+    assert time.time() - start < 0.1
+    vision_socket.close()
+
+def test_close_without_start():
+    vision_socket = network.VisionSocket(ip='127.0.0.1', port=0)
+    vision_socket.close()
+    vision_socket.close()
+    assert vision_socket.closed
@@ -0,0 +1,102 @@
+import math
+
+from subsystems.odometry import Odometry
+
+
+class FakeRobot:
+    """
+    Stands in for the gyro and both encoders.
+    """
+    def __init__(self):
+        self.angle = 30.0
+        self.left = 100.0
+        self.right = -20.0
+        self.time = 0.0
+
+    def getAngle(self):
+        return self.angle
+
+    def get_left(self):
+        return self.left
+
+    def get_right(self):
+        return self.right
+
+    def clock(self):
+        return self.time
+
+    def step(self, left, right, turn=0.0):
+        self.left += left
+        self.right += right
+        self.angle += turn
+        self.time += 0.005
+
+
+def make_odometry(robot):
+    return Odometry(robot, robot.get_left, robot.get_right, clock=robot.clock)
+
+
+def close(a, b):
+    return abs(a - b) < 1e-6
+
+
+def test_drive_straight():
+    robot = FakeRobot()
+    odometry = make_odometry(robot)
+    for _ in range(100):
+        robot.step(0.05, 0.05)
+        odometry.update()
+    pose = odometry.get_pose()
+    assert close(pose.x, 5.0)
+    assert close(pose.y, 0.0)
+    assert close(pose.heading, 0.0)
+    assert close(odometry.get_distance(), 5.0)
+
+
+def test_turn_and_drive():
+    robot = FakeRobot()
+    odometry = make_odometry(robot)
+    # Turn 90 degrees clockwise in place, then drive 2 feet
+    for _ in range(10):
+        robot.step(0.01, -0.01, turn=9.0)
+        odometry.update()
+    for _ in range(40):
+        robot.step(0.05, 0.05)
+        odometry.update()
+    pose = odometry.get_pose()
+    assert close(pose.heading, 90.0)
+    assert close(pose.x, 0.0)
+    # Clockwise is to the right, which is negative y
+    assert close(pose.y, -2.0)
+
+
+def test_arc():
+    robot = FakeRobot()
+    odometry = make_odometry(robot)
+    # Quarter circle with a 4 foot radius, turning left
+    steps = 1000
+    arc = math.pi / 2 * 4
+    for _ in range(steps):
+        robot.step(arc / steps, arc / steps, turn=-90.0 / steps)
+        odometry.update()
+    pose = odometry.get_pose()
+    assert abs(pose.x - 4.0) < 1e-3
+    assert abs(pose.y - 4.0) < 1e-3
+
+
+def test_get_pose_at():
+    robot = FakeRobot()
+    odometry = make_odometry(robot)
+    start = odometry.get_pose()
+    for _ in range(10):
+        robot.step(0.1, 0.1)
+        odometry.update()
+    pose = odometry.get_pose_at(0.0125)
+    assert close(pose.x, 0.25)
+    assert odometry.get_pose_at(-1) is None
+    assert odometry.get_pose_at(99) == odometry.get_pose()
+    assert odometry.get_pose_at(start.time).x == 0.0
+
+    odometry.reset(x=1.0, y=2.0)
+    assert odometry.get_pose()[1:] == (1.0, 2.0, 0.0)
+    assert odometry.get_distance() == 0.0
@@ -0,0 +1,102 @@
+import json
+import os
+
+import shaping
+
+PROFILES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'driver_profiles.json')
+
+
+def test_deadband():
+    axis = shaping.Axis(deadband=0.1)
+    assert axis.shape(0.0) == 0.0
+    assert axis.shape(0.05) == 0.0
+    assert axis.shape(-0.09) == 0.0
+    # The output starts from zero at the edge of the deadband
+    assert 0 < axis.shape(0.15) < 0.1
+    assert axis.shape(1.0) == 1.0
+    assert axis.shape(-1.0) == -1.0
+
+
+def test_expo_and_scale():
+    linear = shaping.Axis()
+    cubic = shaping.Axis(expo=1.0, scale=0.5)
+    assert abs(linear.shape(0.5) - 0.5) < 0.01
+    assert abs(cubic.shape(0.5) - 0.5 * 0.125) < 0.01
+    assert cubic.shape(1.0) == 0.5
+    assert cubic.shape(-1.0) == -0.5
+
+
+def test_table_matches_curve():
+    axis = shaping.Axis(deadband=0.08, expo=0.5, scale=0.8)
+    for i in range(-100, 101):
+        value = i / 100
+        assert abs(axis.shape(value) - axis.curve(value)) < 0.005
+
+
+def test_out_of_range_inputs_are_clamped():
+    axis = shaping.Axis(expo=0.5)
+    assert axis.shape(1.5) == 1.0
+    assert axis.shape(-3.0) == -1.0
+
+
+def test_slew_rate():
+    axis = shaping.Axis(slew_rate=5.0, period=0.02)
+    outputs = [axis.shape(1.0) for _ in range(12)]
+    assert abs(outputs[0] - 0.1) < 1e-9
+    assert abs(outputs[4] - 0.5) < 1e-9
+    assert outputs[-1] == 1.0
+    assert abs(axis.shape(-1.0) - 0.9) < 1e-9
+    axis.reset()
+    assert abs(axis.shape(-1.0) + 0.1) < 1e-9
+
+
+def test_bad_settings():
+    for settings in [{'deadband': 1.0}, {'expo': 2.0}]:
+        try:
+            shaping.Axis(**settings)
+        except ValueError:
+            pass
+        else:
+            assert False, "{} should not be allowed".format(settings)
+
+
+def test_load_profiles(tmpdir):
+    path = tmpdir.join('profiles.json')
+    path.write(json.dumps({
+        'first': {'forward': {'deadband': 0.2}, 'trigger_level': 0.5},
+        'second': {},
+    }))
+    profiles = shaping.load_profiles(str(path))
+    assert list(profiles) == ['first', 'second']
+    first = profiles['first']
+    assert first.trigger_level == 0.5
+    assert first.forward.shape(0.15) == 0.0
+    assert first.rotate.shape(0.15) != 0.0
+    assert profiles['second'].trigger_level == shaping.TRIGGER_LEVEL
+
+
+def test_unknown_axis(tmpdir):
+    path = tmpdir.join('profiles.json')
+    path.write(json.dumps({'typo': {'foward': {}}}))
+    try:
+        shaping.load_profiles(str(path))
+    except ValueError:
+        pass
+    else:
+        assert False, "Misspelled axes should not be ignored"
+
+
+def test_repo_profiles():
+    profiles = shaping.load_profiles(PROFILES_PATH)
+    assert 'default' in profiles
+
+
+def test_default_profile_is_about_squared():
+    # Driving used to square the sticks, so the default profile's curve
+    # keeps about the same feel. The raw profile is a straight line.
+    profiles = shaping.load_profiles(PROFILES_PATH)
+    forward = profiles['default'].forward
+    raw = profiles['raw'].forward
+    for value in [0.2, 0.4, 0.6, 0.8, 1.0]:
+        assert abs(forward.curve(value) - value * value) < 0.05
+        assert raw.curve(value) == value
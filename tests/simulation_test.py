@@ -0,0 +1,86 @@
+import numpy as np
+
+import autonomous
+import simulation
+from subsystems.elevator import Elevator
+
+
+def test_arcade_mix():
+    assert simulation.arcade_mix(0.5, 0, squared=False) == (0.5, 0.5)
+    assert simulation.arcade_mix(0, 0.5, squared=False) == (0.5, -0.5)
+    assert simulation.arcade_mix(0.5, 0, squared=True) == (0.25, 0.25)
+    assert simulation.arcade_mix(-0.5, 0, squared=False) == (-0.5, -0.5)
+    assert simulation.arcade_mix(0.01, 0, squared=False) == (0, 0)
+
+
+def test_drive_straight():
+    model = simulation.DriveModel(2)
+    for _ in range(100):
+        model.step(np.array([1.0, 0.5]), np.array([1.0, 0.5]))
+    # Two seconds is plenty to get up to speed
+    assert abs(model.left_speed[0] - model.max_speed) < 0.01
+    assert model.x[0] > model.x[1] > 0
+    assert np.allclose(model.y, 0)
+    assert np.allclose(model.heading, 0)
+    assert np.allclose(model.left_distance, model.x)
+
+
+def test_turns_clockwise():
+    model = simulation.DriveModel(1)
+    for _ in range(10):
+        model.step(0.5, 0.5)
+    for _ in range(20):
+        model.step(0.5, 0.2)
+    # Turning right, like the gyro, and so moving to the right (negative y)
+    assert model.heading[0] > 0
+    assert model.rate[0] > 0
+    assert model.y[0] < 0
+
+
+def test_elevator_limits():
+    model = simulation.DriveModel(1)
+    for _ in range(500):
+        model.step(0, 0, 1.0)
+    assert model.elevator[0] == model.elevator_height
+    for _ in range(500):
+        model.step(0, 0, -1.0)
+    assert model.elevator[0] == 0
+
+
+def test_elevator_closed_loop():
+    sim = simulation.BatchSimulation(2)
+    heights = [Elevator.SWITCH, Elevator.SCALE]
+    routines = [
+        autonomous.ElevatorToHeight(robot.elevator, height, clock=sim.clock)
+        for robot, height in zip(sim.robots, heights)
+    ]
+    finished = sim.run(routines)
+    assert finished[0] < finished[1] < 3
+    assert np.all(np.abs(sim.model.elevator - heights) <= 0.05)
+
+
+def test_batch_rotate():
+    angles = [30, -45, 90, -120]
+    sim = simulation.BatchSimulation(len(angles))
+    routines = [
+        autonomous.RotateAutonomous(robot.drivetrain, robot.gyro, angle=angle, turn_speed=0.6,
+                                    timeout=3, clock=sim.clock)
+        for robot, angle in zip(sim.robots, angles)
+    ]
+    finished = sim.run(routines)
+    assert not np.isnan(finished).any()
+    assert np.all(np.abs(sim.model.heading - angles) < 3)
+
+
+def test_batch_routines():
+    sim = simulation.BatchSimulation(len(autonomous.ROUTINES))
+    routines = [
+        sim.routine(i, function, autonomous.Position.LEFT)
+        for i, function in enumerate(autonomous.ROUTINES.values())
+    ]
+    finished = sim.run(routines)
+    assert not np.isnan(finished).any()
+    assert np.all(finished < 15)
+    assert np.all(sim.model.x > 0)
+    # The elevator went up to the switch on the way, and is still there
+    assert np.allclose(sim.model.elevator, Elevator.SWITCH, atol=0.05)
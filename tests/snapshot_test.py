@@ -0,0 +1,176 @@
+import network
+from snapshot import LEFT, RIGHT, OdometryState, SensorSnapshot
+from subsystems.odometry import Pose
+from helper import MockTalon
+
+
+class CountingController:
+    def __init__(self):
+        self.calls = 0
+
+    def _read(self, value):
+        self.calls += 1
+        return value
+
+    def getX(self, hand):
+        return self._read(0.25 if hand == LEFT else 0.5)
+
+    def getY(self, hand):
+        return self._read(-0.25 if hand == LEFT else -0.5)
+
+    def getTriggerAxis(self, hand):
+        return self._read(0.1 if hand == LEFT else 0.9)
+
+    def getPOV(self):
+        return self._read(90)
+
+    def getAButton(self):
+        return self._read(True)
+
+    def getBButton(self):
+        return self._read(False)
+
+    def getXButton(self):
+        return self._read(True)
+
+    def getYButton(self):
+        return self._read(False)
+
+    def getBumper(self, hand):
+        return self._read(hand == RIGHT)
+
+
+class MockGyro:
+    def __init__(self):
+        self.angle = 10.0
+        self.calls = 0
+
+    def getAngle(self):
+        self.calls += 1
+        return self.angle
+
+    def getRate(self):
+        self.calls += 1
+        return 2.0
+
+
+def test_snapshot():
+    driver = CountingController()
+    operator = CountingController()
+    gyro = MockGyro()
+    vision_socket = network.VisionSocket(ip='127.0.0.1', port=0)
+    now = [100.0]
+    sensors = SensorSnapshot(driver, operator, gyro, vision_socket, clock=lambda: now[0])
+    sensors.update()
+
+    assert sensors.driver.left_x == 0.25
+    assert sensors.driver.right_y == -0.5
+    assert sensors.operator.right_trigger == 0.9
+    assert sensors.operator.pov == 90
+    assert sensors.driver.a_button and not sensors.driver.y_button
+    assert sensors.operator.right_bumper and not sensors.operator.left_bumper
+    assert sensors.gyro.getAngle() == 10.0
+    assert sensors.gyro.getRate() == 2.0
+    assert sensors.vision.get_angle(max_staleness=1.0) is None
+    assert sensors.vision.get_id() == -1
+
+    # Reading the snapshot doesn't touch the hardware again
+    calls = driver.calls, gyro.calls
+    gyro.angle = 20.0
+    for _ in range(10):
+        sensors.driver.left_x
+        sensors.gyro.getAngle()
+    assert (driver.calls, gyro.calls) == calls
+    assert sensors.gyro.getAngle() == 10.0
+
+    vision_socket._read_packet(network.encode_packet(packet_id=3, angle=7.5))
+    now[0] = vision_socket.latest_sample().receive_time + 0.5
+    sensors.update()
+    assert sensors.gyro.getAngle() == 20.0
+    assert sensors.vision.get_angle(max_staleness=1.0) == 7.5
+    assert sensors.vision.get_angle(max_staleness=0.25) is None
+    assert sensors.vision.get_id() == 3
+    # Anything else goes straight to the socket
+    assert sensors.vision.is_bound()
+    vision_socket.close()
+
+
+def test_snapshot_controller_fields():
+    driver = CountingController()
+    operator = CountingController()
+    sensors = SensorSnapshot(driver, operator, MockGyro(), network.MockSocket(),
+                             clock=lambda: 0.0,
+                             driver_fields=('right_y', 'left_x'), operator_fields=('pov',))
+    sensors.update()
+    assert (driver.calls, operator.calls) == (2, 1)
+    assert sensors.driver.right_y == -0.5 and sensors.driver.left_x == 0.25
+    assert sensors.operator.pov == 90
+    # Fields that aren't read keep their defaults
+    assert sensors.driver.right_x == 0.0
+    assert not sensors.operator.a_button
+
+    # Modes that don't drive don't read the controllers at all
+    sensors.update(controllers=False)
+    assert (driver.calls, operator.calls) == (2, 1)
+    assert sensors.driver.right_y == -0.5
+
+
+class LimitTalon(MockTalon):
+    def __init__(self):
+        MockTalon.__init__(self)
+        self.reads = 0
+
+    def getSelectedSensorPosition(self, pid):
+        self.reads += 1
+        return self.position
+
+    def getSelectedSensorVelocity(self, pid):
+        return -20
+
+    def getOutputCurrent(self):
+        return 12.5
+
+    def getSensorCollection(self):
+        return self
+
+    def isFwdLimitSwitchClosed(self):
+        return 1
+
+    def isRevLimitSwitchClosed(self):
+        return 0
+
+
+def test_snapshot_talons():
+    talon = LimitTalon()
+    sensors = SensorSnapshot(CountingController(), CountingController(), MockGyro(),
+                             network.MockSocket(), clock=lambda: 0.0, talons={'lift': talon})
+    talon.position = 1234
+    sensors.update()
+    lift = sensors.talons['lift']
+    assert lift.getSelectedSensorPosition(0) == 1234
+    assert lift.getSelectedSensorVelocity(0) == -20
+    assert lift.getOutputCurrent() == 12.5
+    assert lift.getSensorCollection().isFwdLimitSwitchClosed() is True
+    assert lift.getSensorCollection().isRevLimitSwitchClosed() is False
+
+    talon.position = 0
+    for _ in range(10):
+        lift.getSelectedSensorPosition(0)
+    assert talon.reads == 1
+    assert lift.getSelectedSensorPosition(0) == 1234
+
+
+def test_odometry_state():
+    state = OdometryState()
+    state.load(Pose(1.0, 0.0, 0.0, 0.0), 0.0, resets=1)
+    state.load(Pose(1.02, 1.0, 0.0, 0.0), 1.0, resets=1)
+    # The odometry hadn't updated since the last loop
+    state.load(Pose(1.02, 1.0, 0.0, 0.0), 1.0, resets=1)
+    assert state.history.count == 2
+    assert state.get_pose_at(1.01).x == 0.5
+    assert state.get_distance() == 1.0
+
+    # Poses from before a reset are forgotten
+    state.load(Pose(1.04, 0.0, 0.0, 0.0), 0.0, resets=2)
+    assert state.get_pose_at(1.01) is None
+    assert state.get_pose() == Pose(1.04, 0.0, 0.0, 0.0)
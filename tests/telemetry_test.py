@@ -0,0 +1,116 @@
+from enum import Enum
+
+from telemetry import Deferred, Telemetry
+
+
+class Color(Enum):
+    RED = "red"
+
+
+class FakeTable:
+    def __init__(self):
+        self.values = {}
+
+    def putBoolean(self, key, value):
+        self.values[key] = value
+
+    def putNumber(self, key, value):
+        self.values[key] = value
+
+    def putString(self, key, value):
+        self.values[key] = value
+
+    def putNumberArray(self, key, value):
+        self.values[key] = value
+
+
+def test_flush_publishes_newest_values():
+    table = FakeTable()
+    telemetry = Telemetry(table)
+    telemetry.put("angle", 1.5)
+    telemetry.put("angle", 2.5)
+    telemetry.put("bound", True)
+    telemetry.put("color", Color.RED)
+    telemetry.put("missing", None)
+    telemetry.flush()
+    assert table.values == {"angle": 2.5, "bound": True, "color": "RED"}
+    assert telemetry.head == telemetry.tail
+
+
+def test_full_queue_drops_values():
+    table = FakeTable()
+    telemetry = Telemetry(table, capacity=4)
+    for i in range(6):
+        telemetry.put("count", i)
+    assert telemetry.dropped == 2
+    telemetry.flush()
+    assert table.values["count"] == 3
+    # The ring is reusable once it has been drained
+    for i in range(4):
+        telemetry.put("count", i + 10)
+    telemetry.flush()
+    assert table.values["count"] == 13
+    assert telemetry.dropped == 2
+
+
+def test_deferred_values():
+    table = FakeTable()
+    telemetry = Telemetry(table)
+    resolved = []
+
+    def value(number):
+        resolved.append(number)
+        return [number, number * 2]
+
+    telemetry.put("summary", Deferred(lambda: value(1)))
+    telemetry.put("summary", Deferred(lambda: value(2)))
+    # Nothing is worked out until the worker flushes
+    assert resolved == []
+    telemetry.flush()
+    # Every deferred value is resolved, in order, and the newest is published
+    assert resolved == [1, 2]
+    assert table.values == {"summary": [2, 4]}
+
+
+class BrokenTable(FakeTable):
+    def putNumber(self, key, value):
+        raise AttributeError("'NoneType' object has no attribute 'setEntryValue'")
+
+
+def test_errors_are_counted():
+    table = BrokenTable()
+    telemetry = Telemetry(table)
+    telemetry.put("summary", Deferred(lambda: 1 / 0))
+    telemetry.put("bound", True)
+    telemetry._guarded_flush()
+    assert telemetry.errors == 1
+    assert isinstance(telemetry.last_error, ZeroDivisionError)
+    # The value that failed is gone, and the ones after it are published next
+    telemetry._guarded_flush()
+    assert telemetry.head == telemetry.tail
+    assert table.values == {"bound": True}
+    telemetry.put("angle", 1.5)
+    telemetry._guarded_flush()
+    assert telemetry.errors == 2
+
+
+def test_free_stops_thread():
+    telemetry = Telemetry(BrokenTable(), period=0.001)
+    telemetry.start()
+    telemetry.put("angle", 1.5)
+    telemetry.free()
+    assert not telemetry.is_alive()
+    assert telemetry.errors == 1
+
+
+def test_log_file(tmpdir):
+    log_path = str(tmpdir.join("telemetry.log"))
+    telemetry = Telemetry(log_path=log_path)
+    telemetry.put("color", Color.RED)
+    telemetry.put("angle", 3)
+    telemetry.start()
+    telemetry.close()
+    telemetry.join(timeout=1.0)
+    assert not telemetry.is_alive()
+    with open(log_path) as log:
+        assert "angle=3 color=RED" in log.read()
@@ -0,0 +1,65 @@
+import json
+
+import trajectory
+
+
+def check_profile(profile, distance, max_velocity, max_acceleration):
+    assert abs(profile.distance - distance) < 1e-6
+    assert abs(profile.velocity[-1]) < 1e-6
+    assert all(abs(v) <= max_velocity + 1e-6 for v in profile.velocity)
+    assert all(abs(a) <= max_acceleration + 1e-6 for a in profile.acceleration)
+
+
+def test_trapezoidal():
+    profile = trajectory.trapezoidal(10.0, max_velocity=5.0, max_acceleration=5.0)
+    check_profile(profile, 10.0, 5.0, 5.0)
+    # 1 second to speed up, 1 to slow down and 1 at full speed
+    assert abs(profile.duration - 3.0) < 0.021
+    assert max(profile.velocity) == 5.0
+
+
+def test_triangular():
+    profile = trajectory.trapezoidal(1.0, max_velocity=5.0, max_acceleration=5.0)
+    check_profile(profile, 1.0, 5.0, 5.0)
+    assert max(profile.velocity) < 5.0
+
+
+def test_backwards():
+    profile = trajectory.trapezoidal(-4.0, max_velocity=5.0, max_acceleration=5.0)
+    check_profile(profile, -4.0, 5.0, 5.0)
+    assert min(profile.velocity) < 0
+
+
+def test_s_curve():
+    profile = trajectory.s_curve(10.0, max_velocity=5.0, max_acceleration=5.0, jerk_time=0.2)
+    check_profile(profile, 10.0, 5.0, 5.0)
+    # The acceleration ramps up instead of jumping straight to the maximum
+    assert profile.acceleration[0] < 5.0
+
+
+def test_profile_cache(tmpdir):
+    path = str(tmpdir.join("profiles.json"))
+    specs = {"test": ("trapezoidal", 3.0)}
+    trajectory.load(path, specs)
+    generated = trajectory.profiles["test"]
+    trajectory.profiles.clear()
+
+    with open(path) as cache:
+        assert json.load(cache)["key"] == trajectory.spec_hash(specs)
+    trajectory.load(path, specs)
+    loaded = trajectory.profiles["test"]
+    assert list(loaded.position) == list(generated.position)
+    assert list(loaded.velocity) == list(generated.velocity)
+
+    # A cache made for different specs is ignored
+    trajectory.load(path, {"test": ("trapezoidal", 6.0)})
+    assert abs(trajectory.profiles["test"].distance - 6.0) < 1e-6
+    trajectory.profiles.clear()
+
+
+def test_routine_profiles():
+    trajectory.load()
+    for name in trajectory.PROFILE_SPECS:
+        profile = trajectory.get(name)
+        check_profile(profile, trajectory.PROFILE_SPECS[name][1],
+                      trajectory.CRUISE_VELOCITY, trajectory.MAX_ACCELERATION)
@@ -0,0 +1,64 @@
+import argparse
+
+import tuner
+from autonomous import AutonomousRoutine
+
+
+def test_defaults():
+    assert tuner.defaults(AutonomousRoutine.SIDE_TO_SAME) == {
+        'angle': 15, 'turn_speed': 0.5, 'forward': 0.6, 'forward_time': 1.0,
+    }
+
+
+def test_parse_range():
+    tunable = tuner.defaults(AutonomousRoutine.CENTER)
+    assert tuner.parse_range('first_angle=40:50:5', tunable) == ('first_angle', [40, 50, 5])
+    for text in ['nope=1:2', 'turn_speed=1', 'turn_speed=2:1']:
+        try:
+            tuner.parse_range(text, tunable)
+        except argparse.ArgumentTypeError:
+            pass
+        else:
+            assert False, "{} should not parse".format(text)
+
+
+def test_grid():
+    points = tuner.grid([('a', [0, 1, 0.5]), ('b', [10, 20])])
+    assert len(points) == 3 * 5
+    assert {'a': 0.5, 'b': 12.5} in points
+
+
+def test_random_points():
+    points = tuner.random_points([('a', [0, 1])], 20, seed=1)
+    assert len(points) == 20
+    assert all(0 <= point['a'] <= 1 for point in points)
+    assert points == tuner.random_points([('a', [0, 1])], 20, seed=1)
+
+
+def test_sweep_uses_cache():
+    cache = {}
+    points = [{'angle': 10}, {'angle': 20}, {}]
+    results = tuner.sweep(AutonomousRoutine.SIDE_TO_SAME, points, cache, processes=1)
+    assert len(cache) == 3
+    assert all(result['time'] is not None for result in results)
+    # Turning further ends up further to the right
+    assert results[1]['y'] < results[0]['y']
+
+    evaluated = []
+    evaluate = tuner.evaluate
+    tuner.evaluate = lambda job: evaluated.append(job) or evaluate(job)
+    try:
+        again = tuner.sweep(AutonomousRoutine.SIDE_TO_SAME, points + [{'angle': 30}], cache, processes=1)
+    finally:
+        tuner.evaluate = evaluate
+    assert again[:3] == results
+    assert evaluated == [(AutonomousRoutine.SIDE_TO_SAME, [{'angle': 30}])]
+
+
+def test_score():
+    target = (10, 0, 0)
+    on_target = {'time': 5.0, 'x': 10, 'y': 0, 'heading': 0}
+    missed = {'time': 5.0, 'x': 9, 'y': 0, 'heading': 10}
+    unfinished = {'time': None, 'x': 10, 'y': 0, 'heading': 0}
+    assert tuner.score(on_target, target) == 5.0
+    assert tuner.score(on_target, target) < tuner.score(missed, target) < tuner.score(unfinished, target)
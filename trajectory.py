@@ -0,0 +1,234 @@
+import hashlib
+import json
+import math
+from array import array
+
+# Profiles are sampled every LOOP_PERIOD, so they can be followed by
+# stepping one index per loop
+from looptiming import LOOP_PERIOD
+
+# @TODO: Measure these on the practice field.
+# Speed (ft/s) the drivetrain reaches at full output
+MAX_VELOCITY = 10.0
+# Fastest (ft/s^2) we can accelerate without the wheels slipping or tipping
+MAX_ACCELERATION = 10.0
+# Profiles cruise a bit below the top speed so there is headroom left to
+# correct for a low battery.
+CRUISE_VELOCITY = 0.8 * MAX_VELOCITY
+
+# Feedforward gains used to turn a profile sample into a motor output
+KV = 1.0 / MAX_VELOCITY
+KA = 0.02
+
+
+class Profile:
+    """
+    A motion profile sampled every dt seconds. position, velocity and
+    acceleration are arrays of the same length, so following the profile is
+    just reading the next index each loop.
+    """
+    def __init__(self, position, velocity, acceleration, dt=LOOP_PERIOD):
+        self.position = position
+        self.velocity = velocity
+        self.acceleration = acceleration
+        self.dt = dt
+
+    def __len__(self):
+        return len(self.position)
+
+    @property
+    def duration(self):
+        return len(self) * self.dt
+
+    @property
+    def distance(self):
+        return self.position[-1] if len(self) > 0 else 0.0
+
+    def to_json(self):
+        return {
+            "dt": self.dt,
+            "position": list(self.position),
+            "velocity": list(self.velocity),
+            "acceleration": list(self.acceleration),
+        }
+
+    @staticmethod
+    def from_json(data):
+        return Profile(
+            array('d', data["position"]),
+            array('d', data["velocity"]),
+            array('d', data["acceleration"]),
+            data["dt"],
+        )
+
+
+def trapezoidal(distance, max_velocity=CRUISE_VELOCITY, max_acceleration=MAX_ACCELERATION, dt=LOOP_PERIOD):
+    """
+    Build the fastest profile that covers distance (which may be negative)
+    without going over max_velocity or max_acceleration. Short moves that
+    never reach max_velocity become a triangle instead of a trapezoid.
+    """
+    sign = 1 if distance >= 0 else -1
+    distance = abs(distance)
+    # Distance needed to get up to full speed and back down again
+    if max_velocity * max_velocity / max_acceleration > distance:
+        max_velocity = math.sqrt(distance * max_acceleration)
+    accel_time = max_velocity / max_acceleration
+    accel_distance = 0.5 * max_acceleration * accel_time * accel_time
+    cruise_time = (distance - 2 * accel_distance) / max_velocity if max_velocity > 0 else 0.0
+    total_time = 2 * accel_time + cruise_time
+
+    samples = int(math.ceil(total_time / dt))
+    position = array('d', [0.0]) * samples
+    velocity = array('d', [0.0]) * samples
+    acceleration = array('d', [0.0]) * samples
+    for i in range(samples):
+        t = min((i + 1) * dt, total_time)
+        if t < accel_time:
+            v = max_acceleration * t
+            p = 0.5 * max_acceleration * t * t
+            a = max_acceleration
+        elif t < accel_time + cruise_time:
+            v = max_velocity
+            p = accel_distance + max_velocity * (t - accel_time)
+            a = 0.0
+        else:
+            remaining = total_time - t
+            v = max_acceleration * remaining
+            p = distance - 0.5 * max_acceleration * remaining * remaining
+            a = -max_acceleration
+        position[i] = sign * p
+        velocity[i] = sign * v
+        acceleration[i] = sign * a
+    return Profile(position, velocity, acceleration, dt)
+
+
+def s_curve(distance, max_velocity=CRUISE_VELOCITY, max_acceleration=MAX_ACCELERATION,
+            jerk_time=0.2, dt=LOOP_PERIOD):
+    """
+    Like trapezoidal, but the acceleration ramps up over jerk_time seconds
+    instead of jumping, which is gentler on the drivetrain and keeps a tall
+    elevator from rocking. This is done by running the trapezoid's velocity
+    through a moving average, which keeps the same distance and makes the
+    profile jerk_time seconds longer.
+    """
+    base = trapezoidal(distance, max_velocity, max_acceleration, dt)
+    window = max(1, int(round(jerk_time / dt)))
+    samples = len(base) + window - 1
+    position = array('d', [0.0]) * samples
+    velocity = array('d', [0.0]) * samples
+    acceleration = array('d', [0.0]) * samples
+    running = 0.0
+    traveled = 0.0
+    previous = 0.0
+    for i in range(samples):
+        if i < len(base):
+            running += base.velocity[i]
+        if i >= window:
+            running -= base.velocity[i - window]
+        v = running / window
+        traveled += v * dt
+        velocity[i] = v
+        position[i] = traveled
+        acceleration[i] = (v - previous) / dt
+        previous = v
+    # The moving average keeps the area under the velocity curve, but the
+    # sampling can leave a tiny error; make sure we end exactly on target.
+    if samples > 0:
+        scale = base.distance / traveled if traveled != 0 else 0.0
+        for i in range(samples):
+            position[i] *= scale
+    return Profile(position, velocity, acceleration, dt)
+
+
+GENERATORS = {
+    "trapezoidal": trapezoidal,
+    "s_curve": s_curve,
+}
+
+
+def open_loop_distance(forward, duration):
+    """
+    How far the old Timed(ArcadeAutonomous(forward), duration) steps were
+    meant to drive, used as the starting point for the profile distances.
+    arcadeDrive squares its inputs, so forward=0.7 was really 49% output.
+    """
+    return forward * forward * MAX_VELOCITY * duration
+
+
+# The profiles used by the autonomous routines, as name: (generator, distance
+# in feet). The distances start out as what the hand tuned open loop steps
+# covered, and should be tuned on the practice field from there.
+PROFILE_SPECS = {
+    "center_first": ("s_curve", open_loop_distance(0.7, 1.5)),
+    "center_second": ("s_curve", open_loop_distance(0.7, 3)),
+    "center_last": ("s_curve", open_loop_distance(0.7, 2)),
+    "opposite_first": ("s_curve", open_loop_distance(0.7, 1.0)),
+    "opposite_second": ("s_curve", open_loop_distance(0.7, 1.0)),
+    "opposite_last": ("s_curve", open_loop_distance(0.3, 1.0)),
+    # The auto line is 10 feet from the alliance wall, and the whole robot
+    # has to be past it
+    "cross_line": ("s_curve", 13.0),
+}
+
+# Profiles that have been generated or loaded, by name
+profiles = {}
+
+
+def spec_hash(specs):
+    """
+    Hash of everything a set of profiles depends on, used to tell if a cache
+    file is out of date.
+    """
+    key = json.dumps([sorted(specs.items()), CRUISE_VELOCITY, MAX_ACCELERATION, LOOP_PERIOD],
+                     sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def generate(specs=PROFILE_SPECS):
+    generated = {}
+    for name, (kind, distance) in specs.items():
+        generated[name] = GENERATORS[kind](distance)
+    return generated
+
+
+def load(path=None, specs=PROFILE_SPECS):
+    """
+    Fill in profiles, either from the cache file at path or by generating
+    them. If they had to be generated and a path is given, they are saved
+    there for next time. Call this at startup so no profile is solved while
+    the robot is moving.
+    """
+    key = spec_hash(specs)
+    if path is not None:
+        try:
+            with open(path) as cache:
+                data = json.load(cache)
+            if data["key"] == key:
+                profiles.update((name, Profile.from_json(profile))
+                                for name, profile in data["profiles"].items())
+                return profiles
+        except (IOError, ValueError, KeyError) as e:
+            print("Could not load profile cache: {}".format(e))
+
+    profiles.update(generate(specs))
+    if path is not None:
+        try:
+            with open(path, 'w') as cache:
+                json.dump({
+                    "key": key,
+                    "profiles": {name: profiles[name].to_json() for name in specs},
+                }, cache)
+        except IOError as e:
+            print("Could not save profile cache: {}".format(e))
+    return profiles
+
+
+def get(name):
+    """
+    Returns the named profile, generating it if load hasn't been called.
+    """
+    if name not in profiles:
+        kind, distance = PROFILE_SPECS[name]
+        profiles[name] = GENERATORS[kind](distance)
+    return profiles[name]
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Searches for better autonomous routine parameters by running the routines
+in simulation (see simulation.py) over a grid or random sample of
+parameter values, and lists the best ones found.
+
+    python3 tuner.py center --grid first_angle=40:50:2.5 turn_speed=0.5:0.8:0.1
+    python3 tuner.py opposite --random 500 angle=80:100 turn_speed=0.4:0.8
+
+Each run is scored on how long the routine took plus how far from the
+target pose it finished. Parameters that aren't given keep the values in
+autonomous.py. Results are cached by a hash of the parameters (and of the
+code they were simulated with), so a repeated or overlapping sweep only
+simulates the new points.
+"""
+import argparse
+import hashlib
+import inspect
+import itertools
+import json
+import math
+import multiprocessing
+import os
+import random
+from collections import OrderedDict
+
+import autonomous
+import simulation
+from autonomous import AutonomousRoutine, Position
+
+# Routines are tuned for a switch on the left; the right is the mirror image
+ROUTINE_NAMES = {
+    'center': AutonomousRoutine.CENTER,
+    'same': AutonomousRoutine.SIDE_TO_SAME,
+    'opposite': AutonomousRoutine.SIDE_TO_OPPOSITE,
+}
+
+# @TODO: Measure these on the field. Where each routine should end up, as
+# (x, y, heading) from its starting pose, in feet and degrees like Odometry.
+# The routines turn positive (clockwise on the gyro) for a switch on the
+# left, so these are to the right of the start, with negative y.
+TARGETS = {
+    AutonomousRoutine.CENTER: (10.0, -4.5, 0.0),
+    AutonomousRoutine.SIDE_TO_SAME: (10.0, -1.5, 15.0),
+    AutonomousRoutine.SIDE_TO_OPPOSITE: (13.0, -13.0, 180.0),
+}
+
+# Seconds of score per foot and per degree of error in the final pose
+POSITION_WEIGHT = 2.0
+HEADING_WEIGHT = 0.05
+# Autonomous is 15 seconds, so a routine that doesn't finish by then is
+# scored as if it took twice that
+TIMEOUT = 15.0
+UNFINISHED_TIME = 2 * TIMEOUT
+
+# Points simulated together in one batch by each worker
+BATCH_SIZE = 32
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.tuner_cache.json')
+# Changing any of these changes the results, so they are part of the hash
+CODE_FILES = (
+    'autonomous.py', 'simulation.py', 'trajectory.py',
+    os.path.join('subsystems', 'elevator.py'), os.path.join('subsystems', 'grabber.py'),
+)
+
+
+def code_hash():
+    digest = hashlib.sha256()
+    for name in CODE_FILES:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def point_key(routine, point, code):
+    text = json.dumps([routine.name, sorted(point.items()), code])
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def defaults(routine):
+    """
+    Returns the tunable parameters of a routine and their current values.
+    """
+    signature = inspect.signature(autonomous.ROUTINES[routine])
+    names = list(signature.parameters)
+    return {name: signature.parameters[name].default for name in names[names.index('clock') + 1:]}
+
+
+def parse_range(text, tunable):
+    """
+    Parses name=low:high or name=low:high:step.
+    """
+    name, _, values = text.partition('=')
+    if name not in tunable:
+        raise argparse.ArgumentTypeError("{} is not one of {}".format(name, ', '.join(sorted(tunable))))
+    bounds = [float(value) for value in values.split(':')]
+    if len(bounds) not in (2, 3) or bounds[1] < bounds[0]:
+        raise argparse.ArgumentTypeError("{} should be low:high or low:high:step".format(text))
+    return name, bounds
+
+
+def grid(ranges):
+    axes = []
+    for name, bounds in ranges:
+        low, high, step = bounds if len(bounds) == 3 else bounds + [default_step(bounds)]
+        count = int(round((high - low) / step)) + 1
+        axes.append([(name, round(low + i * step, 6)) for i in range(count)])
+    return [dict(values) for values in itertools.product(*axes)]
+
+
+def default_step(bounds):
+    # Five values when no step is given
+    return (bounds[1] - bounds[0]) / 4 or 1.0
+
+
+def random_points(ranges, count, seed=None):
+    generator = random.Random(seed)
+    return [
+        {name: round(generator.uniform(bounds[0], bounds[1]), 6) for name, bounds in ranges}
+        for _ in range(count)
+    ]
+
+
+def evaluate(job):
+    """
+    Simulates a batch of parameter points for one routine, and returns the
+    result of each as a dict of finish time and final pose.
+    """
+    routine, points = job
+    function = autonomous.ROUTINES[routine]
+    sim = simulation.BatchSimulation(len(points))
+    routines = [sim.routine(i, function, Position.LEFT, **point) for i, point in enumerate(points)]
+    finished = sim.run(routines, timeout=TIMEOUT)
+    model = sim.model
+    return [
+        {
+            'time': None if math.isnan(finished[i]) else float(finished[i]),
+            'x': float(model.x[i]),
+            'y': float(model.y[i]),
+            'heading': float(model.heading[i]),
+        }
+        for i in range(len(points))
+    ]
+
+
+def score(result, target):
+    x, y, heading = target
+    time = result['time'] if result['time'] is not None else UNFINISHED_TIME
+    position_error = math.hypot(result['x'] - x, result['y'] - y)
+    heading_error = abs(result['heading'] - heading)
+    return time + POSITION_WEIGHT * position_error + HEADING_WEIGHT * heading_error
+
+
+def load_cache(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def save_cache(cache, path):
+    with open(path, 'w') as f:
+        json.dump(cache, f)
+
+
+def sweep(routine, points, cache, processes=None, batch_size=BATCH_SIZE):
+    """
+    Returns the result for each point, simulating only the ones that aren't
+    in cache, and adds the new ones to it.
+    """
+    code = code_hash()
+    keys = [point_key(routine, point, code) for point in points]
+    new = list(OrderedDict(
+        (key, point) for key, point in zip(keys, points) if key not in cache).items())
+    jobs = [
+        (routine, [point for _, point in new[i:i + batch_size]])
+        for i in range(0, len(new), batch_size)
+    ]
+    if processes == 1 or len(jobs) <= 1:
+        batches = [evaluate(job) for job in jobs]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            batches = pool.map(evaluate, jobs)
+    for (key, _), result in zip(new, itertools.chain.from_iterable(batches)):
+        cache[key] = result
+    return [cache[key] for key in keys]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('routine', choices=sorted(ROUTINE_NAMES))
+    parser.add_argument('ranges', nargs='+', help='name=low:high[:step] for each parameter to tune')
+    search = parser.add_mutually_exclusive_group()
+    search.add_argument('--grid', action='store_true', help='Try every combination (the default)')
+    search.add_argument('--random', type=int, metavar='N', help='Try N random points instead')
+    parser.add_argument('--seed', type=int, help='Seed for --random')
+    parser.add_argument('--target', help='x,y,heading to aim for instead of the built in one')
+    parser.add_argument('--processes', type=int, help='Worker processes, default one per CPU')
+    parser.add_argument('--cache', default=CACHE_PATH, help='Where to keep results between runs')
+    parser.add_argument('--top', type=int, default=10, help='How many of the best points to show')
+    args = parser.parse_args(argv)
+
+    routine = ROUTINE_NAMES[args.routine]
+    tunable = defaults(routine)
+    try:
+        ranges = [parse_range(text, tunable) for text in args.ranges]
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    target = tuple(float(v) for v in args.target.split(',')) if args.target else TARGETS[routine]
+
+    points = random_points(ranges, args.random, args.seed) if args.random else grid(ranges)
+    # The hand tuned values, for comparison
+    points.append({})
+
+    cache = load_cache(args.cache)
+    before = len(cache)
+    results = sweep(routine, points, cache, args.processes)
+    save_cache(cache, args.cache)
+    print("{} points, {} simulated, {} from the cache".format(
+        len(points), len(cache) - before, len(points) - (len(cache) - before)))
+
+    scored = sorted(zip(points, results), key=lambda item: score(item[1], target))
+    for point, result in scored[:args.top] + [item for item in scored if not item[0]]:
+        settings = dict(tunable, **point)
+        print("{:7.2f}  time {:>5}  pose ({:5.1f}, {:5.1f}, {:6.1f})  {}{}".format(
+            score(result, target),
+            '{:.2f}'.format(result['time']) if result['time'] is not None else '-',
+            result['x'], result['y'], result['heading'],
+            ' '.join('{}={}'.format(name, settings[name]) for name in sorted(settings)),
+            '  (current)' if not point else ''))
+
+
+if __name__ == '__main__':
+    main()